@@ -1,13 +1,31 @@
 import os
 import pickle
+import hashlib
 from sentence_transformers import SentenceTransformer
 import config
 from utils import extract_text
+from src.core.utils.embedcache import get_embed_cache
+
+# Cache key part for the scanner's inputs (filename + first 1000 chars of Smart Context)
+SCANNER_CHUNKING = "scanner/name+smart-context-1000"
 
 class DynamicScanner:
     def __init__(self):
         print("Initializing Scanner (Bi-Encoder)...")
         self.model = SentenceTransformer(config.BI_ENCODER_MODEL)
+        self.cache = get_embed_cache()
+
+    def _encode(self, text):
+        """Encodes one input, reusing the vector from the embedding cache when this exact text was seen before."""
+        if self.cache is None:
+            return self.model.encode(text)
+        text_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        cached = self.cache.get(text_hash, config.BI_ENCODER_MODEL, SCANNER_CHUNKING)
+        if cached is not None:
+            return cached[0]
+        emb = self.model.encode(text)
+        self.cache.put(text_hash, config.BI_ENCODER_MODEL, SCANNER_CHUNKING, [emb])
+        return emb
     
     def scan_directory(self, root_path):
         """
@@ -34,7 +52,7 @@ class DynamicScanner:
                         # Encode Filename + Content for maximum semantic signal
                         # Note: extract_text already limits to Smart Context (Header+Footer)
                         full_content = f"{fname}\n{text[:1000]}"
-                        emb = self.model.encode(full_content)
+                        emb = self._encode(full_content)
                         instances.append({
                             "path": rel_path,
                             "vector": emb,
@@ -42,7 +60,7 @@ class DynamicScanner:
                         })
             else:
                 # Handle empty folders with a virtual anchor
-                emb = self.model.encode(os.path.basename(dirpath))
+                emb = self._encode(os.path.basename(dirpath))
                 instances.append({
                     "path": rel_path,
                     "vector": emb,
@@ -52,6 +70,9 @@ class DynamicScanner:
         with open(config.INDEX_PATH, 'wb') as f:
             pickle.dump(instances, f)
         print(f"Index built. {len(instances)} vectors saved to {config.INDEX_PATH}")
+        if self.cache is not None:
+            session = self.cache.session
+            print(f"Embedding cache: {session['hits']} hit(s), {session['misses']} miss(es)")
 
 if __name__ == "__main__":
     scanner = DynamicScanner()
@@ -1,12 +1,16 @@
+import json
 import logging
+import os
+import time
 from pathlib import Path
 from typing import Dict, Optional
 
-from src.core.utils.paths import get_faiss_index_path, get_faiss_metadata_path
 from src.core.utils.logger import log_move, log_correction, get_latest_log_entry
 from src.core.utils.mover import move_file
-from src.core.utils.indexer import index_file
+from src.core.utils.indexer import upsert_file, relocate_file
+from src.core.utils.processor import process_file
 from src.core.utils.notifier import notify_file_sorted
+from src.core.utils.paths import get_data_dir
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)s | %(message)s")
@@ -25,8 +29,8 @@ def handle_sorted_file(sorted_data: Dict):
     # 2. Move the file to final folder
     new_path = Path(move_file(file_path, final_folder)).resolve()
 
-    # 3. Index the moved file
-    index_file(
+    # 3. Index the moved file (replaces any stale vectors stored for this path)
+    upsert_file(
         embeddings=embeddings,
         file_metadata={
             "file_path": str(new_path),
@@ -35,9 +39,9 @@ def handle_sorted_file(sorted_data: Dict):
             "parent_folder_path": str(final_folder),
             "file_type": new_path.suffix.lstrip(".").lower(),
             "content_hash": sorted_data.get("content_hash"),
-        },
-        faiss_index_path=get_faiss_index_path(),
-        metadata_store_path=get_faiss_metadata_path()
+            # What the per-file budget left out of a long document, if anything
+            **({"truncation": sorted_data["truncation"]} if sorted_data.get("truncation") else {}),
+        }
     )
 
     # 4. Notify the user
@@ -69,20 +73,26 @@ def handle_correction(file_path: str, corrected_folder: str):
     # 3. Move file
     new_path = Path(move_file(file_path, corrected_folder)).resolve()
 
-    # 4. Reindex with updated location, no embeddings
-    index_file(
-        embeddings=None,
-        file_metadata={
-            "file_path": str(new_path),
-            "file_name": new_path.stem,
-            "parent_folder": corrected_folder.name,
-            "parent_folder_path": str(corrected_folder),
-            "file_type": new_path.suffix.lstrip(".").lower(),
-            "content_hash": None
-        },
-        faiss_index_path=get_faiss_index_path(),
-        metadata_store_path=get_faiss_metadata_path()
+    # 4. Point the existing index entry at the new location; vectors are reused
+    file_metadata = {
+        "file_path": str(new_path),
+        "file_name": new_path.stem,
+        "parent_folder": corrected_folder.name,
+        "parent_folder_path": str(corrected_folder),
+        "file_type": new_path.suffix.lstrip(".").lower(),
+    }
+    relocated = relocate_file(
+        str(file_path),
+        file_metadata
     )
+    if not relocated:
+        # The file was never indexed (e.g. moved before the index existed); embed it once.
+        processed_data = process_file(new_path)
+        if processed_data.get("embeddings"):
+            upsert_file(
+                embeddings=processed_data["embeddings"],
+                file_metadata={**file_metadata, "content_hash": processed_data["content_hash"]},
+            )
 
     # 5. Notify user
     notify_file_sorted(
@@ -94,6 +104,40 @@ def handle_correction(file_path: str, corrected_folder: str):
     logger.info(f"[Actor] Correction applied and reindexed: {new_path.name}")
 
 
+# ─── Corrections Queued for the Watcher ─────────────────────────────────────
+# While the watcher is online it is the only process writing the index shards, so
+# other processes queue corrections here (one file each, written atomically) and
+# the watcher applies them on its next poll.
+def get_correction_queue_dir() -> Path:
+    return get_data_dir() / "corrections"
+
+
+def request_correction(file_path: str, corrected_folder: str) -> None:
+    queue_dir = get_correction_queue_dir()
+    queue_dir.mkdir(parents=True, exist_ok=True)
+    entry = queue_dir / f"{time.time_ns()}-{os.getpid()}.json"
+    tmp_path = entry.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps({"file_path": file_path, "corrected_folder": corrected_folder}), encoding="utf-8")
+    os.replace(tmp_path, entry)
+
+
+def apply_requested_corrections() -> int:
+    """Applies queued corrections in the order they were made; returns how many succeeded."""
+    queue_dir = get_correction_queue_dir()
+    if not queue_dir.is_dir():
+        return 0
+    applied = 0
+    for entry in sorted(queue_dir.glob("*.json")):
+        try:
+            request = json.loads(entry.read_text(encoding="utf-8"))
+            handle_correction(request["file_path"], request["corrected_folder"])
+            applied += 1
+        except Exception as e:
+            logger.error(f"[Actor] Queued correction {entry.name} failed: {repr(e)}")
+        entry.unlink(missing_ok=True)
+    return applied
+
+
 # ─── Entrypoint for Sorter ──────────────────────────────────────────────────
 def act_on_file(sorted_data: Dict):
     handle_sorted_file(sorted_data)
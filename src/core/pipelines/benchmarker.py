@@ -0,0 +1,476 @@
+# [benchmarker.py] — Index quality and latency reports on the local corpus
+
+import logging
+import re
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import faiss
+import numpy as np
+
+from src.core.utils.index_service import IndexService, get_index_service
+from src.core.utils.indexer import (
+    STORAGE_FLAT,
+    STORAGE_PQ,
+    STORAGE_SQ8,
+    TIER_HNSW,
+    TIER_IVF,
+    build_faiss_index,
+    file_id_of,
+    make_search_params,
+    new_faiss_index,
+)
+from src.core.utils.extractor import extractors_for, run_extractor
+from src.core.utils.paths import get_index_settings, get_organized_paths
+from src.core.utils.projection import PROJECTION_DIMS, fit_projection
+from src.core.utils.shards import get_sharded_index
+
+# --- Logger Setup ---
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)s | %(message)s")
+
+
+# --- Shared Helpers ---
+def _sample_queries(vectors: np.ndarray, sample_size: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(len(vectors), min(sample_size, len(vectors)), replace=False)
+    return np.ascontiguousarray(vectors[picks])
+
+
+def _recall_at_k(truth: np.ndarray, found: np.ndarray) -> float:
+    hits = sum(len(set(t[t != -1]) & set(f[f != -1])) for t, f in zip(truth, found))
+    total = sum(int((t != -1).sum()) for t in truth)
+    return hits / total if total else 1.0
+
+
+def _timed_search(index: faiss.Index, queries: np.ndarray, top_k: int, params=None):
+    start = time.perf_counter()
+    _, I = index.search(queries, top_k, params=params)
+    elapsed_ms = (time.perf_counter() - start) * 1000.0
+    return I, elapsed_ms / max(len(queries), 1)
+
+
+def _print_rows(title: str, rows: List[Dict], columns: Sequence[str]) -> None:
+    print(f"\n{title}")
+    print("  " + " | ".join(f"{c:>14}" for c in columns))
+    for row in rows:
+        cells = []
+        for c in columns:
+            value = row.get(c, "")
+            cells.append(f"{value:>14.4f}" if isinstance(value, float) else f"{str(value):>14}")
+        print("  " + " | ".join(cells))
+
+
+def _sample_texts(folders: Optional[Sequence[str]], sample_size: int) -> List[str]:
+    # Extracted text of up to `sample_size` files of the organized roots (or `folders`).
+    from src.core.utils.processor import _extract_content
+    files = sorted(p for folder in (folders or get_organized_paths()) for p in Path(folder).rglob("*") if p.is_file())
+    texts = [_extract_content(p, p.suffix.lower().lstrip(".")) for p in files[:sample_size]]
+    return [t for t in texts if t.strip()]
+
+
+# --- Recall vs. Latency ---
+def recall_report(
+    sample_size: int = 200,
+    top_k: int = 10,
+    ef_values: Sequence[int] = (16, 32, 64, 128, 256),
+    nprobe_values: Sequence[int] = (1, 4, 8, 16, 32, 64),
+    service: Optional[IndexService] = None,
+) -> List[Dict]:
+    """
+    Compares HNSW and IVF indexes built from the live vectors against exact search.
+    Queries are sampled from the corpus itself; recall is measured at `top_k`.
+    """
+    ids, vectors = (service or get_index_service()).export_vectors()
+    if not len(ids):
+        logger.warning("[Benchmarker] Index is empty; nothing to measure.")
+        return []
+
+    dim = vectors.shape[1]
+    queries = _sample_queries(vectors, sample_size)
+    settings = get_index_settings()
+
+    exact = new_faiss_index(dim)
+    exact.add_with_ids(vectors, ids)
+    truth, exact_ms = _timed_search(exact, queries, top_k)
+    rows = [{"index": "flat", "param": "-", "recall": 1.0, "ms_per_query": exact_ms, "build_s": 0.0}]
+
+    sweeps = (
+        (TIER_HNSW, "index_hnsw_ef_search", "efSearch", ef_values),
+        (TIER_IVF, "index_ivf_nprobe", "nprobe", nprobe_values),
+    )
+    for tier, param_name, label, values in sweeps:
+        start = time.perf_counter()
+        candidate = build_faiss_index(tier, dim, vectors, ids, settings)
+        build_s = time.perf_counter() - start
+        for value in values:
+            params = make_search_params(candidate, {**settings, param_name: value})
+            found, ms = _timed_search(candidate, queries, top_k, params)
+            rows.append({
+                "index": tier,
+                "param": f"{label}={value}",
+                "recall": _recall_at_k(truth, found),
+                "ms_per_query": ms,
+                "build_s": build_s,
+            })
+
+    _print_rows(f"Recall@{top_k} vs. latency ({len(ids)} vectors, {len(queries)} queries)",
+                rows, ["index", "param", "recall", "ms_per_query", "build_s"])
+    return rows
+
+
+# --- Compression Savings vs. Quality ---
+def _top1_file_agreement(truth: np.ndarray, found: np.ndarray) -> float:
+    pairs = [(t[0], f[0]) for t, f in zip(truth, found) if t[0] != -1]
+    if not pairs:
+        return 1.0
+    return sum(f != -1 and file_id_of(t) == file_id_of(f) for t, f in pairs) / len(pairs)
+
+
+def compression_report(sample_size: int = 200, top_k: int = 10, service: Optional[IndexService] = None) -> List[Dict]:
+    """
+    Builds the current tier with flat, SQ8 and PQ vector storage and reports the
+    serialized size, latency, recall@k against the flat build, and how often the
+    top-1 hit still lands in the same file (which is what sorting acts on).
+    """
+    service = service or get_index_service()
+    ids, vectors = service.export_vectors()
+    if not len(ids):
+        logger.warning("[Benchmarker] Index is empty; nothing to measure.")
+        return []
+
+    tier, _ = service.layout()
+    dim = vectors.shape[1]
+    queries = _sample_queries(vectors, sample_size)
+    settings = get_index_settings()
+
+    rows, truth, flat_bytes = [], None, 0
+    for storage in (STORAGE_FLAT, STORAGE_SQ8, STORAGE_PQ):
+        start = time.perf_counter()
+        try:
+            candidate = build_faiss_index(tier, dim, vectors, ids, settings, storage)
+        except Exception as e:
+            logger.warning(f"[Benchmarker] Could not build {tier}/{storage}: {repr(e)}")
+            continue
+        build_s = time.perf_counter() - start
+        size = int(faiss.serialize_index(candidate).nbytes)
+        found, ms = _timed_search(candidate, queries, top_k, make_search_params(candidate, settings))
+        if storage == STORAGE_FLAT:
+            truth, flat_bytes = found, size
+        rows.append({
+            "storage": storage,
+            "size_mb": size / (1024 * 1024),
+            "saved": 1.0 - size / flat_bytes if flat_bytes else 0.0,
+            "recall": _recall_at_k(truth, found) if truth is not None else 0.0,
+            "top1_file": _top1_file_agreement(truth, found) if truth is not None else 0.0,
+            "ms_per_query": ms,
+            "build_s": build_s,
+        })
+
+    _print_rows(f"{tier} storage: size vs. quality ({len(ids)} vectors, {len(queries)} queries, k={top_k})",
+                rows, ["storage", "size_mb", "saved", "recall", "top1_file", "ms_per_query", "build_s"])
+    return rows
+
+
+# --- Folder Routing vs. Full Search ---
+def _top_folder(matches: List[Dict]) -> str:
+    scores: Dict[str, float] = {}
+    for m in matches:
+        folder = m.get("parent_folder_path")
+        scores[folder] = max(scores.get(folder, -1.0), 1.0 - m["distance"])
+    return max(scores, key=scores.get) if scores else ""
+
+
+def routing_report(
+    sample_size: int = 100,
+    top_k: int = 10,
+    top_folders: Sequence[int] = (2, 4, 8, 16, 32),
+    service: Optional[IndexService] = None,
+) -> List[Dict]:
+    """
+    Compares centroid-routed search with a full chunk search. Each query is one
+    indexed file's chunks; agreement is whether both pick the same best folder.
+    """
+    service = service or get_index_service()
+    ids, vectors = service.export_vectors()
+    if not len(ids):
+        logger.warning("[Benchmarker] Index is empty; nothing to measure.")
+        return []
+
+    file_ids = np.array([file_id_of(v) for v in ids])
+    rng = np.random.default_rng(0)
+    picks = rng.choice(np.unique(file_ids), min(sample_size, len(np.unique(file_ids))), replace=False)
+    queries = [vectors[file_ids == f] for f in picks]
+
+    def run(top_m: int):
+        start = time.perf_counter()
+        folders = [_top_folder(service.search(q, top_k, top_folders=top_m)) for q in queries]
+        return folders, (time.perf_counter() - start) * 1000.0 / len(queries)
+
+    truth, full_ms = run(0)
+    rows = [{"search": "full", "top_m": "-", "agreement": 1.0, "ms_per_file": full_ms}]
+    for m in top_folders:
+        found, ms = run(m)
+        rows.append({
+            "search": "routed",
+            "top_m": m,
+            "agreement": sum(a == b for a, b in zip(truth, found)) / len(truth),
+            "ms_per_file": ms,
+        })
+
+    _print_rows(f"Folder routing ({len(ids)} vectors, {len(queries)} files, k={top_k})",
+                rows, ["search", "top_m", "agreement", "ms_per_file"])
+    return rows
+
+
+# --- Reduced Dimensions vs. Full ---
+def projection_report(
+    sample_size: int = 200,
+    top_k: int = 10,
+    dims: Sequence[int] = PROJECTION_DIMS,
+    service: Optional[IndexService] = None,
+) -> List[Dict]:
+    """
+    Fits a PCA projection per size on the index's own vectors and reports how much of
+    the exact full-dimension top-k each reduced index still returns (overlap), how
+    often the top-1 hit stays in the same file, memory per vector and latency.
+    """
+    service = service or get_index_service()
+    if service.projection_tag is not None:
+        logger.warning(f"[Benchmarker] Index is already reduced ({service.projection_tag}); "
+                       "overlap needs full-dimension vectors.")
+        return []
+    ids, vectors = service.export_vectors()
+    if not len(ids):
+        logger.warning("[Benchmarker] Index is empty; nothing to measure.")
+        return []
+
+    queries = _sample_queries(vectors, sample_size)
+    full = new_faiss_index(vectors.shape[1])
+    full.add_with_ids(vectors, ids)
+    truth, full_ms = _timed_search(full, queries, top_k)
+    rows = [{"dim": vectors.shape[1], "overlap": 1.0, "top1_file": 1.0,
+             "bytes_per_vec": vectors.shape[1] * 4, "ms_per_query": full_ms}]
+    for dim in dims:
+        try:
+            projection = fit_projection(vectors, dim)
+        except ValueError as e:
+            logger.warning(f"[Benchmarker] Skipping {dim} dims: {e}")
+            continue
+        reduced = new_faiss_index(dim)
+        reduced.add_with_ids(projection.apply(vectors), ids)
+        found, ms = _timed_search(reduced, projection.apply(queries), top_k)
+        rows.append({
+            "dim": dim,
+            "overlap": _recall_at_k(truth, found),
+            "top1_file": _top1_file_agreement(truth, found),
+            "bytes_per_vec": dim * 4,
+            "ms_per_query": ms,
+        })
+
+    _print_rows(f"PCA projection vs. full dimension ({len(ids)} vectors, {len(queries)} queries, k={top_k})",
+                rows, ["dim", "overlap", "top1_file", "bytes_per_vec", "ms_per_query"])
+    return rows
+
+
+# --- Extraction Backends ---
+def _char_agreement(text: str, reference: str) -> float:
+    """Share of non-whitespace characters two extractions have in common, ignoring order and layout."""
+    a, b = Counter("".join(text.split())), Counter("".join(reference.split()))
+    total = max(sum(a.values()), sum(b.values()))
+    return sum((a & b).values()) / total if total else 1.0
+
+
+def extraction_report(folders: Optional[Sequence[str]] = None, sample_size: int = 50,
+                      reference: str = "pdfplumber") -> List[Dict]:
+    """
+    Pages per second and character agreement with `reference` (the extractor the
+    index was originally built with) for every PDF extractor, over up to
+    `sample_size` PDFs from the organized roots or `folders`. Every page is read.
+    """
+    pdfs = sorted(p for folder in (folders or get_organized_paths()) for p in Path(folder).rglob("*.pdf"))[:sample_size]
+    if not pdfs:
+        print("\nNo PDFs found to benchmark.")
+        return []
+
+    outputs: Dict[str, Dict[Path, str]] = {}
+    rows = []
+    for name in extractors_for("pdf", include_unavailable=True):
+        row = {"backend": name, "files": 0, "failed": 0, "pages": 0, "pages_per_s": 0.0, "chars": 0}
+        outputs[name], seconds = {}, 0.0
+        for pdf in pdfs:
+            start = time.perf_counter()
+            try:
+                result = run_extractor(pdf, "pdf", name)
+            except ImportError:
+                row["failed"] = "not installed"
+                break
+            except Exception as e:
+                logger.warning(f"[Benchmarker] {name} failed on {pdf.name}: {repr(e)}")
+                row["failed"] += 1
+                continue
+            seconds += time.perf_counter() - start
+            outputs[name][pdf] = result.text
+            row["files"] += 1
+            row["pages"] += result.pages_read
+            row["chars"] += len(result.text)
+        row["pages_per_s"] = row["pages"] / seconds if seconds else 0.0
+        rows.append(row)
+
+    baseline = outputs.get(reference, {})
+    for row in rows:
+        shared = [p for p in outputs[row["backend"]] if p in baseline]
+        row["agreement"] = (sum(_char_agreement(outputs[row["backend"]][p], baseline[p]) for p in shared) / len(shared)
+                            if shared else "-")
+
+    _print_rows(f"PDF extractors ({len(pdfs)} file(s), agreement vs. {reference})", rows,
+                ["backend", "files", "failed", "pages", "pages_per_s", "chars", "agreement"])
+    return rows
+
+
+# --- Text Cleaning ---
+def _regex_clean(text: str, stop) -> str:
+    # The cleaning path _clean_text replaced: regex substitution, then a Python-level filter.
+    text = re.sub(r"[^\w\s]", " ", text.lower())
+    return " ".join([w for w in text.split() if w not in stop])
+
+
+def cleaning_report(folders: Optional[Sequence[str]] = None, sample_size: int = 200, repeat: int = 3) -> List[Dict]:
+    """
+    Throughput of the processor's text cleaning against the regex implementation it
+    replaced, on text extracted from up to `sample_size` files of the organized roots
+    (or `folders`), and whether both produce identical output.
+    """
+    from src.core.utils.processor import _clean_text, _stopwords
+    texts = _sample_texts(folders, sample_size)
+    if not texts:
+        print("\nNo text found to benchmark.")
+        return []
+    stop = _stopwords()
+    megabytes = sum(len(t.encode("utf-8")) for t in texts) / 1e6
+    implementations = {"regex": lambda t: _regex_clean(t, stop), "translate": _clean_text}
+
+    rows, outputs = [], {}
+    for name, clean in implementations.items():
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            outputs[name] = [clean(t) for t in texts]
+            best = min(best, time.perf_counter() - start)
+        rows.append({"cleaner": name, "mb": megabytes, "seconds": best, "mb_per_s": megabytes / best if best else 0.0})
+    for row in rows:
+        row["identical"] = outputs[row["cleaner"]] == outputs["regex"]
+
+    _print_rows(f"Text cleaning ({len(texts)} file(s), best of {repeat})", rows,
+                ["cleaner", "mb", "seconds", "mb_per_s", "identical"])
+    return rows
+
+
+# --- Chunking ---
+def chunking_report(folders: Optional[Sequence[str]] = None, sample_size: int = 200,
+                    model_name: Optional[str] = None) -> List[Dict]:
+    """
+    Word-count chunks (CHUNK_WORDS / CHUNK_OVERLAP) vs. token-sized chunks for the
+    model's tokenizer: tokens tokenized, tokens wasted beyond max_seq_length, and the
+    share of words that reach the model in at least one chunk.
+    """
+    from src.core.utils.paths import get_chunking_settings
+    from src.core.utils.processor import (CHUNK_OVERLAP, CHUNK_WORDS, _clean_text, _load_tokenizer,
+                                          _token_windows, _word_token_counts, get_model_name)
+    model_name = model_name or get_model_name()
+    try:
+        tokenizer, max_seq_length = _load_tokenizer(model_name)
+    except Exception as e:
+        print(f"\nNo local tokenizer for {model_name}: {repr(e)}")
+        return []
+    texts = [t for t in (_clean_text(t) for t in _sample_texts(folders, sample_size)) if t]
+    if not texts:
+        print("\nNo text found to benchmark.")
+        return []
+    special = tokenizer.num_special_tokens_to_add()
+    size = max(1, max_seq_length - special)
+    overlap = int(size * float(get_chunking_settings()["chunk_overlap_ratio"]))
+
+    totals = {name: Counter() for name in ("words", "tokens")}
+    for text in texts:
+        counts = _word_token_counts(text.split(), tokenizer)
+        windows = {
+            "words": [(s, min(s + CHUNK_WORDS, len(counts))) for s in range(0, len(counts), CHUNK_WORDS - CHUNK_OVERLAP)],
+            "tokens": _token_windows(counts, size, overlap),
+        }
+        for name, spans in windows.items():
+            reached = bytearray(len(counts))
+            for start, end in spans:
+                used = special
+                for i in range(start, end):
+                    used += counts[i]
+                    if used > max_seq_length:
+                        break
+                    reached[i] = 1
+                tokens = special + sum(counts[start:end])
+                totals[name].update(chunks=1, tokens=tokens, wasted=max(0, tokens - max_seq_length))
+            totals[name].update(words=len(counts), reached=sum(reached))
+
+    rows = []
+    for name, total in totals.items():
+        rows.append({"chunker": name, "chunks": total["chunks"], "tokens": total["tokens"], "wasted": total["wasted"],
+                     "wasted_pct": 100.0 * total["wasted"] / total["tokens"] if total["tokens"] else 0.0,
+                     "coverage": total["reached"] / total["words"] if total["words"] else 0.0})
+    _print_rows(f"Chunking for {model_name} ({len(texts)} file(s), max_seq_length {max_seq_length})", rows,
+                ["chunker", "chunks", "tokens", "wasted", "wasted_pct", "coverage"])
+    return rows
+
+
+# --- CLI Entrypoint ---
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="SortedPC index benchmarks.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    recall = sub.add_parser("recall", help="ANN recall vs. latency against the exact index.")
+    recall.add_argument("--sample", type=int, default=200, help="Number of query vectors to sample.")
+    recall.add_argument("--k", type=int, default=10, help="Neighbours per query.")
+
+    compression = sub.add_parser("compression", help="Flat vs. SQ8 vs. PQ storage size and accuracy.")
+    compression.add_argument("--sample", type=int, default=200, help="Number of query vectors to sample.")
+    compression.add_argument("--k", type=int, default=10, help="Neighbours per query.")
+
+    routing = sub.add_parser("routing", help="Folder-centroid routing vs. full chunk search.")
+    routing.add_argument("--sample", type=int, default=100, help="Number of indexed files to use as queries.")
+    routing.add_argument("--k", type=int, default=10, help="Neighbours per query chunk.")
+
+    projection = sub.add_parser("projection", help="Top-k overlap of PCA-reduced indexes with the full one.")
+    projection.add_argument("--sample", type=int, default=200, help="Number of query vectors to sample.")
+    projection.add_argument("--k", type=int, default=10, help="Neighbours per query.")
+
+    extraction = sub.add_parser("extract", help="PDF extractor speed (pages/s) and text agreement.")
+    extraction.add_argument("--folder", action="append", help="Folder of PDFs (repeatable; default: organized roots).")
+    extraction.add_argument("--sample", type=int, default=50, help="Number of PDFs to extract.")
+    extraction.add_argument("--reference", default="pdfplumber", help="Extractor the others are compared with.")
+
+    cleaning = sub.add_parser("clean", help="Text cleaning throughput vs. the former regex implementation.")
+    cleaning.add_argument("--folder", action="append", help="Folder of documents (repeatable; default: organized roots).")
+    cleaning.add_argument("--sample", type=int, default=200, help="Number of files to extract text from.")
+
+    chunking = sub.add_parser("chunk", help="Tokens wasted past max_seq_length by word vs. token chunking.")
+    chunking.add_argument("--folder", action="append", help="Folder of documents (repeatable; default: organized roots).")
+    chunking.add_argument("--sample", type=int, default=200, help="Number of files to extract text from.")
+    chunking.add_argument("--model", help="Model whose tokenizer is used (default: the active model).")
+
+    args = parser.parse_args()
+    if args.command == "extract":
+        extraction_report(args.folder, sample_size=args.sample, reference=args.reference)
+        raise SystemExit(0)
+    if args.command == "clean":
+        cleaning_report(args.folder, sample_size=args.sample)
+        raise SystemExit(0)
+    if args.command == "chunk":
+        chunking_report(args.folder, sample_size=args.sample, model_name=args.model)
+        raise SystemExit(0)
+    reports = {"recall": recall_report, "compression": compression_report, "routing": routing_report,
+               "projection": projection_report}
+    for root, shard in get_sharded_index().load().shards():
+        print(f"\n=== Shard: {root or 'default'} ===")
+        reports[args.command](sample_size=args.sample, top_k=args.k, service=shard)
@@ -2,16 +2,23 @@
 
 import json
 import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
-from typing import List
+from typing import Dict, List, Optional, Tuple
 
 # The builder now imports the single master function from the processor
-from src.core.utils.processor import process_file
-from src.core.utils.indexer import index_file
+from src.core.utils.processor import embed_prepared, prepare_file, process_file
+from src.core.utils.embedcache import log_stats, session_counts
+from src.core.utils.indexer import upsert_file
+from src.core.utils.index_service import get_index_service, release_index_service
+from src.core.utils.shards import get_sharded_index, new_version_dir, publish_version, version_files
 from src.core.utils.paths import (
+    get_builder_settings,
     get_config_file,
-    get_faiss_index_path,
-    get_faiss_metadata_path,
     get_organized_paths,
 )
 
@@ -19,6 +26,10 @@ from src.core.utils.paths import (
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)s | %(message)s")
 
+# Workers are spawned, not forked: the parent may already hold the model and index threads.
+_MP_START_METHOD = "spawn"
+_TASKS_PER_WORKER = 4  # files queued per worker, so workers never idle while results are embedded
+
 
 # --- Internal Helpers ---
 def is_valid_file(file_path: Path) -> bool:
@@ -41,12 +52,167 @@ def update_config(updates: dict) -> None:
     path = get_config_file()
     config = read_config()
     config.update(updates)
-    with path.open("w", encoding="utf-8") as f:
+    # Replace the file in one step: other processes poll it (e.g. for the active model).
+    tmp_path = path.with_name(path.name + ".tmp")
+    with tmp_path.open("w", encoding="utf-8") as f:
         json.dump(config, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+class _Progress:
+    """Logs how far a folder build got, at most every `interval` seconds."""
+
+    def __init__(self, label: str, total: int, interval: float):
+        self.label, self.total, self.interval = label, total, interval
+        self.done = self.failed = 0
+        self.started = self._logged = time.monotonic()
+
+    def advance(self, ok: bool) -> None:
+        self.done += 1
+        self.failed += not ok
+        now = time.monotonic()
+        if now - self._logged >= self.interval or self.done == self.total:
+            self._logged = now
+            rate = self.done / max(now - self.started, 1e-6)
+            eta = (self.total - self.done) / rate if rate else 0.0
+            logger.info(f"[Builder] {self.label}: {self.done}/{self.total} file(s) "
+                        f"({100.0 * self.done / max(self.total, 1):.1f}%), {self.failed} failed, "
+                        f"{rate:.1f} files/s, ETA {eta / 60:.1f} min")
 
 
 # --- Core Builder Logic ---
-def process_folder(folder_path: str) -> None:
+def _index_processed(file_path: Path, processed_data: Dict, index_files: Optional[Tuple[Path, Path]]) -> bool:
+    """Upserts one processed file; without explicit files it is routed to its root's shard."""
+    index_path, metadata_path = index_files or (None, None)
+
+    # Check if processing was successful and yielded embeddings
+    if not processed_data or not processed_data.get("embeddings"):
+        logger.warning(f"[Builder] Processing failed or yielded no embeddings for: {file_path.name}")
+        return False
+
+    # Pass the processed data directly to the indexer
+    file_id = upsert_file(
+        embeddings=processed_data["embeddings"],
+        file_metadata={
+            "file_path": str(Path(file_path).resolve()),
+            "file_name": processed_data["file_name"],
+            "parent_folder": processed_data["parent_folder"],
+            "parent_folder_path": processed_data["parent_folder_path"],
+            "file_type": processed_data["file_type"],
+            "content_hash": processed_data["content_hash"],
+            # What the per-file budget left out of a long document, if anything
+            **({"truncation": processed_data["truncation"]} if processed_data.get("truncation") else {}),
+        },
+        faiss_index_path=index_path,
+        metadata_store_path=metadata_path,
+    )
+    return file_id is not None
+
+
+def index_single_file(file_path: Path, index_files: Optional[Tuple[Path, Path]] = None) -> bool:
+    """Extracts, embeds and upserts one file. Without explicit files it is routed to its root's shard."""
+    # Single call to the processor replaces the old multi-step process
+    return _index_processed(file_path, process_file(file_path), index_files)
+
+
+def _worker_count(num_files: int) -> int:
+    settings = get_builder_settings()
+    if num_files < int(settings["builder_parallel_min_files"]):
+        return 1
+    workers = int(settings["builder_workers"]) or max(1, (os.cpu_count() or 1) - 1)
+    return min(workers, num_files)
+
+
+def _process_serially(files: List[Path], index_files: Optional[Tuple[Path, Path]], progress: _Progress) -> None:
+    for file_path in files:
+        try:
+            logger.info(f"[Builder] Found: {file_path.name}")
+            progress.advance(index_single_file(file_path, index_files))
+        except Exception as e:
+            logger.warning(f"[Builder] Failed to process {file_path.name}: {repr(e)}")
+            progress.advance(False)
+
+
+def _process_in_pool(files: List[Path], index_files: Optional[Tuple[Path, Path]], workers: int, window: int,
+                     progress: _Progress) -> Tuple[List[Path], List[Path]]:
+    """
+    Extraction, cleaning and chunking run in `workers` processes, with up to `window`
+    files queued; their results stream back to this thread, which embeds several
+    files per forward pass and is the only writer to the index.
+
+    If a worker dies outright, returns the files not yet submitted and those that
+    were in flight when it did; otherwise two empty lists.
+    """
+    batch_chunks = int(get_builder_settings()["builder_encode_batch_chunks"])
+    batch: List[Dict] = []
+    queued = iter(files)
+    pending: Dict[Future, Path] = {}
+
+    def flush() -> None:
+        for processed in embed_prepared(batch):
+            file_path = Path(processed["file_path"])
+            try:
+                progress.advance(_index_processed(file_path, processed, index_files))
+            except Exception as e:
+                logger.warning(f"[Builder] Failed to index {file_path.name}: {repr(e)}")
+                progress.advance(False)
+        batch.clear()
+
+    context = multiprocessing.get_context(_MP_START_METHOD)
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            def refill() -> None:
+                while len(pending) < window:
+                    file_path = next(queued, None)
+                    if file_path is None:
+                        return
+                    pending[pool.submit(prepare_file, file_path)] = file_path
+
+            refill()
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        prepared = future.result()
+                    except BrokenProcessPool:
+                        raise
+                    except Exception as e:
+                        # One unreadable file never stops the build.
+                        logger.warning(f"[Builder] Failed to process {pending[future].name}: {repr(e)}")
+                        prepared = None
+                    file_path = pending.pop(future)
+                    if not prepared or not prepared["chunks"]:
+                        if prepared is not None:
+                            logger.warning(f"[Builder] Processing failed or yielded no embeddings for: {file_path.name}")
+                        progress.advance(False)
+                        continue
+                    batch.append(prepared)
+                    if sum(len(p["chunks"]) for p in batch) >= batch_chunks:
+                        flush()
+                refill()
+            flush()
+    except BrokenProcessPool:
+        flush()
+        return list(queued), list(pending.values())
+    return [], []
+
+
+def _process_with_pools(files: List[Path], index_files: Optional[Tuple[Path, Path]], workers: int,
+                        progress: _Progress) -> None:
+    queued = files
+    while queued:
+        queued, suspects = _process_in_pool(queued, index_files, workers, workers * _TASKS_PER_WORKER, progress)
+        if suspects:
+            logger.error(f"[Builder] An extraction worker died; retrying {len(suspects)} file(s) one at a time.")
+        while suspects:
+            # One file in flight at a time pins down the file that kills the interpreter.
+            suspects, culprit = _process_in_pool(suspects, index_files, 1, 1, progress)
+            for file_path in culprit:
+                logger.error(f"[Builder] Skipping {file_path.name}: it crashes the extractor.")
+                progress.advance(False)
+
+
+def process_folder(folder_path: str, index_files: Optional[Tuple[Path, Path]] = None) -> None:
     folder = Path(folder_path).resolve()
     if not folder.exists() or not folder.is_dir():
         logger.warning(f"[Builder] Skipping invalid directory: {folder}")
@@ -54,40 +220,54 @@ def process_folder(folder_path: str) -> None:
 
     logger.info(f"[Builder] Processing folder: {folder}")
 
-    for file_path in folder.rglob("*"):
-        if not is_valid_file(file_path):
-            continue
+    files = [file_path for file_path in folder.rglob("*") if is_valid_file(file_path)]
+    progress = _Progress(folder.name, len(files), float(get_builder_settings()["builder_progress_seconds"]))
+    workers = _worker_count(len(files))
+    if workers > 1:
+        logger.info(f"[Builder] Extracting {len(files)} file(s) with {workers} worker process(es)")
+        _process_with_pools(files, index_files, workers, progress)
+    else:
+        _process_serially(files, index_files, progress)
 
-        try:
-            logger.info(f"[Builder] Found: {file_path.name}")
-            
-            # --- MODIFIED BLOCK ---
-            # Single call to the processor replaces the old multi-step process
-            processed_data = process_file(file_path)
-
-            # Check if processing was successful and yielded embeddings
-            if not processed_data or not processed_data.get("embeddings"):
-                logger.warning(f"[Builder] Processing failed or yielded no embeddings for: {file_path.name}")
-                continue
-
-            # Pass the processed data directly to the indexer
-            index_file(
-                embeddings=processed_data["embeddings"],
-                file_metadata={
-                    "file_path": str(file_path.resolve()),
-                    "file_name": processed_data["file_name"],
-                    "parent_folder": processed_data["parent_folder"],
-                    "parent_folder_path": processed_data["parent_folder_path"],
-                    "file_type": processed_data["file_type"],
-                    "content_hash": processed_data["content_hash"],
-                },
-                faiss_index_path=get_faiss_index_path(),
-                metadata_store_path=get_faiss_metadata_path(),
-            )
-            # --- END MODIFIED BLOCK ---
 
-        except Exception as e:
-            logger.warning(f"[Builder] Failed to process {file_path.name}: {repr(e)}")
+def build_shard(root: str) -> None:
+    """
+    Rebuilds one organized root's shard into a new version directory, then flips the
+    shard's CURRENT pointer to it. The live version keeps serving (and indexing)
+    meanwhile; processes swap on their next refresh and replay what they indexed.
+    """
+    started = time.time()
+    version_dir = new_version_dir(root)
+    index_files = version_files(version_dir)
+    get_index_service(*index_files).set_value("rebuild_started_at", started)
+
+    process_folder(root, index_files)
+
+    # Checkpoint and close the new version before it is published
+    release_index_service(*index_files)
+    publish_version(root, version_dir)
+    get_sharded_index().refresh()
+
+
+def reproject_shard(root: str) -> None:
+    """
+    Rebuilds one root's shard into a new version in the active projection's space
+    from the vectors it already holds, so no file is re-extracted or re-embedded.
+    Only shards that still hold full-dimension vectors can be reprojected.
+    """
+    sharded = get_sharded_index().load()
+    started = time.time()
+    version_dir = new_version_dir(root)
+    index_files = version_files(version_dir)
+    target = get_index_service(*index_files)
+    target.set_value("rebuild_started_at", started)
+
+    copied = sharded.copy_shard(root, target)
+    logger.info(f"[Builder] Reprojected {copied} file(s) of {root} into {target.projection_tag or 'full dim'}")
+
+    release_index_service(*index_files)
+    publish_version(root, version_dir)
+    sharded.refresh()
 
 
 def build_from_paths(paths: List[str]) -> None:
@@ -97,11 +277,14 @@ def build_from_paths(paths: List[str]) -> None:
 
     logger.info("[Builder] Starting full index rebuild...")
     update_config({"builder_busy": True})
+    cache_counts = session_counts()
 
+    # Unchanged files are served from the embedding cache (see process_file).
     for folder in paths:
-        process_folder(folder)
+        build_shard(folder)
 
     update_config({"builder_busy": False, "faiss_built": True})
+    log_stats("Builder", since=cache_counts)
     logger.info("[Builder] Index build complete.")
 
 
@@ -0,0 +1,222 @@
+# [bundler.py] — Portable index bundles: export on one machine, import on another
+
+import io
+import json
+import logging
+import tarfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from src.core.pipelines.builder import update_config
+from src.core.utils.metastore import MetadataStore
+from src.core.utils.paths import (
+    get_organized_paths,
+    get_projections_dir,
+    get_watch_paths,
+    normalize_path,
+    save_paths,
+)
+from src.core.utils.processor import get_embedding_dim, get_model_name
+from src.core.utils.projection import projection_path
+from src.core.utils.shards import DEFAULT_SHARD, get_sharded_index, new_version_dir, publish_version, version_files
+
+# --- Logger Setup ---
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)s | %(message)s")
+
+# --- Bundle Layout ---
+# manifest.json                  model, dimension and one entry per root shard
+# shards/NNN/index.faiss         the shard's snapshot, exactly as served
+# shards/NNN/files.json          {file_id: metadata}, paths relative to the root
+# projections/<tag>.npz          PCA projections the shards were reduced with
+BUNDLE_FORMAT = 1
+_PATH_KEYS = ("file_path", "parent_folder_path")
+
+
+# --- Path Rebasing ---
+def _to_relative(meta: Dict[str, Any], root: str) -> Optional[Dict[str, Any]]:
+    meta = dict(meta)
+    for key in _PATH_KEYS:
+        if meta.get(key):
+            try:
+                meta[key] = Path(meta[key]).relative_to(root).as_posix()
+            except ValueError:
+                return None
+    return meta
+
+
+def _to_absolute(meta: Dict[str, Any], root: str) -> Dict[str, Any]:
+    meta = dict(meta)
+    for key in _PATH_KEYS:
+        if meta.get(key):
+            meta[key] = normalize_path(Path(root) / meta[key])
+    return meta
+
+
+def _add_bytes(tar: tarfile.TarFile, name: str, data: bytes) -> None:
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mtime = int(time.time())
+    tar.addfile(info, io.BytesIO(data))
+
+
+# --- Export ---
+def export_bundle(bundle_path: Path, roots: Optional[List[str]] = None) -> Path:
+    """
+    Packs the shards of the given organized roots (default: all) into one
+    compressed bundle. The default shard is left out: its files live outside every
+    root, so their paths cannot be rebased.
+    """
+    bundle_path = Path(bundle_path)
+    sharded = get_sharded_index().load()
+    live_roots = [root for root, _ in sharded.shards() if root != DEFAULT_SHARD]
+    roots = [normalize_path(r) for r in roots] if roots else live_roots
+    manifest: Dict[str, Any] = {"format": BUNDLE_FORMAT, "model_name": get_model_name(),
+                                "embedding_dim": get_embedding_dim(), "created_at": time.time(), "shards": []}
+
+    with tarfile.open(bundle_path, "w:gz") as tar:
+        for number, root in enumerate(roots):
+            if root not in live_roots:
+                logger.warning(f"[Bundler] {root} is not an organized root; skipped.")
+                continue
+            index_bytes, store = sharded.service(root).export_snapshot()
+            files = {}
+            for file_id, meta in store["files"].items():
+                relative = _to_relative(meta, root)
+                if relative is None:
+                    logger.warning(f"[Bundler] {meta['file_path']} lies outside {root}; skipped.")
+                    continue
+                files[str(file_id)] = relative
+
+            shard_dir = f"shards/{number:03d}"
+            _add_bytes(tar, f"{shard_dir}/index.faiss", index_bytes)
+            _add_bytes(tar, f"{shard_dir}/files.json", json.dumps(files).encode("utf-8"))
+            tag = store["projection_tag"]
+            if tag and f"projections/{tag}.npz" not in tar.getnames():
+                tar.add(str(projection_path(tag)), arcname=f"projections/{tag}.npz")
+            manifest["shards"].append({
+                "dir": shard_dir,
+                "root": root,
+                "files": len(files),
+                "next_file_id": store["next_file_id"],
+                "tombstones": store["tombstones"],
+                "projection_tag": tag,
+            })
+            logger.info(f"[Bundler] Packed {len(files)} file(s) of {root}")
+        _add_bytes(tar, "manifest.json", json.dumps(manifest, indent=2).encode("utf-8"))
+
+    logger.info(f"[Bundler] Wrote {bundle_path} ({bundle_path.stat().st_size / 1e6:.1f} MB)")
+    return bundle_path
+
+
+# --- Import ---
+def _read_member(tar: tarfile.TarFile, name: str) -> bytes:
+    member = tar.extractfile(name)
+    if member is None:
+        raise ValueError(f"[Bundler] Bundle is missing {name}")
+    return member.read()
+
+
+def _add_organized_path(root: str) -> None:
+    paths = get_organized_paths()
+    if any(normalize_path(p) == root for p in paths):
+        return
+    paths.append(root)
+    save_paths(get_watch_paths(), paths)
+
+
+def import_bundle(bundle_path: Path, root_map: Optional[Dict[str, str]] = None,
+                  base_dir: Optional[Path] = None) -> List[str]:
+    """
+    Installs every shard of a bundle as a new, published version of its root, with
+    paths rebased from the exporting machine's root onto the local one: an explicit
+    `root_map` entry, else `base_dir/<root folder name>`, else the same path.
+
+    The bundle must come from the same embedding model and dimension. Imported
+    roots are added to the organized paths, so a running watcher serves them from
+    its next poll; nothing is re-embedded.
+    """
+    model_name, embedding_dim = get_model_name(), get_embedding_dim()
+    root_map = {normalize_path(k): normalize_path(v) for k, v in (root_map or {}).items()}
+    with tarfile.open(bundle_path, "r:gz") as tar:
+        manifest = json.loads(_read_member(tar, "manifest.json"))
+        if manifest.get("format") != BUNDLE_FORMAT:
+            raise ValueError(f"[Bundler] Unsupported bundle format: {manifest.get('format')}")
+        if (manifest["model_name"], manifest["embedding_dim"]) != (model_name, embedding_dim):
+            raise ValueError(f"[Bundler] Bundle was embedded with {manifest['model_name']} "
+                             f"({manifest['embedding_dim']} dims); this install uses {model_name} ({embedding_dim} dims)")
+
+        targets = {}
+        for shard in manifest["shards"]:
+            old_root = normalize_path(shard["root"])
+            new_root = root_map.get(old_root) or (normalize_path(Path(base_dir) / Path(old_root).name)
+                                                  if base_dir else old_root)
+            if not Path(new_root).is_dir():
+                raise ValueError(f"[Bundler] No folder for {old_root} at {new_root}; pass --map or --base")
+            targets[shard["dir"]] = new_root
+
+        # Projections first, so a watcher that picks a shard up can load it.
+        get_projections_dir().mkdir(parents=True, exist_ok=True)
+        for member in tar.getmembers():
+            if member.name.startswith("projections/") and member.name.endswith(".npz"):
+                target = get_projections_dir() / Path(member.name).name
+                if not target.exists():
+                    target.write_bytes(_read_member(tar, member.name))
+
+        imported = []
+        for shard in manifest["shards"]:
+            new_root = targets[shard["dir"]]
+            version_dir = new_version_dir(new_root)
+            index_path, metadata_path = version_files(version_dir)
+            index_path.write_bytes(_read_member(tar, f"{shard['dir']}/index.faiss"))
+            files = json.loads(_read_member(tar, f"{shard['dir']}/files.json"))
+            store = MetadataStore(metadata_path)
+            try:
+                store.import_legacy({
+                    "files": {fid: _to_absolute(meta, new_root) for fid, meta in files.items()},
+                    "next_file_id": shard["next_file_id"],
+                    "tombstones": shard["tombstones"],
+                })
+                if shard.get("projection_tag"):
+                    store.set_value("projection_tag", shard["projection_tag"])
+                store.commit()
+            finally:
+                store.close()
+            publish_version(new_root, version_dir)
+            _add_organized_path(new_root)
+            imported.append(new_root)
+            logger.info(f"[Bundler] Imported {len(files)} file(s) into {new_root}")
+
+    update_config({"faiss_built": True})
+    sharded = get_sharded_index()
+    if sharded.loaded:
+        sharded.refresh()
+    return imported
+
+
+# --- CLI Entrypoint ---
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Export or import a portable SortedPC index bundle.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    export = sub.add_parser("export", help="Pack the index of the organized roots into one .tar.gz bundle.")
+    export.add_argument("bundle", type=Path, help="Bundle file to write.")
+    export.add_argument("--root", action="append", help="Only export this organized root (repeatable).")
+
+    load = sub.add_parser("import", help="Install a bundle, rebasing its roots onto local folders.")
+    load.add_argument("bundle", type=Path, help="Bundle file to read.")
+    load.add_argument("--map", action="append", default=[], metavar="OLD=NEW",
+                      help="Serve the bundle's root OLD from the local folder NEW (repeatable).")
+    load.add_argument("--base", type=Path, help="Local folder holding every root under its original name.")
+
+    args = parser.parse_args()
+    try:
+        if args.command == "export":
+            export_bundle(args.bundle, args.root)
+        else:
+            mapping = dict(item.split("=", 1) for item in args.map)
+            import_bundle(args.bundle, mapping, args.base)
+    finally:
+        get_sharded_index().close()
@@ -0,0 +1,177 @@
+# [compactor.py] — Vacuum job: drop dead index rows and compact every shard
+
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.core.pipelines.builder import index_single_file, read_config, update_config
+from src.core.utils.index_service import IndexService
+from src.core.utils.paths import get_data_dir, get_index_settings
+from src.core.utils.processor import compute_content_hash
+from src.core.utils.shards import get_sharded_index
+
+# --- Logger Setup ---
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)s | %(message)s")
+
+REPORT_COLUMNS = ["shard", "orphaned", "stale", "duplicate", "misplaced",
+                  "vectors_before", "vectors_after", "mb_before", "mb_after", "seconds"]
+
+
+def get_vacuum_report_file() -> Path:
+    return get_data_dir() / "vacuum_report.json"
+
+
+# --- Row Checks ---
+def _stat_matches(meta: Dict[str, Any], path: Path) -> Optional[bool]:
+    """True/False when the row carries a recorded stat, None for rows indexed before stats were kept."""
+    if "file_size" not in meta or "file_mtime_ns" not in meta:
+        return None
+    st = path.stat()
+    return st.st_size == meta["file_size"] and st.st_mtime_ns == meta["file_mtime_ns"]
+
+
+def _content_changed(service: IndexService, meta: Dict[str, Any], verify_hashes: bool) -> bool:
+    path = Path(meta["file_path"])
+    matches = _stat_matches(meta, path)
+    if matches or (matches is None and not verify_hashes):
+        return False
+    try:
+        changed = compute_content_hash(path) != meta.get("content_hash")
+    except Exception as e:
+        logger.warning(f"[Compactor] Could not re-hash {path.name}, keeping its row: {repr(e)}")
+        return False
+    if not changed:
+        # Touched but identical: record the new stat so the next run skips it.
+        service.relocate(meta["file_path"], {"file_path": meta["file_path"]})
+    return changed
+
+
+# --- Vacuum ---
+def vacuum(verify_hashes: bool = False) -> List[Dict[str, Any]]:
+    """
+    Removes rows whose file is gone (orphaned) or that repeat a path already indexed
+    (duplicate, the older copy is dropped), re-embeds files whose content no longer
+    matches what was embedded (stale) and moves rows that sit in another root's shard
+    (misplaced) over.
+    Each shard is then rebuilt from its live vectors, checkpointed and VACUUMed.
+
+    Files are re-extracted only when their size/mtime changed; rows indexed before
+    those were recorded are re-hashed only with `verify_hashes`. Returns one report
+    row per shard and writes them to `vacuum_report.json`.
+    """
+    sharded = get_sharded_index().load()
+    shards = sharded.shards()
+    rows: Dict[str, Dict[str, Any]] = {}
+    started: Dict[str, float] = {}
+    for root, service in shards:
+        started[root] = time.perf_counter()
+        before = service.stats()
+        rows[root] = {"shard": root or "default", "orphaned": 0, "stale": 0, "duplicate": 0, "misplaced": 0,
+                      "vectors_before": before["vectors"], "mb_before": before["bytes"] / 1e6}
+
+    # --- Row Pass ---
+    seen: Dict[str, Tuple[str, Dict[str, Any]]] = {}
+    for root, service in shards:
+        for meta in list(service.iter_files()):
+            file_path = meta["file_path"]
+            if not Path(file_path).is_file():
+                service.delete(file_path)
+                rows[root]["orphaned"] += 1
+                continue
+            owner = sharded.shard_for(file_path)
+            if owner != root:
+                # The owner's copy (if any) wins; otherwise this one is carried over.
+                if sharded.service(owner).file_id_for(file_path) is not None:
+                    service.delete(file_path)
+                    rows[root]["duplicate"] += 1
+                elif sharded.rehome(root, file_path):
+                    rows[root]["misplaced"] += 1
+                continue
+            key = os.path.normcase(file_path)
+            if key in seen:
+                other_root, other = seen[key]
+                older_root, older = (other_root, other) if other.get("indexed_at", 0) <= meta.get("indexed_at", 0) \
+                    else (root, meta)
+                sharded.service(older_root).delete(older["file_path"])
+                rows[older_root]["duplicate"] += 1
+                if older is other:
+                    seen[key] = (root, meta)
+                continue
+            if _content_changed(service, meta, verify_hashes):
+                # Edited, not gone: re-index it so the sorter keeps learning from it.
+                # If that fails the old row stays and the next vacuum retries.
+                try:
+                    reindexed = index_single_file(Path(file_path))
+                except Exception as e:
+                    logger.warning(f"[Compactor] Could not re-index {Path(file_path).name}: {repr(e)}")
+                    reindexed = False
+                if reindexed:
+                    rows[root]["stale"] += 1
+                    meta = {**meta, "indexed_at": time.time()}
+            seen[key] = (root, meta)
+
+    # --- Compaction ---
+    for root, service in shards:
+        service.compact()
+        after = service.stats()
+        rows[root].update(vectors_after=after["vectors"], mb_after=after["bytes"] / 1e6,
+                          seconds=time.perf_counter() - started[root])
+        logger.info(f"[Compactor] Shard {rows[root]['shard']}: reclaimed "
+                    f"{rows[root]['vectors_before'] - after['vectors']} vector(s), "
+                    f"{rows[root]['mb_before'] - rows[root]['mb_after']:.2f} MB.")
+
+    report = list(rows.values())
+    get_vacuum_report_file().write_text(json.dumps({"finished_at": time.time(), "shards": report}, indent=2),
+                                        encoding="utf-8")
+    update_config({"last_vacuum_at": time.time(), "vacuum_requested": False})
+    return report
+
+
+# --- Scheduling ---
+def request_vacuum() -> None:
+    """Asks a running watcher to vacuum on its next poll (it owns the shards while online)."""
+    update_config({"vacuum_requested": True})
+
+
+def vacuum_due() -> bool:
+    config = read_config()
+    if config.get("vacuum_requested"):
+        return True
+    hours = float(get_index_settings()["index_vacuum_interval_hours"])
+    return hours > 0 and time.time() - float(config.get("last_vacuum_at", 0)) >= hours * 3600
+
+
+def print_report(report: List[Dict[str, Any]]) -> None:
+    print("\nIndex vacuum")
+    print("  " + " | ".join(f"{c:>14}" for c in REPORT_COLUMNS))
+    for row in report:
+        cells = []
+        for c in REPORT_COLUMNS:
+            value = row.get(c, "")
+            cells.append(f"{value:>14.2f}" if isinstance(value, float) else f"{str(value):>14}")
+        print("  " + " | ".join(cells))
+
+
+# --- CLI Entrypoint ---
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Drop orphaned index rows, re-embed stale ones and compact every shard.")
+    parser.add_argument("--verify-hashes", action="store_true",
+                        help="Also re-hash files indexed before size/mtime were recorded (slow).")
+    args = parser.parse_args()
+    from src.core.pipelines.watcher import is_watcher_online
+    from src.core.utils.backend import get_backend
+    if is_watcher_online() or get_backend() is not None:
+        # The watcher (or index server) holds the shards open; it runs the job on its next poll.
+        request_vacuum()
+        print("Vacuum requested. The watcher will run it shortly (re-hashing as index_vacuum_verify_hashes says); "
+              "see its log for the report.")
+        raise SystemExit(0)
+    try:
+        print_report(vacuum(verify_hashes=args.verify_hashes))
+    finally:
+        get_sharded_index().close()
@@ -17,6 +17,7 @@ from src.core.utils.paths import (
     get_faiss_metadata_path,
     get_unsorted_folder,
     get_data_dir,
+    INDEX_DEFAULTS,
 )
 from src.core.utils.notifier import notify_system_event
 # ───────────────────────────────────────────────────────────────
@@ -27,7 +28,7 @@ logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)s | %(
 
 # --- Default Data ---
 DEFAULT_PATHS = {"organized_paths": [], "watch_paths": []}
-DEFAULT_CONFIG = {"faiss_built": False, "builder_busy": False, "alpha": 0.6, "beta": 0.3, "gamma": 0.05, "delta": 0.05}
+DEFAULT_CONFIG = {"faiss_built": False, "builder_busy": False, "alpha": 0.6, "beta": 0.3, "gamma": 0.05, "delta": 0.05, **INDEX_DEFAULTS}
 
 # --- File & Folder Ensurers ---
 def ensure_file(path: Path, default_data=None):
@@ -47,20 +48,25 @@ def ensure_unsorted_folder():
 def ensure_faiss_files():
     # --- Patched Block: Import `faiss` and `processor` only when needed ---
     import faiss
-    from src.core.utils.processor import embedding_dim
+    from src.core.utils.indexer import new_faiss_index
+    from src.core.utils.metastore import MetadataStore
+    from src.core.utils.processor import get_embedding_dim
 
-    dim = embedding_dim
+    dim = get_embedding_dim()
     index_path = get_faiss_index_path()
     metadata_path = get_faiss_metadata_path()
     data_dir = get_data_dir()
     data_dir.mkdir(parents=True, exist_ok=True)
+    index_path.parent.mkdir(parents=True, exist_ok=True)  # a non-default model's namespace
 
     if not index_path.exists():
         logger.info(f"[Initializer] Creating empty FAISS index at: {index_path} (dim={dim})")
-        index = faiss.IndexFlatL2(dim)
+        index = new_faiss_index(dim)
         faiss.write_index(index, str(index_path))
 
-    ensure_file(metadata_path)
+    if not metadata_path.exists():
+        logger.info(f"[Initializer] Creating metadata store at: {metadata_path}")
+        MetadataStore(metadata_path).close()
 
 # --- Reset Logic ---
 def reset_all():
@@ -0,0 +1,113 @@
+# [migrator.py] — Offline index layout migrations
+
+import logging
+
+import numpy as np
+
+from src.core.pipelines.builder import build_shard, reproject_shard, update_config
+from src.core.utils.shards import DEFAULT_SHARD, get_sharded_index
+from src.core.utils.indexer import STORAGE_FLAT, STORAGE_PQ, STORAGE_SQ8
+from src.core.utils.paths import get_projections_dir
+from src.core.utils.processor import get_embedding_dim
+from src.core.utils.projection import PROJECTION_DIMS, fit_projection
+
+# --- Logger Setup ---
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)s | %(message)s")
+
+
+# --- Storage Migration ---
+def migrate_storage(storage: str) -> bool:
+    """
+    Persists the requested vector storage and rebuilds the index into it right away.
+
+    A running watcher picks the new setting up on its own within one checkpoint
+    interval; this command is for applying it while the watcher is stopped. Below
+    `index_compress_min_vectors` the index stays uncompressed, since SQ8/PQ codes
+    need a representative training sample.
+    """
+    update_config({"index_storage": storage})
+    sharded = get_sharded_index().load()
+    applied = True
+    try:
+        for root, service in sharded.shards():
+            service.reload_settings()
+            service.maybe_retier(force=True)
+            service.flush()
+            tier, current = service.layout()
+            logger.info(f"[Migrator] Shard {root or 'default'} now uses {tier}/{current} storage.")
+            if current != storage:
+                logger.warning(f"[Migrator] Shard {root or 'default'} is below the compression threshold; "
+                               f"kept {current} storage.")
+                applied = False
+        return applied
+    finally:
+        sharded.close()
+
+
+# --- Dimensionality Reduction ---
+def apply_projection(dim: int) -> bool:
+    """
+    Fits a PCA projection to `dim` dimensions on the indexed full-dimension vectors,
+    makes it the active one and rebuilds every root shard into it (`dim=0` goes back
+    to full-dimension vectors).
+
+    Shards that still hold full vectors are projected from them directly; shards
+    already reduced by another fit have lost the discarded dimensions and are
+    re-embedded from their files. The default shard keeps the space it has. Run
+    `benchmarker projection` first to see the top-k overlap each size keeps.
+    """
+    sharded = get_sharded_index().load()
+    try:
+        target_tag = None
+        if dim:
+            full = [service.export_vectors()[1] for _, service in sharded.shards() if service.projection_tag is None]
+            vectors = np.vstack(full) if full else np.zeros((0, get_embedding_dim()), dtype=np.float32)
+            try:
+                projection = fit_projection(vectors, dim)
+            except ValueError as e:
+                logger.error(f"[Migrator] Cannot fit a projection: {e}")
+                return False
+            projection.save()
+            target_tag = projection.tag
+            logger.info(f"[Migrator] Fitted {target_tag} on {len(vectors)} vector(s).")
+        update_config({"index_projection": target_tag or ""})
+
+        for root, service in sharded.shards():
+            current = service.projection_tag
+            if current == target_tag:
+                continue
+            if root == DEFAULT_SHARD:
+                logger.warning(f"[Migrator] The default shard stays in {current or 'full dim'}.")
+            elif current is None:
+                reproject_shard(root)
+            else:
+                build_shard(root)
+
+        in_use = {service.projection_tag for _, service in sharded.shards()} | {target_tag}
+        for path in get_projections_dir().glob("*.npz"):
+            if path.stem not in in_use:
+                path.unlink(missing_ok=True)
+        return True
+    finally:
+        sharded.close()
+
+
+# --- CLI Entrypoint ---
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="SortedPC index migrations.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    compress = sub.add_parser("compress", help="Switch the index between flat, SQ8 and PQ vector storage.")
+    compress.add_argument("--storage", choices=(STORAGE_FLAT, STORAGE_SQ8, STORAGE_PQ), required=True)
+
+    project = sub.add_parser("project", help="Reduce the index to a PCA projection fitted on the corpus.")
+    project.add_argument("--dim", type=int, choices=(0, *PROJECTION_DIMS), required=True,
+                         help="Target dimensions (0 = back to full-dimension embeddings).")
+
+    args = parser.parse_args()
+    if args.command == "compress":
+        migrate_storage(args.storage)
+    elif args.command == "project":
+        apply_projection(args.dim)
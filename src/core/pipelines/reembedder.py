@@ -0,0 +1,246 @@
+# [reembedder.py] — Progressive background re-embedding when the encoder model changes
+
+import logging
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from src.core.pipelines.builder import index_single_file, read_config, update_config
+from src.core.utils.index_service import IndexService, get_index_service, release_index_service
+from src.core.utils.paths import (
+    get_active_model,
+    get_faiss_index_path,
+    get_faiss_metadata_path,
+    get_model_settings,
+    get_namespace_dir,
+)
+from src.core.utils.processor import get_model_dim, process_file
+from src.core.utils.shards import DEFAULT_SHARD, current_version_dir, get_sharded_index, version_files
+
+# --- Logger Setup ---
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)s | %(message)s")
+
+# While a switch is pending, the old model's index keeps serving every sort and
+# search. Each pass walks the live shards and re-embeds, into the target model's
+# namespace, every file whose target row is missing or older than the live one.
+# Upserts go through the target indexes' WAL, so an interrupted pass resumes where
+# it stopped. Once a pass ends with every live file covered, "embedding_model" is
+# rewritten in config.json in one step and each process reopens its shards from the
+# new namespace on its next refresh.
+
+_IDLE_PRIORITY = 10  # nice value of the re-embedding thread, where the OS supports it
+
+
+# --- Migration State ---
+def pending_model() -> Optional[str]:
+    return read_config().get("embedding_model_pending") or None
+
+
+def start_migration(model_name: str) -> None:
+    """Schedules a switch to `model_name`; a running watcher starts re-embedding on its next poll."""
+    if model_name == get_active_model():
+        raise ValueError(f"[Reembedder] {model_name} is already the active model")
+    get_model_dim(model_name)  # fails early if the model cannot be loaded
+    update_config({"embedding_model_pending": model_name})
+    logger.info(f"[Reembedder] Scheduled switch from {get_active_model()} to {model_name}")
+
+
+def cancel_migration(discard: bool = False) -> None:
+    """Stops a pending switch. With `discard` the target namespace is deleted; otherwise a restart resumes it."""
+    model_name = pending_model()
+    update_config({"embedding_model_pending": ""})
+    if model_name and discard:
+        for root in [DEFAULT_SHARD, *get_sharded_index().refresh()]:
+            release_index_service(*_target_files(root, model_name), checkpoint=False)
+        shutil.rmtree(get_namespace_dir(model_name), ignore_errors=True)
+        logger.info(f"[Reembedder] Discarded the {model_name} index")
+
+
+# --- Target Namespace ---
+def _target_files(root: str, model_name: str) -> Tuple[Path, Path]:
+    if root == DEFAULT_SHARD:
+        return get_faiss_index_path(model_name), get_faiss_metadata_path(model_name)
+    return version_files(current_version_dir(root, model_name))
+
+
+def _target_service(root: str, model_name: str) -> IndexService:
+    index_path, metadata_path = _target_files(root, model_name)
+    index_path.parent.mkdir(parents=True, exist_ok=True)
+    return get_index_service(index_path, metadata_path, model_name=model_name)
+
+
+def _is_current(target: IndexService, meta: Dict[str, Any]) -> bool:
+    file_id = target.file_id_for(meta["file_path"])
+    if file_id is not None:
+        return (target.get_file(file_id) or {}).get("content_hash") == meta.get("content_hash")
+    # A file the target model could not embed counts as done until its content changes.
+    return target.get_value("reembed_failed", {}).get(meta["file_path"]) == meta.get("content_hash")
+
+
+def _reembed_file(target: IndexService, meta: Dict[str, Any], model_name: str) -> bool:
+    """Embeds one live file with the target model. Identical content already in the target is copied, not re-encoded."""
+    path = Path(meta["file_path"])
+    if not path.is_file():
+        return False  # gone; the live row is left to the watcher and the vacuum
+    row = {k: v for k, v in meta.items() if k != "num_chunks"}
+    twins = [m for m in target.files_with_hash(meta.get("content_hash", "")) if m["file_path"] != row["file_path"]]
+    found = target.file_vectors(twins[0]["file_path"]) if twins else None
+    if found is not None:
+        vectors = found[1]
+    else:
+        processed = process_file(path, model_name=model_name)
+        if not processed.get("embeddings"):
+            logger.warning(f"[Reembedder] {path.name} yielded no embeddings with {model_name}; it will not be indexed")
+            failed = target.get_value("reembed_failed", {})
+            target.set_value("reembed_failed", {**failed, row["file_path"]: meta.get("content_hash")})
+            return False
+        vectors = np.asarray(processed["embeddings"], dtype=np.float32)
+    target.upsert(vectors, row)
+    return True
+
+
+# --- Progress ---
+def coverage(model_name: Optional[str] = None) -> Dict[str, Any]:
+    """How many live files already have a current row in the target model's index."""
+    model_name = model_name or pending_model()
+    if not model_name:
+        return {"model": None, "files": 0, "done": 0, "percent": 100.0}
+    sharded = get_sharded_index().load()
+    files = done = 0
+    for root, live in sharded.shards():
+        target = _target_service(root, model_name)
+        for meta in live.iter_files():
+            files += 1
+            # Files deleted from disk are left to the watcher and the vacuum.
+            done += _is_current(target, meta) or not Path(meta["file_path"]).is_file()
+    return {"model": model_name, "files": files, "done": done,
+            "percent": 100.0 * done / files if files else 100.0}
+
+
+def _lower_priority() -> None:
+    # On Linux a thread's nice value is set through its native id.
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), _IDLE_PRIORITY)
+    except (AttributeError, OSError):
+        pass
+
+
+# --- Migration ---
+def migrate_pass(model_name: str, stop: Optional[threading.Event] = None) -> Dict[str, Any]:
+    """
+    Re-embeds every live file not yet current in the target namespace and drops target
+    rows whose file has left the live index. Pauses after each batch of files so the
+    watcher's own sorting keeps priority.
+    """
+    settings = get_model_settings()
+    batch, pause = int(settings["reembed_batch_files"]), float(settings["reembed_pause_seconds"])
+    sharded = get_sharded_index().load()
+    embedded = dropped = 0
+    for root, live in sharded.shards():
+        target = _target_service(root, model_name)
+        live_paths = set()
+        for meta in live.iter_files():
+            if stop is not None and stop.is_set():
+                return {"embedded": embedded, "dropped": dropped, "stopped": True}
+            live_paths.add(meta["file_path"])
+            if _is_current(target, meta):
+                continue
+            try:
+                if not _reembed_file(target, meta, model_name):
+                    continue
+            except Exception as e:
+                logger.warning(f"[Reembedder] Could not re-embed {Path(meta['file_path']).name}: {repr(e)}")
+                continue
+            embedded += 1
+            if embedded % batch == 0:
+                logger.info(f"[Reembedder] {embedded} file(s) re-embedded with {model_name} so far")
+                time.sleep(pause)
+        for meta in target.iter_files():
+            if meta["file_path"] not in live_paths:
+                target.delete(meta["file_path"])
+                dropped += 1
+        target.flush()
+    return {"embedded": embedded, "dropped": dropped, "stopped": False}
+
+
+def switch_over(model_name: str) -> int:
+    """
+    Makes the fully re-embedded `model_name` the active model. Files the old index took
+    in after the final pass started are re-indexed with the new model. Returns their count.
+    """
+    sharded = get_sharded_index().load()
+    old_model = get_active_model()
+    old_files = [sharded.shard_paths(root) for root, _ in sharded.shards()]
+    cutoff = float(read_config().get("reembed_pass_started_at", time.time()))
+    for root, _ in sharded.shards():
+        release_index_service(*_target_files(root, model_name))  # checkpoint the new namespace
+
+    # A projection was fitted in the old model's space and does not carry over.
+    update_config({"embedding_model": model_name, "embedding_model_pending": "", "index_projection": ""})
+    sharded.refresh()
+    logger.info(f"[Reembedder] Switched the index from {old_model} to {model_name}")
+
+    late = []
+    for index_path, metadata_path in old_files:
+        service = get_index_service(index_path, metadata_path, model_name=old_model)
+        late += [m["file_path"] for m in service.iter_files() if float(m.get("indexed_at", 0)) >= cutoff]
+        release_index_service(index_path, metadata_path)
+    for file_path in late:
+        if Path(file_path).is_file():
+            index_single_file(Path(file_path))
+    return len(late)
+
+
+def run_migration(stop: Optional[threading.Event] = None, background: bool = False) -> Optional[Dict[str, Any]]:
+    """
+    Runs one pass of the pending migration and switches over once every live file is
+    covered. Safe to call repeatedly (the watcher does, on each poll) and to interrupt.
+    """
+    model_name = pending_model()
+    if not model_name:
+        return None
+    if background:
+        _lower_priority()
+    update_config({"reembed_pass_started_at": time.time()})
+    result = migrate_pass(model_name, stop)
+    result.update(coverage(model_name))
+    logger.info(f"[Reembedder] {result['done']}/{result['files']} file(s) covered by {model_name} "
+                f"({result['percent']:.1f}%)")
+    if not result["stopped"] and result["done"] == result["files"]:
+        result["replayed"] = switch_over(model_name)
+    return result
+
+
+# --- CLI Entrypoint ---
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Switch the encoder model by re-embedding in the background.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    start = sub.add_parser("start", help="Schedule a switch; a running watcher re-embeds in the background.")
+    start.add_argument("model", help="SentenceTransformer model name, e.g. all-mpnet-base-v2.")
+    sub.add_parser("status", help="Show the pending model and its coverage.")
+    sub.add_parser("run", help="Re-embed in the foreground (watcher offline) and switch when complete.")
+    cancel = sub.add_parser("cancel", help="Stop a pending switch.")
+    cancel.add_argument("--discard", action="store_true", help="Also delete the partially built index.")
+
+    args = parser.parse_args()
+    try:
+        if args.command == "start":
+            start_migration(args.model)
+        elif args.command == "status":
+            print(f"Active model: {get_active_model()}")
+            info = coverage()
+            if info["model"]:
+                print(f"Switching to {info['model']}: {info['done']}/{info['files']} files ({info['percent']:.1f}%)")
+        elif args.command == "run":
+            print(run_migration())
+        else:
+            cancel_migration(discard=args.discard)
+    finally:
+        get_sharded_index().close()
@@ -0,0 +1,258 @@
+# [server.py] — Optional index server: one process owns the index and model for every client
+
+import logging
+import os
+import socket
+import socketserver
+import threading
+import time
+from concurrent.futures import Future
+from pathlib import Path
+from queue import Empty, Queue
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.core.pipelines.verifier import verify_index
+from src.core.pipelines.watcher import start_reembed_if_pending, start_vacuum_if_due
+from src.core.utils.backend import LocalBackend, recv_message, send_message, set_backend
+from src.core.utils.paths import get_index_settings, get_server_socket_path
+from src.core.utils.processor import _load_model
+from src.core.utils.shards import get_sharded_index
+
+# --- Logger Setup ---
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)s | %(message)s")
+
+# Calls a client may make; anything else is refused.
+SERVED_OPS = ("embed", "embed_many", "search", "search_many", "search_files", "search_files_many",
+              "classify", "upsert", "upsert_many", "delete", "relocate")
+MAINTENANCE_INTERVAL = 3.0  # seconds between shard refreshes and maintenance checks
+
+
+# --- Request Coalescing ---
+class Coalescer:
+    """
+    Gathers concurrent calls of one kind for up to `max_wait` seconds (or until
+    `max_batch` arrive) and serves them all with a single `run_batch` call, which
+    returns one result per payload in order.
+    """
+
+    def __init__(self, name: str, run_batch: Callable[[List[Any]], List[Any]], max_batch: int, max_wait: float):
+        self.name = name
+        self._run_batch = run_batch
+        self._max_batch = max(1, max_batch)
+        self._max_wait = max(0.0, max_wait)
+        self._queue: "Queue[Tuple[Any, Future]]" = Queue()
+        self._thread = threading.Thread(target=self._loop, name=f"coalesce-{name}", daemon=True)
+        self._thread.start()
+
+    def submit(self, payload: Any) -> Any:
+        future: Future = Future()
+        self._queue.put((payload, future))
+        return future.result()
+
+    def _loop(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self._max_wait
+            while len(batch) < self._max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except Empty:
+                    break
+            try:
+                results = self._run_batch([payload for payload, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+            if len(batch) > 1:
+                logger.debug(f"[Server] Coalesced {len(batch)} {self.name} call(s)")
+
+
+class CoalescingBackend:
+    """
+    The backend inside the server. Single `embed`, `search` and `search_files`
+    calls from concurrent clients are queued and served together: one forward pass
+    for all their chunks, one FAISS search per shard for all their queries. Writes
+    go straight to the sharded index.
+    """
+
+    def __init__(self, local: LocalBackend, max_batch: int, max_wait: float):
+        self._local = local
+        self._embed = Coalescer("embed", local.embed_many, max_batch, max_wait)
+        self._search = Coalescer("search", self._run_searches, max_batch, max_wait)
+        self._search_files = Coalescer("search_files", self._run_file_searches, max_batch, max_wait)
+
+    # --- Batched Calls ---
+    def embed(self, chunks: List[str]) -> np.ndarray:
+        return self._embed.submit(list(chunks))
+
+    def embed_many(self, batches: Sequence[List[str]]) -> List[np.ndarray]:
+        return self._local.embed_many(batches)
+
+    def search(self, query_array: np.ndarray, top_k: int, top_folders: Optional[int] = None,
+               folders: Optional[Sequence[str]] = None) -> List[Dict[str, Any]]:
+        key = (top_k, top_folders, tuple(folders) if folders is not None else None)
+        return self._search.submit((key, np.asarray(query_array, dtype=np.float32)))
+
+    def search_many(self, query_arrays: Sequence[np.ndarray], top_k: int, top_folders: Optional[int] = None,
+                    folders: Optional[Sequence[str]] = None) -> List[List[Dict[str, Any]]]:
+        return self._local.search_many(query_arrays, top_k, top_folders, folders)
+
+    def search_files(self, query_array: np.ndarray, top_k: int) -> List[Dict[str, Any]]:
+        return self._search_files.submit((top_k, np.asarray(query_array, dtype=np.float32)))
+
+    def search_files_many(self, query_arrays: Sequence[np.ndarray], top_k: int) -> List[List[Dict[str, Any]]]:
+        return self._local.search_files_many(query_arrays, top_k)
+
+    @staticmethod
+    def _grouped(payloads: List[Tuple[Any, np.ndarray]], run: Callable[[Any, List[np.ndarray]], List[Any]]) -> List[Any]:
+        # Only calls with identical parameters can share a search.
+        groups: Dict[Any, List[int]] = {}
+        for i, (key, _) in enumerate(payloads):
+            groups.setdefault(key, []).append(i)
+        results: List[Any] = [None] * len(payloads)
+        for key, members in groups.items():
+            for i, found in zip(members, run(key, [payloads[i][1] for i in members])):
+                results[i] = found
+        return results
+
+    def _run_searches(self, payloads: List[Tuple[Any, np.ndarray]]) -> List[List[Dict[str, Any]]]:
+        return self._grouped(payloads, lambda key, arrays: self._local.search_many(arrays, key[0], key[1], key[2]))
+
+    def _run_file_searches(self, payloads: List[Tuple[Any, np.ndarray]]) -> List[List[Dict[str, Any]]]:
+        return self._grouped(payloads, lambda top_k, arrays: self._local.search_files_many(arrays, top_k))
+
+    # --- Pass-through Calls ---
+    def classify(self, processed_data: Dict[str, Any]) -> Dict[str, Any]:
+        # The sorter's own retrievals come back through this backend and are coalesced.
+        embeddings = np.asarray(processed_data["embeddings"], dtype=np.float32).tolist()
+        sorted_data = self._local.classify({**processed_data, "embeddings": embeddings})
+        return {k: v for k, v in sorted_data.items() if k != "embeddings"}
+
+    def upsert(self, embedding_array: np.ndarray, file_metadata: Dict[str, Any]) -> int:
+        return self._local.upsert(embedding_array, file_metadata)
+
+    def upsert_many(self, items: Sequence[Dict[str, Any]]) -> List[int]:
+        return self._local.upsert_many(items)
+
+    def delete(self, file_path: str) -> bool:
+        return self._local.delete(file_path)
+
+    def relocate(self, old_path: str, file_metadata: Dict[str, Any]) -> bool:
+        return self._local.relocate(old_path, file_metadata)
+
+
+# --- Socket Server ---
+class _RequestHandler(socketserver.BaseRequestHandler):
+    """Serves one client connection: framed JSON requests, answered in order."""
+
+    def handle(self) -> None:
+        while True:
+            try:
+                message = recv_message(self.request)
+            except (OSError, ValueError):
+                return
+            if message is None:
+                return
+            op = message.get("op")
+            try:
+                if op not in SERVED_OPS:
+                    raise ValueError(f"Unknown operation: {op}")
+                reply = {"ok": True, "result": getattr(self.server.backend, op)(**message.get("args", {}))}
+            except Exception as e:
+                logger.warning(f"[Server] {op} failed: {repr(e)}")
+                reply = {"ok": False, "error": repr(e)}
+            try:
+                send_message(self.request, reply)
+            except OSError:
+                return
+
+
+class IndexServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: Path, backend: CoalescingBackend):
+        self.backend = backend
+        _clear_stale_socket(socket_path)
+        socket_path.parent.mkdir(parents=True, exist_ok=True)
+        super().__init__(str(socket_path), _RequestHandler)
+        os.chmod(socket_path, 0o600)  # only this user's processes may talk to the index
+
+
+def _clear_stale_socket(socket_path: Path) -> None:
+    if not socket_path.exists():
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(str(socket_path))
+    except OSError:
+        socket_path.unlink()  # left behind by a server that did not shut down cleanly
+        return
+    finally:
+        probe.close()
+    raise RuntimeError(f"[Server] An index server is already listening on {socket_path}")
+
+
+# --- Lifecycle ---
+def run_server(socket_path: Optional[Path] = None, stop: Optional[threading.Event] = None) -> None:
+    """
+    Loads every shard and the model once, then serves clients until `stop` is set
+    (or Ctrl+C). While it runs, the server also does what the watcher otherwise
+    does for the index it owns: refreshes shards, vacuums and re-embeds.
+    """
+    if not hasattr(socket, "AF_UNIX"):
+        raise RuntimeError("[Server] Unix domain sockets are not supported on this platform")
+    socket_path = Path(socket_path or get_server_socket_path())
+    stop = stop or threading.Event()
+    settings = get_index_settings()
+
+    sharded = get_sharded_index().load()
+    for row in verify_index(repair=True):
+        if row["missing"] or row["stray_vectors"] or row["recovered"] != "-":
+            logger.warning(f"[Server] Index repair on shard {row['shard']}: {row}")
+    _load_model()
+
+    backend = CoalescingBackend(LocalBackend(), int(settings["index_server_max_batch"]),
+                                float(settings["index_server_batch_ms"]) / 1000.0)
+    set_backend(backend)
+    server = IndexServer(socket_path, backend)
+    thread = threading.Thread(target=server.serve_forever, name="index-server", daemon=True)
+    thread.start()
+    logger.info(f"[Server] Serving the index on {socket_path}")
+
+    vacuum_thread, reembed_thread, reembed_stop = None, None, threading.Event()
+    try:
+        while not stop.wait(MAINTENANCE_INTERVAL):
+            sharded.refresh()
+            if not (reembed_thread and reembed_thread.is_alive()):
+                vacuum_thread = start_vacuum_if_due(vacuum_thread)
+            if not (vacuum_thread and vacuum_thread.is_alive()):
+                reembed_thread = start_reembed_if_pending(reembed_thread, reembed_stop)
+    except KeyboardInterrupt:
+        logger.info("[Server] Interrupted by user.")
+    finally:
+        server.shutdown()
+        server.server_close()
+        socket_path.unlink(missing_ok=True)
+        reembed_stop.set()
+        for job in (vacuum_thread, reembed_thread):
+            if job:
+                job.join()
+        set_backend(None)
+        sharded.close()
+        logger.info("[Server] Stopped.")
+
+
+# --- CLI Entrypoint ---
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Serve the index and model to other SortedPC processes.")
+    parser.add_argument("--socket", type=Path, help="Unix socket path (default: index_server_socket or data/index.sock).")
+    args = parser.parse_args()
+    run_server(args.socket)
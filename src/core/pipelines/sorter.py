@@ -11,7 +11,8 @@ from statistics import mean
 from src.core.utils.processor import process_file
 from src.core.pipelines.actor import act_on_file
 from src.core.utils.paths import get_config_file, get_unsorted_folder
-from src.core.utils.retriever import retrieve_similar
+from src.core.utils.retriever import retrieve_similar, retrieve_similar_files
+from src.core.utils.backend import get_backend
 # --- END MODIFIED IMPORTS ---
 
 logger = logging.getLogger(__name__)
@@ -34,6 +35,23 @@ def load_scoring_weights() -> Dict[str, float]:
     }
 
 
+# --- Load retrieval granularity from config ---
+# "file" matches one pooled vector per file and refines ambiguous results with a
+# chunk search limited to the leading folders; "chunk" always searches every chunk.
+def load_sorting_settings() -> Dict:
+    config = {}
+    config_path = get_config_file()
+    if config_path.exists():
+        with config_path.open("r", encoding="utf-8") as f:
+            config = json.load(f)
+    return {
+        "granularity": config.get("sort_granularity", "file"),
+        "file_top_k": int(config.get("sort_file_top_k", 20)),
+        "refine_margin": float(config.get("sort_refine_margin", 0.05)),
+        "refine_folders": int(config.get("sort_refine_folders", 3)),
+    }
+
+
 # --- Scoring Helpers (Unchanged) ---
 def folder_name_score(file_name: str, folder_name: str) -> float:
     return 1.0 if folder_name.lower() in file_name.lower() else 0.0
@@ -63,28 +81,17 @@ def _build_output(
         "file_type": file_data["file_type"],
         "content_hash": file_data["content_hash"],
         "embeddings": file_data["embeddings"],
+        "truncation": file_data.get("truncation"),
         "final_folder": final_folder,
         "scoring_breakdown": scoring,
         "similar_folders": candidates,
         "used_fallback": used_fallback
     }
 
-# --- MODIFIED Core Sorting Logic ---
-def sort_file(processed_data: Dict) -> Dict:
-    """This function now takes the fully processed data as input."""
-    file_name = processed_data["file_name"]
-    file_type = processed_data["file_type"]
-    embeddings = processed_data["embeddings"]
-    total_chunks = len(embeddings)
-
-    weights = load_scoring_weights()
+def _score_folders(similar_files: List[Dict], file_name: str, file_type: str,
+                   weights: Dict[str, float], match_base: int, granularity: str):
+    """Scores each folder from its matches; `match_base` normalizes the match count."""
     alpha, beta, gamma, delta = weights["alpha"], weights["beta"], weights["gamma"], weights["delta"]
-
-    similar_files = retrieve_similar(embeddings)
-    if not similar_files:
-        logger.info("[Sorter] No similar files found. Using fallback folder.")
-        return _build_output(processed_data, str(get_unsorted_folder()), {}, [], used_fallback=True)
-
     folder_scores, scoring_details = {}, {}
     for match in similar_files:
         folder_path = match.get("parent_folder_path")
@@ -98,7 +105,7 @@ def sort_file(processed_data: Dict) -> Dict:
     for folder_path, sims in folder_scores.items():
         folder_name = Path(folder_path).name
         mean_sim, max_sim, match_count = mean(sims), max(sims), len(sims)
-        norm_count = match_count / total_chunks if total_chunks else 0.0
+        norm_count = match_count / match_base if match_base else 0.0
         name_score = folder_name_score(file_name, folder_name)
         type_score = file_type_affinity_score(file_type, folder_path)
         name_type_combo = 0.5 * name_score + 0.5 * type_score
@@ -107,11 +114,52 @@ def sort_file(processed_data: Dict) -> Dict:
         scoring_details[folder_path] = {
             "mean_similarity": round(mean_sim, 4), "max_similarity": round(max_sim, 4),
             "normalized_match_count": round(norm_count, 4), "name_match_score": name_score,
-            "type_affinity_score": round(type_score, 4), "final_score": round(score, 6)
+            "type_affinity_score": round(type_score, 4), "final_score": round(score, 6),
+            "granularity": granularity
         }
+    return final_scores, scoring_details
 
-    best_folder_path, best_score = max(final_scores.items(), key=lambda x: x[1])
+
+def _is_ambiguous(final_scores: Dict[str, float], threshold: float, margin: float) -> bool:
+    ranked = sorted(final_scores.values(), reverse=True)
+    close_runner_up = len(ranked) > 1 and ranked[0] - ranked[1] < margin
+    return close_runner_up or abs(ranked[0] - threshold) < margin
+
+
+# --- MODIFIED Core Sorting Logic ---
+def sort_file(processed_data: Dict) -> Dict:
+    """This function now takes the fully processed data as input."""
+    file_name = processed_data["file_name"]
+    file_type = processed_data["file_type"]
+    embeddings = processed_data["embeddings"]
+    total_chunks = len(embeddings)
     threshold = 0.7
+
+    weights = load_scoring_weights()
+    settings = load_sorting_settings()
+
+    if settings["granularity"] == "file":
+        similar_files = retrieve_similar_files(embeddings, top_k=settings["file_top_k"])
+        final_scores, scoring_details = _score_folders(
+            similar_files, file_name, file_type, weights, len(similar_files), "file")
+        if final_scores and _is_ambiguous(final_scores, threshold, settings["refine_margin"]):
+            # Close call: compare chunks, but only against the leading folders' files.
+            leaders = sorted(final_scores, key=final_scores.get, reverse=True)[:settings["refine_folders"]]
+            refined = retrieve_similar(embeddings, folders=leaders)
+            if refined:
+                logger.info(f"[Sorter] Ambiguous file-level match; refining over {len(leaders)} folder(s).")
+                final_scores, scoring_details = _score_folders(
+                    refined, file_name, file_type, weights, total_chunks, "chunk")
+    else:
+        similar_files = retrieve_similar(embeddings)
+        final_scores, scoring_details = _score_folders(
+            similar_files, file_name, file_type, weights, total_chunks, "chunk")
+
+    if not final_scores:
+        logger.info("[Sorter] No similar files found. Using fallback folder.")
+        return _build_output(processed_data, str(get_unsorted_folder()), {}, [], used_fallback=True)
+
+    best_folder_path, best_score = max(final_scores.items(), key=lambda x: x[1])
     if best_score < threshold:
         logger.info(f"[Sorter] Best score {best_score} is below threshold. Using fallback.")
         return _build_output(processed_data, str(get_unsorted_folder()), scoring_details, list(final_scores), used_fallback=True)
@@ -137,7 +185,8 @@ def handle_new_file(file_path: str) -> None:
 
         # 2. Sort the file to determine the final destination
         logger.info(f"[Sorter] Sorting file: {processed_data.get('file_name')}")
-        sorted_data = sort_file(processed_data)
+        backend = get_backend()
+        sorted_data = backend.classify(processed_data) if backend is not None else sort_file(processed_data)
 
         # 3. Call the actor to execute the file move and indexing
         logger.info(f"[Sorter] Handing off to actor: {processed_data.get('file_name')}")
@@ -0,0 +1,99 @@
+# [verifier.py] — Startup integrity check with incremental index repair
+
+import logging
+from pathlib import Path
+from typing import Any, Dict, List
+
+from src.core.pipelines.builder import build_shard, index_single_file
+from src.core.utils.shards import DEFAULT_SHARD, ShardedIndex, get_sharded_index
+
+# --- Logger Setup ---
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)s | %(message)s")
+
+REPORT_COLUMNS = ["shard", "files", "missing", "stray_vectors", "recovered", "repaired"]
+
+
+# --- Repair Helpers ---
+def _reembed(sharded: ShardedIndex, file_paths: List[str]) -> int:
+    """Re-indexes just the given files; rows of files that no longer exist are dropped."""
+    repaired = 0
+    for file_path in file_paths:
+        path = Path(file_path)
+        try:
+            if not path.is_file():
+                sharded.delete(file_path)
+                repaired += 1
+            elif index_single_file(path):
+                repaired += 1
+        except Exception as e:
+            logger.warning(f"[Verifier] Could not repair {path.name}: {repr(e)}")
+    return repaired
+
+
+# --- Verification ---
+def verify_index(repair: bool = True) -> List[Dict[str, Any]]:
+    """
+    Checks every shard when it loads: the snapshot against its manifest (size,
+    CRC32, vector count), the metadata store with SQLite's quick check, and every
+    file row against the vector ids actually present.
+
+    With `repair`, only the damage is redone: files whose vectors are missing are
+    re-embedded one by one, and a root whose metadata store had to be discarded is
+    rebuilt from its folder. If the default index lost its metadata, roots whose
+    shards came up empty are rebuilt too, since they may have been served from it.
+    """
+    sharded = get_sharded_index().load()
+    rows, rebuild = [], []
+    default_lost = False
+    for root, service in sharded.shards():
+        report = service.verify()
+        store_lost = bool({"store", "legacy metadata"} & set(report["recovered"]))
+        row = {"shard": root or "default", "files": report["files"], "missing": len(report["missing"]),
+               "stray_vectors": report["stray_vectors"], "recovered": ",".join(report["recovered"]) or "-",
+               "repaired": 0}
+        if repair:
+            if store_lost and root != DEFAULT_SHARD:
+                rebuild.append(root)
+                row["repaired"] = "rebuild"
+            else:
+                row["repaired"] = _reembed(sharded, report["missing"])
+        default_lost |= store_lost and root == DEFAULT_SHARD
+        rows.append(row)
+
+    if repair:
+        if default_lost:
+            rebuild += [root for root, service in sharded.shards()
+                        if root != DEFAULT_SHARD and root not in rebuild and service.count() == 0]
+        for root in rebuild:
+            logger.info(f"[Verifier] Rebuilding shard for {root}")
+            build_shard(root)
+        sharded.flush()
+    return rows
+
+
+def print_report(rows: List[Dict[str, Any]]) -> None:
+    print("\nIndex integrity")
+    print("  " + " | ".join(f"{c:>14}" for c in REPORT_COLUMNS))
+    for row in rows:
+        print("  " + " | ".join(f"{str(row.get(c, '')):>14}" for c in REPORT_COLUMNS))
+
+
+# --- CLI Entrypoint ---
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Check the index for corruption and repair only what is damaged.")
+    parser.add_argument("--check-only", action="store_true", help="Report problems without re-embedding anything.")
+    args = parser.parse_args()
+    from src.core.pipelines.watcher import is_watcher_online
+    from src.core.utils.backend import get_backend
+    if is_watcher_online() or get_backend() is not None:
+        # Even a check loads (and so writes) every shard; the process serving them already
+        # verified and repaired the index when it started.
+        print("The watcher or index server is serving the index. Stop it first; "
+              "it checks and repairs the index itself when it starts.")
+        raise SystemExit(1)
+    try:
+        print_report(verify_index(repair=not args.check_only))
+    finally:
+        get_sharded_index().close()
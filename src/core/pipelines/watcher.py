@@ -6,6 +6,7 @@ from pathlib import Path
 import os
 import time
 import logging
+import threading
 
 # The sys.path modification is no longer strictly necessary if the launcher
 # sets PYTHONPATH, but it remains as a robust fallback.
@@ -22,7 +23,14 @@ except IndexError:
 from src.core.utils.paths import get_config_file, get_watch_paths, get_watcher_log
 from src.core.utils.notifier import notify_system_event
 from src.core.pipelines.sorter import handle_new_file
+from src.core.pipelines.actor import apply_requested_corrections
 from src.core.utils.logger import has_been_handled
+from src.core.utils.shards import get_sharded_index
+from src.core.utils.paths import get_index_settings
+from src.core.pipelines.compactor import vacuum, vacuum_due
+from src.core.pipelines.verifier import verify_index
+from src.core.pipelines.reembedder import pending_model, run_migration
+from src.core.utils.backend import get_backend
 
 # ─── PID Tracking (Essential for startup signaling) ──────────────────────────
 
@@ -52,6 +60,54 @@ def clear_pid():
     """Removes the PID file on clean shutdown."""
     get_pid_file().unlink(missing_ok=True)
 
+def is_watcher_online() -> bool:
+    """Whether a watcher process is alive; while it is, it is the only process writing the index."""
+    pid_file = get_pid_file()
+    if not pid_file.exists(): return False
+    try:
+        return is_pid_alive(int(pid_file.read_text()))
+    except (ValueError, FileNotFoundError): return False
+
+# ─── Scheduled Vacuum ─────────────────────────────────────────────────────────
+
+def start_vacuum_if_due(running: threading.Thread = None) -> threading.Thread:
+    """Runs a due (or requested) vacuum in the background so sorting carries on meanwhile."""
+    if (running and running.is_alive()) or not vacuum_due():
+        return running
+    logger = logging.getLogger('watcher_debug')
+
+    def run():
+        try:
+            report = vacuum(verify_hashes=bool(get_index_settings()["index_vacuum_verify_hashes"]))
+            reclaimed = sum(row["vectors_before"] - row["vectors_after"] for row in report)
+            logger.info(f"Vacuum finished: {reclaimed} vector(s) reclaimed across {len(report)} shard(s).")
+        except Exception as e:
+            logger.error(f"Vacuum failed: {e}", exc_info=True)
+
+    thread = threading.Thread(target=run, name="index-vacuum", daemon=True)
+    thread.start()
+    return thread
+
+# ─── Model Switch ─────────────────────────────────────────────────────────────
+
+def start_reembed_if_pending(running: threading.Thread, stop: threading.Event) -> threading.Thread:
+    """Runs one low-priority re-embedding pass toward a pending model while the old index keeps serving."""
+    if (running and running.is_alive()) or not pending_model():
+        return running
+    logger = logging.getLogger('watcher_debug')
+
+    def run():
+        try:
+            result = run_migration(stop, background=True)
+            if result and "replayed" in result:
+                notify_system_event("Model Switched", f"Now sorting with {result['model']}.")
+        except Exception as e:
+            logger.error(f"Re-embedding failed: {e}", exc_info=True)
+
+    thread = threading.Thread(target=run, name="index-reembed", daemon=True)
+    thread.start()
+    return thread
+
 # ─── Main Watcher Loop ────────────────────────────────────────────────────────
 
 def watcher_loop(poll_interval: float = 3.0):
@@ -64,11 +120,28 @@ def watcher_loop(poll_interval: float = 3.0):
         logger.error(e)
         return
 
+    # With an index server running, it owns the index (and its upkeep); the watcher
+    # only detects files and sends its calls there.
+    sharded_index = get_sharded_index()
+    if get_backend() is not None:
+        logger.info("Using the index server.")
+    else:
+        # Load every shard once; every sort after this hits memory only.
+        sharded_index.load()
+        try:
+            for row in verify_index(repair=True):
+                if row["missing"] or row["stray_vectors"] or row["recovered"] != "-":
+                    logger.warning(f"Index repair on shard {row['shard']}: {row}")
+        except Exception as e:
+            logger.error(f"Index integrity check failed: {e}", exc_info=True)
+
     notify_system_event("Watcher Online", "Monitoring for new files.")
     
     watch_dirs = get_watch_paths()
     seen_files = set()
     boot_time = time.time()
+    vacuum_thread = None
+    reembed_thread, reembed_stop = None, threading.Event()
 
     try:
         while True: # The launcher controls the lifecycle now.
@@ -91,9 +164,27 @@ def watcher_loop(poll_interval: float = 3.0):
                         notify_system_event("Watcher Error", f"Failed to process {file_path.name}: {e}")
                         logger.error(f"ERROR delegating file {file_path.name}: {e}", exc_info=True)
             time.sleep(poll_interval)
+            # Corrections made in the menu while this watcher owns the shards
+            if apply_requested_corrections():
+                logger.info("Applied queued correction(s).")
+            if get_backend() is not None:
+                continue
+            # Picks up shards added, dropped or rebuilt by other processes
+            sharded_index.refresh()
+            # Vacuum and re-embedding both walk every shard; never run them together.
+            if not (reembed_thread and reembed_thread.is_alive()):
+                vacuum_thread = start_vacuum_if_due(vacuum_thread)
+            if not (vacuum_thread and vacuum_thread.is_alive()):
+                reembed_thread = start_reembed_if_pending(reembed_thread, reembed_stop)
     except KeyboardInterrupt:
         logger.info("Interrupted by user.")
     finally:
+        if vacuum_thread:
+            vacuum_thread.join()
+        if reembed_thread:
+            reembed_stop.set()  # the next run resumes where this one stopped
+            reembed_thread.join()
+        sharded_index.close()
         clear_pid()
         notify_system_event("Watcher Offline", "Watcher has stopped.")
         logger.info("Stopped and offline.")
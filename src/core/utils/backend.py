@@ -0,0 +1,251 @@
+# [backend.py] — Where embedding, search and index writes run: in-process or on the index server
+
+import base64
+import json
+import logging
+import socket
+import struct
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from src.core.utils.paths import get_index_settings, get_server_socket_path
+
+# --- Logger Setup ---
+logger = logging.getLogger(__name__)
+
+# --- Constants ---
+_HEADER = struct.Struct(">I")  # every message is a 4-byte big-endian length, then UTF-8 JSON
+_SETTINGS_TTL = 5.0  # seconds between re-reads of the index_server setting
+_RETRY_AFTER = 10.0  # seconds a client serves locally after losing the server
+
+
+class BackendUnavailable(ConnectionError):
+    pass
+
+
+# --- Wire Format ---
+# Arrays travel as base64 float32 so a 384-dim chunk costs ~2 KB instead of ~8 KB of JSON.
+def _encode_value(value: Any) -> Any:
+    if isinstance(value, np.ndarray):
+        array = np.ascontiguousarray(value, dtype=np.float32)
+        return {"__ndarray__": base64.b64encode(array.tobytes()).decode("ascii"), "shape": list(array.shape)}
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Cannot encode {type(value).__name__}")
+
+
+def _decode_value(obj: Dict[str, Any]) -> Any:
+    if "__ndarray__" in obj:
+        return np.frombuffer(base64.b64decode(obj["__ndarray__"]), dtype=np.float32).reshape(obj["shape"])
+    return obj
+
+
+def send_message(sock: socket.socket, message: Dict[str, Any]) -> None:
+    body = json.dumps(message, default=_encode_value).encode("utf-8")
+    sock.sendall(_HEADER.pack(len(body)) + body)
+
+
+def recv_message(sock: socket.socket) -> Optional[Dict[str, Any]]:
+    """Reads one message, or returns None when the peer closed the connection."""
+    header = _recv_exact(sock, _HEADER.size)
+    if header is None:
+        return None
+    body = _recv_exact(sock, _HEADER.unpack(header)[0])
+    if body is None:
+        raise BackendUnavailable("Connection closed mid-message")
+    return json.loads(body.decode("utf-8"), object_hook=_decode_value)
+
+
+def _recv_exact(sock: socket.socket, size: int) -> Optional[bytes]:
+    data = bytearray()
+    while len(data) < size:
+        part = sock.recv(size - len(data))
+        if not part:
+            return None
+        data += part
+    return bytes(data)
+
+
+# --- Backends ---
+class LocalBackend:
+    """
+    Runs every call in this process against the process-wide sharded index and
+    model. The index server serves requests with one; tests can use one as a
+    stand-in for the server.
+    """
+
+    def embed(self, chunks: List[str]) -> np.ndarray:
+        from src.core.utils.processor import _encode
+        return np.asarray(_encode(chunks), dtype=np.float32)
+
+    def embed_many(self, batches: Sequence[List[str]]) -> List[np.ndarray]:
+        """Embeds several callers' chunks with a single forward pass."""
+        flat = [chunk for chunks in batches for chunk in chunks]
+        vectors = self.embed(flat) if flat else np.zeros((0, 0), dtype=np.float32)
+        results, offset = [], 0
+        for chunks in batches:
+            results.append(vectors[offset:offset + len(chunks)])
+            offset += len(chunks)
+        return results
+
+    def search(self, query_array: np.ndarray, top_k: int, top_folders: Optional[int] = None,
+               folders: Optional[Sequence[str]] = None) -> List[Dict[str, Any]]:
+        return self.search_many([query_array], top_k, top_folders, folders)[0]
+
+    def search_many(self, query_arrays: Sequence[np.ndarray], top_k: int, top_folders: Optional[int] = None,
+                    folders: Optional[Sequence[str]] = None) -> List[List[Dict[str, Any]]]:
+        from src.core.utils.shards import get_sharded_index
+        return get_sharded_index().load().search_many(query_arrays, top_k, top_folders, folders)
+
+    def search_files(self, query_array: np.ndarray, top_k: int) -> List[Dict[str, Any]]:
+        return self.search_files_many([query_array], top_k)[0]
+
+    def search_files_many(self, query_arrays: Sequence[np.ndarray], top_k: int) -> List[List[Dict[str, Any]]]:
+        from src.core.utils.shards import get_sharded_index
+        return get_sharded_index().load().search_files_many(query_arrays, top_k)
+
+    def classify(self, processed_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Scores the folders for an already-embedded file, as the sorter does."""
+        from src.core.pipelines.sorter import sort_file
+        return sort_file(processed_data)
+
+    def upsert(self, embedding_array: np.ndarray, file_metadata: Dict[str, Any]) -> int:
+        from src.core.utils.shards import get_sharded_index
+        return get_sharded_index().load().upsert(np.asarray(embedding_array, dtype=np.float32), file_metadata)
+
+    def upsert_many(self, items: Sequence[Dict[str, Any]]) -> List[int]:
+        return [self.upsert(item["embeddings"], item["file_metadata"]) for item in items]
+
+    def delete(self, file_path: str) -> bool:
+        from src.core.utils.shards import get_sharded_index
+        return get_sharded_index().load().delete(file_path)
+
+    def relocate(self, old_path: str, file_metadata: Dict[str, Any]) -> bool:
+        from src.core.utils.shards import get_sharded_index
+        return get_sharded_index().load().relocate(old_path, file_metadata)
+
+
+class RemoteBackend:
+    """
+    Client of the index server over its Unix socket, with the same calls as
+    `LocalBackend`. Each thread keeps its own connection, so concurrent callers
+    reach the server concurrently and can share a batch there. If the server goes
+    away, calls fall back to a `LocalBackend` until it can be reached again.
+    """
+
+    def __init__(self, socket_path: Path):
+        self.socket_path = Path(socket_path)
+        self._local = threading.local()
+        self._fallback = LocalBackend()
+        self._down_until = 0.0
+
+    def _connection(self) -> socket.socket:
+        sock = getattr(self._local, "sock", None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(str(self.socket_path))
+            self._local.sock = sock
+        return sock
+
+    def _drop_connection(self) -> None:
+        sock = getattr(self._local, "sock", None)
+        self._local.sock = None
+        if sock is not None:
+            sock.close()
+
+    def call(self, op: str, **args: Any) -> Any:
+        if time.monotonic() < self._down_until:
+            return getattr(self._fallback, op)(**args)
+        try:
+            sock = self._connection()
+            send_message(sock, {"op": op, "args": args})
+            reply = recv_message(sock)
+            if reply is None:
+                raise BackendUnavailable("Server closed the connection")
+        except OSError as e:
+            self._drop_connection()
+            self._down_until = time.monotonic() + _RETRY_AFTER
+            logger.warning(f"[Backend] Index server unreachable ({repr(e)}); serving locally for now.")
+            return getattr(self._fallback, op)(**args)
+        if not reply.get("ok"):
+            raise RuntimeError(f"[Backend] Index server failed {op}: {reply.get('error')}")
+        return reply["result"]
+
+    def embed(self, chunks: List[str]) -> np.ndarray:
+        return np.asarray(self.call("embed", chunks=chunks), dtype=np.float32)
+
+    def embed_many(self, batches: Sequence[List[str]]) -> List[np.ndarray]:
+        return [np.asarray(v, dtype=np.float32) for v in self.call("embed_many", batches=list(batches))]
+
+    def search(self, query_array: np.ndarray, top_k: int, top_folders: Optional[int] = None,
+               folders: Optional[Sequence[str]] = None) -> List[Dict[str, Any]]:
+        return self.call("search", query_array=np.asarray(query_array), top_k=top_k, top_folders=top_folders,
+                         folders=list(folders) if folders is not None else None)
+
+    def search_many(self, query_arrays: Sequence[np.ndarray], top_k: int, top_folders: Optional[int] = None,
+                    folders: Optional[Sequence[str]] = None) -> List[List[Dict[str, Any]]]:
+        return self.call("search_many", query_arrays=[np.asarray(q) for q in query_arrays], top_k=top_k,
+                         top_folders=top_folders, folders=list(folders) if folders is not None else None)
+
+    def search_files(self, query_array: np.ndarray, top_k: int) -> List[Dict[str, Any]]:
+        return self.call("search_files", query_array=np.asarray(query_array), top_k=top_k)
+
+    def search_files_many(self, query_arrays: Sequence[np.ndarray], top_k: int) -> List[List[Dict[str, Any]]]:
+        return self.call("search_files_many", query_arrays=[np.asarray(q) for q in query_arrays], top_k=top_k)
+
+    def classify(self, processed_data: Dict[str, Any]) -> Dict[str, Any]:
+        embeddings = processed_data["embeddings"]
+        sent = {**processed_data, "embeddings": np.asarray(embeddings, dtype=np.float32)}
+        return {**self.call("classify", processed_data=sent), "embeddings": embeddings}
+
+    def upsert(self, embedding_array: np.ndarray, file_metadata: Dict[str, Any]) -> int:
+        return self.call("upsert", embedding_array=np.asarray(embedding_array), file_metadata=file_metadata)
+
+    def upsert_many(self, items: Sequence[Dict[str, Any]]) -> List[int]:
+        return self.call("upsert_many", items=[{**item, "embeddings": np.asarray(item["embeddings"])}
+                                               for item in items])
+
+    def delete(self, file_path: str) -> bool:
+        return self.call("delete", file_path=file_path)
+
+    def relocate(self, old_path: str, file_metadata: Dict[str, Any]) -> bool:
+        return self.call("relocate", old_path=old_path, file_metadata=file_metadata)
+
+
+# --- Backend Selection ---
+_override = None  # set by the index server (and tests) for the whole process
+_remote: Optional[RemoteBackend] = None
+_checked_at = 0.0
+_selection_lock = threading.Lock()
+
+
+def set_backend(backend) -> None:
+    """Routes every embed/search/index call of this process through `backend` (None restores the default)."""
+    global _override
+    _override = backend
+
+
+def get_backend():
+    """
+    The backend calls should go through, or None to run them directly in-process.
+    With `index_server` on and the server's socket present, that is the server.
+    """
+    global _remote, _checked_at
+    if _override is not None:
+        return _override
+    with _selection_lock:
+        now = time.monotonic()
+        if now - _checked_at >= _SETTINGS_TTL:
+            _checked_at = now
+            socket_path = None
+            if bool(get_index_settings()["index_server"]) and hasattr(socket, "AF_UNIX"):
+                socket_path = get_server_socket_path()
+            if socket_path is None or not socket_path.exists():
+                _remote = None
+            elif _remote is None or _remote.socket_path != socket_path:
+                _remote = RemoteBackend(socket_path)
+        return _remote
@@ -0,0 +1,139 @@
+# [cachestore.py] — Size-bounded SQLite store with LRU eviction, the base of the on-disk caches
+
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Generic, Optional, TypeVar
+
+# --- Logger Setup ---
+logger = logging.getLogger(__name__)
+
+_EVICT_TO = 0.9  # eviction frees space down to this share of the cap, not just below it
+
+
+class CacheStore:
+    """
+    One SQLite file (WAL mode, so processes can share it) whose `entries` table has
+    a `KEY_COLUMN`, a `size` in bytes and a `last_used` time. Once the entries
+    outgrow `max_bytes`, the least recently used ones are evicted.
+
+    Subclasses supply the schema and how entries are keyed, written and read.
+    """
+
+    TAG = "Cache"
+    SCHEMA = ""
+    KEY_COLUMN = "key"
+    CLEARED_TABLES = ("entries",)
+
+    def __init__(self, path: Path, max_bytes: int):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max(0, int(max_bytes))
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(self.SCHEMA)
+        self._migrate()
+        self._conn.commit()
+        self.session = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def _migrate(self) -> None:
+        """Brings a store written by an older version up to SCHEMA (nothing by default)."""
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        self.session[name] += amount
+
+    def _touch(self, key: Any) -> None:
+        self._conn.execute(f"UPDATE entries SET last_used = ? WHERE {self.KEY_COLUMN} = ?", (time.time(), key))
+
+    # --- Eviction ---
+    def _total_bytes(self) -> int:
+        return int(self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0])
+
+    def _evict(self) -> None:
+        excess = self._total_bytes() - self.max_bytes
+        if excess <= 0:
+            return
+        excess += int(self.max_bytes * (1 - _EVICT_TO))
+        freed = evicted = 0
+        rows = self._conn.execute(f"SELECT {self.KEY_COLUMN}, size FROM entries ORDER BY last_used").fetchall()
+        for key, size in rows:
+            if freed >= excess:
+                break
+            self._conn.execute(f"DELETE FROM entries WHERE {self.KEY_COLUMN} = ?", (key,))
+            freed += size
+            evicted += 1
+        self._count("evictions", evicted)
+        logger.info(f"[{self.TAG}] Evicted {evicted} entr{'y' if evicted == 1 else 'ies'} ({freed / 1e6:.1f} MB)")
+
+    # --- Statistics ---
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        return {"entries": entries, "size_mb": size / 1e6, "max_mb": self.max_bytes / 1e6,
+                "session": dict(self.session)}
+
+    def clear(self) -> None:
+        with self._lock:
+            for table in self.CLEARED_TABLES:
+                self._conn.execute(f"DELETE FROM {table}")
+            self._conn.commit()
+            self._conn.execute("VACUUM")
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+# --- Process-wide Instance ---
+StoreT = TypeVar("StoreT", bound=CacheStore)
+
+
+class SharedCache(Generic[StoreT]):
+    """
+    The one instance of a cache this process uses, opened on first use. `get()`
+    returns None while the cache's `enabled_key` setting is off or it cannot be opened.
+    """
+
+    def __init__(self, tag: str, open_store: Callable[[], StoreT], settings: Callable[[], Dict[str, Any]],
+                 enabled_key: str):
+        self._tag = tag
+        self._open_store = open_store
+        self._settings = settings
+        self._enabled_key = enabled_key
+        self._lock = threading.Lock()
+        self.instance: Optional[StoreT] = None
+
+    def get(self) -> Optional[StoreT]:
+        if not self._settings()[self._enabled_key]:
+            return None
+        with self._lock:
+            if self.instance is None:
+                try:
+                    self.instance = self._open_store()
+                except sqlite3.Error as e:
+                    logger.warning(f"[{self._tag}] Cache unavailable, working without it: {repr(e)}")
+                    return None
+            return self.instance
+
+
+def run_cli(description: str, open_store: Callable[[], CacheStore]) -> None:
+    """Prints a cache's statistics, or empties it with --clear."""
+    import argparse
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--clear", action="store_true", help="Delete every cached entry.")
+    args = parser.parse_args()
+    store = open_store()
+    try:
+        if args.clear:
+            store.clear()
+            print("Cache cleared.")
+        else:
+            for key, value in store.stats().items():
+                if key != "session":
+                    print(f"{key:>10}: {value:.3f}" if isinstance(value, float) else f"{key:>10}: {value}")
+    finally:
+        store.close()
@@ -0,0 +1,152 @@
+# [embedcache.py] — Persistent embedding cache keyed by content hash, model and chunking
+
+import hashlib
+import logging
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from src.core.utils.cachestore import CacheStore, SharedCache, run_cli
+from src.core.utils.paths import get_embed_cache_path, get_embed_cache_settings
+
+# --- Logger Setup ---
+logger = logging.getLogger(__name__)
+
+
+def cache_key(content_hash: str, model_name: str, chunking: str) -> str:
+    return hashlib.sha256(f"{content_hash}|{model_name}|{chunking}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache(CacheStore):
+    """
+    Chunk embeddings of previously seen content. A rebuild, a duplicate copy or a
+    re-dropped file then costs only extraction and hashing, not a forward pass.
+
+    Each entry is written in its own transaction, so a crash loses at most the
+    entry being written.
+    """
+
+    TAG = "EmbedCache"
+    # One row per (content hash, model, chunking) key, holding the file's chunk vectors
+    # as one float32 blob and how many chunks it had before the budget cut; `counters`
+    # keeps the lifetime hit/miss/eviction totals across processes.
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS entries (
+        cache_key  TEXT PRIMARY KEY,
+        model_name TEXT NOT NULL,
+        num_rows   INTEGER NOT NULL,
+        dim        INTEGER NOT NULL,
+        vectors    BLOB NOT NULL,
+        chunks_total INTEGER,
+        size       INTEGER NOT NULL,
+        created_at REAL NOT NULL,
+        last_used  REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_entries_used ON entries(last_used);
+    CREATE TABLE IF NOT EXISTS counters (
+        name  TEXT PRIMARY KEY,
+        value INTEGER NOT NULL
+    );
+    """
+    KEY_COLUMN = "cache_key"
+    CLEARED_TABLES = ("entries", "counters")
+
+    def _migrate(self) -> None:
+        if "chunks_total" not in {r[1] for r in self._conn.execute("PRAGMA table_info(entries)")}:
+            self._conn.execute("ALTER TABLE entries ADD COLUMN chunks_total INTEGER")
+
+    # --- Lookups ---
+    def get(self, content_hash: str, model_name: str, chunking: str) -> Optional[np.ndarray]:
+        entry = self.get_entry(content_hash, model_name, chunking)
+        return entry[0] if entry is not None else None
+
+    def get_entry(self, content_hash: str, model_name: str,
+                  chunking: str) -> Optional[Tuple[np.ndarray, Optional[int]]]:
+        """The cached vectors and how many chunks the content had before the budget cut (None if not recorded)."""
+        key = cache_key(content_hash, model_name, chunking)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT num_rows, dim, vectors, chunks_total FROM entries WHERE cache_key = ?", (key,)).fetchone()
+            if row is None:
+                self._count("misses")
+                self._conn.commit()
+                return None
+            self._touch(key)
+            self._count("hits")
+            self._conn.commit()
+        num_rows, dim, blob, chunks_total = row
+        return np.frombuffer(blob, dtype=np.float32).reshape(num_rows, dim).copy(), chunks_total
+
+    def put(self, content_hash: str, model_name: str, chunking: str, vectors: Any,
+            chunks_total: Optional[int] = None) -> None:
+        array = np.ascontiguousarray(vectors, dtype=np.float32)
+        if array.ndim != 2 or array.shape[0] == 0:
+            return
+        blob = array.tobytes()
+        if self.max_bytes and len(blob) > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries "
+                "(cache_key, model_name, num_rows, dim, vectors, chunks_total, size, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (cache_key(content_hash, model_name, chunking), model_name, array.shape[0], array.shape[1],
+                 blob, chunks_total, len(blob), now, now))
+            if self.max_bytes:
+                self._evict()
+            self._conn.commit()
+
+    # --- Statistics ---
+    def _count(self, name: str, amount: int = 1) -> None:
+        super()._count(name, amount)
+        self._conn.execute(
+            "INSERT INTO counters (name, value) VALUES (?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value", (name, amount))
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        with self._lock:
+            totals = dict(self._conn.execute("SELECT name, value FROM counters").fetchall())
+        hits, misses = totals.get("hits", 0), totals.get("misses", 0)
+        stats.update({
+            "hits": hits,
+            "misses": misses,
+            "evictions": totals.get("evictions", 0),
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+        })
+        return stats
+
+
+# --- Process-wide Cache ---
+def _open() -> EmbeddingCache:
+    return EmbeddingCache(get_embed_cache_path(), int(float(get_embed_cache_settings()["embed_cache_max_mb"]) * 1e6))
+
+
+_shared: SharedCache[EmbeddingCache] = SharedCache("EmbedCache", _open, get_embed_cache_settings, "embed_cache_enabled")
+
+
+def get_embed_cache() -> Optional[EmbeddingCache]:
+    """The shared cache, or None when `embed_cache_enabled` is off or the cache cannot be opened."""
+    return _shared.get()
+
+
+def session_counts() -> Dict[str, int]:
+    """This process's hit/miss/eviction counts so far (all zero before the cache is first used)."""
+    cache = _shared.instance
+    return dict(cache.session) if cache is not None else {"hits": 0, "misses": 0, "evictions": 0}
+
+
+def log_stats(tag: str, since: Optional[Dict[str, int]] = None) -> None:
+    """Logs this process's cache activity, counted from the `session_counts()` snapshot `since`."""
+    now, since = session_counts(), since or {}
+    hits, misses, evictions = (now[k] - since.get(k, 0) for k in ("hits", "misses", "evictions"))
+    if hits + misses:
+        logger.info(f"[{tag}] Embedding cache: {hits}/{hits + misses} hit(s) "
+                    f"({100.0 * hits / (hits + misses):.0f}%), {evictions} eviction(s)")
+
+
+# --- CLI Entrypoint ---
+if __name__ == "__main__":
+    run_cli("Inspect or clear the embedding cache.", _open)
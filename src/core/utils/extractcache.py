@@ -0,0 +1,110 @@
+# [extractcache.py] — Compressed on-disk cache of extracted text, keyed by path, size and mtime
+
+import json
+import logging
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from src.core.utils.cachestore import CacheStore, SharedCache, run_cli
+from src.core.utils.paths import get_extract_cache_path, get_extract_cache_settings
+
+# --- Logger Setup ---
+logger = logging.getLogger(__name__)
+
+StatKey = Tuple[str, int, int]  # (resolved path, size, mtime_ns)
+_COMPRESS_LEVEL = 6
+
+
+class ExtractionCache(CacheStore):
+    """
+    Text extracted from documents whose parsing (pdfplumber above all) costs more
+    than embedding them. Entries are zlib-compressed; entries over `max_entry_bytes`
+    are not cached at all.
+    """
+
+    TAG = "ExtractCache"
+    # One row per resolved path. A row only counts when the file's size and mtime_ns
+    # (and the extractor version) still match; otherwise the lookup misses and the next
+    # write replaces it, so an edited file is re-parsed without any explicit invalidation.
+    # `info` holds what the parse skipped (e.g. pages left out by the page budget).
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS entries (
+        file_path  TEXT PRIMARY KEY,
+        file_size  INTEGER NOT NULL,
+        mtime_ns   INTEGER NOT NULL,
+        extractor  TEXT NOT NULL,
+        text       BLOB NOT NULL,
+        info       TEXT,
+        size       INTEGER NOT NULL,
+        last_used  REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_entries_used ON entries(last_used);
+    """
+    KEY_COLUMN = "file_path"
+
+    def __init__(self, path: Path, max_bytes: int, max_entry_bytes: int):
+        super().__init__(path, max_bytes)
+        self.max_entry_bytes = max(0, int(max_entry_bytes))
+
+    def _migrate(self) -> None:
+        if "info" not in {r[1] for r in self._conn.execute("PRAGMA table_info(entries)")}:
+            self._conn.execute("ALTER TABLE entries ADD COLUMN info TEXT")
+
+    @staticmethod
+    def stat_key(path: Path) -> StatKey:
+        """The file's identity for the cache; take it before parsing, so an edit made meanwhile is not masked."""
+        stat = Path(path).stat()
+        return str(Path(path).resolve()), stat.st_size, stat.st_mtime_ns
+
+    def get(self, key: StatKey, extractor: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """The cached (text, info) of the file, or None if it was not cached under this stat and extractor."""
+        file_path, file_size, mtime_ns = key
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT text, info FROM entries WHERE file_path = ? AND file_size = ? AND mtime_ns = ? AND extractor = ?",
+                (file_path, file_size, mtime_ns, extractor)).fetchone()
+            if row is None:
+                self._count("misses")
+                return None
+            self._touch(file_path)
+            self._conn.commit()
+            self._count("hits")
+        return zlib.decompress(row[0]).decode("utf-8"), json.loads(row[1]) if row[1] else {}
+
+    def put(self, key: StatKey, extractor: str, text: str, info: Optional[Dict[str, Any]] = None) -> None:
+        file_path, file_size, mtime_ns = key
+        blob = zlib.compress(text.encode("utf-8"), _COMPRESS_LEVEL)
+        if self.max_entry_bytes and len(blob) > self.max_entry_bytes:
+            return
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (file_path, file_size, mtime_ns, extractor, text, info, size, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (file_path, file_size, mtime_ns, extractor, blob, json.dumps(info) if info else None, len(blob),
+                 time.time()))
+            if self.max_bytes:
+                self._evict()
+            self._conn.commit()
+
+
+# --- Process-wide Cache ---
+def _open() -> ExtractionCache:
+    settings = get_extract_cache_settings()
+    return ExtractionCache(get_extract_cache_path(), int(float(settings["extract_cache_max_mb"]) * 1e6),
+                           int(float(settings["extract_cache_max_entry_mb"]) * 1e6))
+
+
+_shared: SharedCache[ExtractionCache] = SharedCache("ExtractCache", _open, get_extract_cache_settings,
+                                                    "extract_cache_enabled")
+
+
+def get_extract_cache() -> Optional[ExtractionCache]:
+    """The shared cache, or None when `extract_cache_enabled` is off or the cache cannot be opened."""
+    return _shared.get()
+
+
+# --- CLI Entrypoint ---
+if __name__ == "__main__":
+    run_cli("Inspect or clear the extracted-text cache.", _open)
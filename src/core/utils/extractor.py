@@ -0,0 +1,208 @@
+# [extractor.py] — Pluggable text extractors per file type, fastest first, with per-file fallback
+
+import csv
+import logging
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+from src.core.utils.paths import get_extractor_settings
+
+# --- Logger Setup ---
+logger = logging.getLogger(__name__)
+
+# Parser libraries are imported inside their extractor, so a missing optional one
+# (PyMuPDF, pypdf) only removes that extractor instead of breaking the processor.
+
+
+class Extraction(NamedTuple):
+    text: str
+    pages_total: int = 0  # 0 for formats without pages
+    pages_read: int = 0
+    backend: str = ""
+    capped_by: str = ""   # the cap ("bytes", "rows", "cells") that stopped the reader, if any
+
+
+class Limits(NamedTuple):
+    """How much of one file a streaming reader takes in (0 = no cap)."""
+    max_bytes: int = 0  # of text and CSV files
+    max_rows: int = 0   # of CSV files and whole workbooks
+    max_cells: int = 0  # non-empty workbook cells
+
+
+# An extractor reads one file. `pick(n)` chooses which of its n pages to read;
+# `limits` caps what a streaming reader takes in, so memory stays flat.
+Extractor = Callable[[Path, Callable[[int], List[int]], Limits], Extraction]
+
+_REGISTRY: Dict[str, Dict[str, Extractor]] = {}
+_unavailable: Set[str] = set()  # extractors whose library is not installed
+
+
+def register_extractor(file_type: str, name: str) -> Callable[[Extractor], Extractor]:
+    """Registers an extractor for `file_type`; earlier registrations are tried first unless configured otherwise."""
+    def decorator(func: Extractor) -> Extractor:
+        _REGISTRY.setdefault(file_type, {})[name] = func
+        return func
+    return decorator
+
+
+def _all_pages(num_pages: int) -> List[int]:
+    return list(range(num_pages))
+
+
+def _read_text_capped(path: Path, max_bytes: int) -> Tuple[str, bool]:
+    """Decodes at most `max_bytes` of a file (newlines normalized as `read_text` does); True if it was cut."""
+    with path.open("rb") as f:
+        data = f.read(max_bytes + 1) if max_bytes else f.read()
+    capped = bool(max_bytes) and len(data) > max_bytes
+    text = data[:max_bytes].decode("utf-8", errors="ignore") if capped else data.decode("utf-8", errors="ignore")
+    return text.replace("\r\n", "\n").replace("\r", "\n"), capped
+
+
+# --- PDF ---
+@register_extractor("pdf", "pymupdf")
+def _pdf_pymupdf(path: Path, pick: Callable[[int], List[int]], limits: Limits) -> Extraction:
+    import fitz  # PyMuPDF
+    with fitz.open(str(path)) as doc:
+        total = doc.page_count
+        keep = pick(total)
+        text = "\n".join(doc.load_page(i).get_text() for i in keep)
+    return Extraction(text, total, len(keep))
+
+
+@register_extractor("pdf", "pdfplumber")
+def _pdf_pdfplumber(path: Path, pick: Callable[[int], List[int]], limits: Limits) -> Extraction:
+    import pdfplumber
+    with pdfplumber.open(path) as pdf:
+        keep = pick(len(pdf.pages))
+        text = "\n".join(pdf.pages[i].extract_text() or "" for i in keep)
+        return Extraction(text, len(pdf.pages), len(keep))
+
+
+@register_extractor("pdf", "pypdf")
+def _pdf_pypdf(path: Path, pick: Callable[[int], List[int]], limits: Limits) -> Extraction:
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        from PyPDF2 import PdfReader
+    reader = PdfReader(str(path))
+    keep = pick(len(reader.pages))
+    text = "\n".join(reader.pages[i].extract_text() or "" for i in keep)
+    return Extraction(text, len(reader.pages), len(keep))
+
+
+# --- Office & Plain Formats ---
+@register_extractor("docx", "python-docx")
+def _docx(path: Path, pick: Callable[[int], List[int]], limits: Limits) -> Extraction:
+    import docx
+    doc = docx.Document(path)
+    return Extraction("\n".join(p.text for p in doc.paragraphs))
+
+
+@register_extractor("pptx", "python-pptx")
+def _pptx(path: Path, pick: Callable[[int], List[int]], limits: Limits) -> Extraction:
+    from pptx import Presentation
+    slides = list(Presentation(path).slides)
+    keep = pick(len(slides))
+    text = "\n".join(shape.text for i in keep for shape in slides[i].shapes if hasattr(shape, "text"))
+    return Extraction(text, len(slides), len(keep))
+
+
+@register_extractor("xlsx", "openpyxl")
+def _xlsx(path: Path, pick: Callable[[int], List[int]], limits: Limits) -> Extraction:
+    from openpyxl import load_workbook
+    # Read-only mode streams rows from the archive instead of loading every sheet.
+    wb = load_workbook(path, read_only=True, data_only=True)
+    cells: List[str] = []
+    rows, capped_by = 0, ""
+    try:
+        for ws in wb.worksheets:
+            for row in ws.iter_rows(values_only=True):
+                if limits.max_rows and rows >= limits.max_rows:
+                    capped_by = "rows"
+                    break
+                rows += 1
+                cells.extend(str(value) for value in row if value is not None)
+                if limits.max_cells and len(cells) >= limits.max_cells:
+                    del cells[limits.max_cells:]
+                    capped_by = "cells"
+                    break
+            if capped_by:
+                break
+    finally:
+        wb.close()
+    return Extraction("\n".join(cells), capped_by=capped_by)
+
+
+@register_extractor("csv", "csv")
+def _csv(path: Path, pick: Callable[[int], List[int]], limits: Limits) -> Extraction:
+    read, capped = 0, False
+
+    def lines(f) -> Iterator[str]:
+        # Feeds the reader line by line and stops before the line that crosses the byte cap.
+        nonlocal read, capped
+        while True:
+            line = f.readline(limits.max_bytes - read + 1) if limits.max_bytes else f.readline()
+            if not line:
+                return
+            read += len(line.encode("utf-8"))
+            if limits.max_bytes and read > limits.max_bytes:
+                capped = True
+                return
+            yield line
+
+    rows = []
+    with path.open("r", encoding="utf-8", errors="ignore") as f:
+        for row in csv.reader(lines(f)):
+            if limits.max_rows and len(rows) >= limits.max_rows:
+                return Extraction("\n".join(rows), capped_by="rows")
+            rows.append(" ".join(field.strip() for field in row))
+    return Extraction("\n".join(rows), capped_by="bytes" if capped else "")
+
+
+@register_extractor("txt", "text")
+@register_extractor("md", "text")
+def _text(path: Path, pick: Callable[[int], List[int]], limits: Limits) -> Extraction:
+    text, capped = _read_text_capped(path, limits.max_bytes)
+    return Extraction(text, capped_by="bytes" if capped else "")
+
+
+# --- Dispatch ---
+def extractors_for(file_type: str, include_unavailable: bool = False) -> List[str]:
+    """Extractor names for `file_type` in the order they are tried (`extract_order` in config.json first)."""
+    registered = list(_REGISTRY.get(file_type, {}))
+    preferred = [n for n in get_extractor_settings()["extract_order"].get(file_type, []) if n in registered]
+    ordered = preferred + [n for n in registered if n not in preferred]
+    return [n for n in ordered if include_unavailable or f"{file_type}:{n}" not in _unavailable]
+
+
+def run_extractor(path: Path, file_type: str, name: str, pick: Optional[Callable[[int], List[int]]] = None,
+                  limits: Optional[Limits] = None) -> Extraction:
+    """Runs one named extractor; raises ImportError when its library is missing."""
+    result = _REGISTRY[file_type][name](Path(path), pick or _all_pages, limits or Limits())
+    return result._replace(backend=name)
+
+
+def extract(path: Path, file_type: str, pick: Optional[Callable[[int], List[int]]] = None,
+            limits: Optional[Limits] = None) -> Extraction:
+    """
+    Extracts a file with the first extractor for its type that succeeds. A failure
+    falls back to the next one for this file only; an extractor whose library is
+    missing is skipped from then on. Raises the last error if every extractor fails.
+    """
+    names = extractors_for(file_type)
+    if not names:
+        if file_type in _REGISTRY:
+            raise RuntimeError(f"[Extractor] No installed extractor for .{file_type} files")
+        return Extraction("")
+    error: Optional[Exception] = None
+    for name in names:
+        try:
+            return run_extractor(path, file_type, name, pick, limits)
+        except ImportError as e:
+            _unavailable.add(f"{file_type}:{name}")
+            logger.info(f"[Extractor] {name} is not installed ({e.name}); using the next {file_type} extractor.")
+            error = e
+        except Exception as e:
+            logger.warning(f"[Extractor] {name} failed on {Path(path).name}: {repr(e)}")
+            error = e
+    raise error
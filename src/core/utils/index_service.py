@@ -0,0 +1,1134 @@
+# [index_service.py] — Long-lived, in-memory FAISS index + metadata store owner
+
+import atexit
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+
+from src.core.utils.indexer import (
+    MAX_CHUNKS_PER_FILE,
+    STORAGE_FLAT,
+    TIER_FLAT,
+    build_faiss_index,
+    desired_storage,
+    desired_tier,
+    file_id_of,
+    index_storage,
+    index_tier,
+    load_faiss_index,
+    load_metadata_store,
+    make_search_params,
+    make_vector_ids,
+    migrate_legacy_store,
+    new_faiss_index,
+    normalize_vectors,
+    supports_mmap,
+    supports_removal,
+)
+from src.core.utils.lockfile import LockFile, LockHeld
+from src.core.utils.metastore import MetadataStore
+from src.core.utils.paths import (
+    DEFAULT_MODEL,
+    get_active_model,
+    get_faiss_index_path,
+    get_faiss_metadata_path,
+    get_index_settings,
+    get_legacy_faiss_metadata_path,
+    normalize_path,
+)
+from src.core.utils.processor import get_model_dim
+from src.core.utils.projection import Projection, active_projection_tag, get_projection
+from src.core.utils.wal import WriteAheadLog
+
+# --- Logger Setup ---
+logger = logging.getLogger(__name__)
+
+# --- Constants ---
+DEFAULT_FLUSH_INTERVAL = 5.0  # seconds between checkpointer wake-ups
+TOMBSTONE_REBUILD_RATIO = 0.1  # rebuild an HNSW index once this share of it is masked
+REMOVAL_LOG_SECONDS = 7 * 24 * 3600  # how long removed paths are remembered for a rebuild in progress
+
+
+class IndexService:
+    """
+    Holds the FAISS index in memory and the file metadata in a SQLite store for the
+    lifetime of a process.
+
+    Every mutation is first appended to an fsync'd write-ahead log next to the index,
+    then applied in memory. A background checkpointer folds the log into a fresh
+    index snapshot once it grows past a size or age threshold, and on startup any
+    records newer than the last checkpoint are replayed. The same thread moves the
+    index between the flat/HNSW/IVF tiers as the corpus grows or shrinks.
+
+    A small centroid index over `parent_folder_path` (kept in step with the store's
+    folder sums) lets large searches visit only the most promising folders, and a
+    file index holding one pooled (mean chunk) vector per file serves file-vs-file
+    searches with a single row per document.
+
+    With `index_mmap` the snapshot is memory-mapped read-only and never mutated:
+    new vectors go to a small heap "delta" index and removals become tombstones,
+    both folded into the next snapshot at checkpoint time.
+
+    Every snapshot write is recorded in a manifest (size, CRC32, vector count). On
+    load a snapshot or store that fails its check is quarantined instead of trusted,
+    and `verify()` finds the files whose vectors are missing so only those are
+    re-embedded.
+
+    An index created while a PCA projection is active lives in that projection's
+    space for good (its tag is kept in the store): full-dimension embeddings are
+    projected on upsert and search, so callers never see the reduced vectors.
+    Likewise the store records the encoder model its vectors come from.
+    """
+
+    def __init__(
+        self,
+        index_path: Path,
+        metadata_path: Path,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+        legacy_metadata_path: Optional[Path] = None,
+        model_name: Optional[str] = None,
+    ):
+        self.index_path = Path(index_path)
+        self.metadata_path = Path(metadata_path)
+        self.wal_path = self.index_path.with_name(self.index_path.stem + ".wal")
+        self.manifest_path = self.index_path.with_name(self.index_path.stem + ".manifest.json")
+        # Held from load to close, so a second process serving these files fails loudly.
+        self._writer = LockFile(writer_lock_path(self.index_path))
+        self.legacy_metadata_path = Path(legacy_metadata_path) if legacy_metadata_path else None
+        self.flush_interval = flush_interval
+        self.model_name = model_name or get_active_model()  # replaced by the store's own record on load
+
+        self._lock = threading.RLock()
+        self._index: Optional[faiss.Index] = None
+        self._delta: Optional[faiss.Index] = None  # vectors added since the snapshot (mmap mode)
+        self._use_mmap = False
+        self._mapped: Optional[faiss.Index] = None  # the snapshot as mapped from index_path
+        self._store: Optional[MetadataStore] = None
+        self._projection: Optional[Projection] = None
+        self._wal: Optional[WriteAheadLog] = None
+        self._tombstones: set = set()
+        self._pending_ops: Optional[List[tuple]] = None  # mutations made during a re-tier
+        self._folder_index: Optional[faiss.Index] = None  # folder centroids, keyed by folder id
+        self._folder_ids: Dict[str, int] = {}
+        self._folder_paths: Dict[int, str] = {}
+        self._file_index: Optional[faiss.Index] = None  # pooled file vectors, keyed by file id
+        self._settings: Dict[str, Any] = get_index_settings()
+        self._dirty = False  # snapshot-level change (migration, re-tier) not covered by the WAL
+        self._stop = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+        self.recovered: List[str] = []  # parts quarantined by the last load, until verify() reports them
+
+    # --- Lifecycle ---
+    @property
+    def loaded(self) -> bool:
+        return self._index is not None
+
+    def load(self) -> "IndexService":
+        """
+        Reads the snapshot, replays the WAL on top of it and starts the checkpointer.
+        Raises LockHeld when another process already serves these files: two writers
+        would replay and rotate the same WAL and overwrite each other's checkpoints.
+        """
+        with self._lock:
+            if self.loaded:
+                return self
+            try:
+                self._writer.acquire()
+            except LockHeld as e:
+                raise LockHeld(f"[IndexService] {self.index_path} is already open in another process ({e}); "
+                               "only one process may serve an index at a time.") from None
+            try:
+                self._load()
+            except BaseException:
+                self._writer.release()
+                raise
+
+        if self._flusher is None or not self._flusher.is_alive():
+            self._stop.clear()
+            self._flusher = threading.Thread(target=self._flush_loop, name="index-checkpointer", daemon=True)
+            self._flusher.start()
+        return self
+
+    def _load(self) -> None:
+        self._settings = get_index_settings()
+        self._use_mmap = bool(self._settings["index_mmap"])
+        self.recovered = []
+        store = self._open_store()
+        self.model_name = self._resolve_model(store)
+        self._projection = self._resolve_projection(store)
+        dim = self._projection.dim if self._projection else get_model_dim(self.model_name)
+        index = self._open_snapshot(dim)
+        loaded_index = index
+        self._dirty = False
+        is_bare_flat = not isinstance(index, faiss.IndexIDMap2) and index_tier(index) == TIER_FLAT
+
+        legacy = self.legacy_metadata_path
+        if store.count() == 0 and legacy is not None and legacy.exists():
+            data = load_metadata_store(legacy)
+            if isinstance(data, list) or is_bare_flat:
+                index, data = migrate_legacy_store(index, data if isinstance(data, list) else [])
+            store.import_legacy(data)
+            if legacy.exists():  # a corrupt file has already been set aside
+                legacy.rename(legacy.with_name(legacy.name + ".migrated"))
+            else:
+                self.recovered.append("legacy metadata")
+            self._dirty = True
+        elif is_bare_flat:
+            index, _ = migrate_legacy_store(index, [])
+            self._dirty = True
+
+        self._index = index
+        self._delta = new_faiss_index(index.d)
+        self._store = store
+        self._tombstones = set(store.get_value("tombstones", []))
+        if self.recovered:
+            self._dirty = True  # write a sound snapshot at the next checkpoint
+
+        if self._index.metric_type != faiss.METRIC_INNER_PRODUCT:
+            # Indexes written before the cosine switch hold raw L2 vectors.
+            ids, vectors = self.export_vectors()
+            tier = desired_tier(len(ids), TIER_FLAT, self._settings)
+            storage = desired_storage(len(ids), STORAGE_FLAT, self._settings)
+            self._index = build_faiss_index(tier, self._index.d, normalize_vectors(vectors), ids,
+                                            self._settings, storage)
+            self._tombstones = set()
+            self._dirty = True
+
+        is_mapped = self._use_mmap and self._index is loaded_index and self.index_path.exists()
+        self._mapped = self._index if is_mapped and supports_mmap(self._index) else None
+
+        self._wal = WriteAheadLog(self.wal_path)
+        checkpoint_seq = int(store.get_value("checkpoint_seq", 0))
+        self._wal.last_seq = max(self._wal.last_seq, checkpoint_seq)
+        replayed = 0
+        for record, vectors in self._wal.replay(checkpoint_seq):
+            self._apply(record, vectors, replaying=True)
+            replayed += 1
+        if replayed:
+            logger.info(f"[IndexService] Replayed {replayed} WAL record(s) after seq {checkpoint_seq}")
+            self._dirty = True
+
+        if not store.get_value("folder_summaries_ready", False):
+            self._backfill_folder_summaries()
+            self._dirty = True
+        self._build_folder_index()
+        self._build_file_index()
+
+        logger.info(f"[IndexService] Loaded {self._ntotal()} vector(s) for "
+                    f"{store.count()} file(s)")
+
+    # --- Integrity ---
+    def _open_store(self) -> MetadataStore:
+        """Opens the metadata store; a file failing SQLite's quick check is quarantined and recreated."""
+        try:
+            store = MetadataStore(self.metadata_path)
+            if store.integrity_ok():
+                return store
+            store.close()
+            problem = "quick_check failed"
+        except sqlite3.DatabaseError as e:
+            problem = repr(e)
+        logger.error(f"[IndexService] Metadata store {self.metadata_path.name} is corrupt ({problem}); "
+                     "quarantined. Its index must be rebuilt from the files on disk.")
+        for path in self.metadata_path.parent.glob(self.metadata_path.name + "*"):
+            _quarantine(path)
+        # Vectors without their metadata rows cannot be attributed to files.
+        _quarantine(self.index_path)
+        self.manifest_path.unlink(missing_ok=True)
+        self.recovered.append("store")
+        return MetadataStore(self.metadata_path)
+
+    def _open_snapshot(self, dim: int) -> faiss.Index:
+        """Loads the snapshot after checking it against the manifest; a bad one is replaced by an empty index."""
+        manifest = self._read_manifest()
+        entries = [e for e in (manifest.get("current"), manifest.get("pending")) if e]
+        problem = None
+        if entries and self.index_path.exists():
+            size, crc = _file_crc32(self.index_path)
+            matched = [e for e in entries if (e["index_bytes"], e["index_crc32"]) == (size, crc)]
+            if not matched:
+                problem = "checksum mismatch"
+        if problem is None:
+            try:
+                index = load_faiss_index(self.index_path, dim, mmap=self._use_mmap)
+            except RuntimeError as e:
+                problem = repr(e)
+            else:
+                if entries and index.ntotal != matched[0]["vectors"]:
+                    problem = f"{index.ntotal} vector(s), manifest says {matched[0]['vectors']}"
+                else:
+                    if self.index_path.exists() and (not entries or matched[0] is not manifest.get("current")):
+                        # Adopt a pre-manifest snapshot, or finish a write interrupted before its manifest.
+                        self._write_manifest(current=_manifest_entry(self.index_path, index.ntotal))
+                    return index
+        logger.error(f"[IndexService] Snapshot {self.index_path.name} is corrupt ({problem}); quarantined. "
+                     "Files whose vectors are missing will be re-embedded.")
+        _quarantine(self.index_path)
+        self.manifest_path.unlink(missing_ok=True)
+        self.recovered.append("snapshot")
+        return load_faiss_index(self.index_path, dim)
+
+    def _read_manifest(self) -> Dict[str, Any]:
+        try:
+            with self.manifest_path.open("r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_manifest(self, **entries: Dict[str, Any]) -> None:
+        manifest = {"current": self._read_manifest().get("current"), **entries}
+        _atomic_write_bytes(self.manifest_path, json.dumps(manifest, indent=2).encode("utf-8"))
+
+    def verify(self) -> Dict[str, Any]:
+        """
+        Cross-checks the store against the loaded index: files whose vectors are
+        (partly) missing are reported for re-embedding, and vectors no file owns are
+        dropped. Also reports (once) what loading quarantined.
+        """
+        self.load()
+        with self._lock:
+            present = self._present_vector_ids()
+            missing: List[str] = []
+            for file_id, count in self._store.chunk_counts():
+                if not count:
+                    continue
+                ids = make_vector_ids(file_id, count)
+                if present is not None:
+                    intact = bool(np.isin(ids, present).all())
+                else:
+                    intact = self._has_vector(ids[0]) and self._has_vector(ids[-1])
+                if not intact:
+                    missing.append(self._store.get(file_id)["file_path"])
+            stray = np.zeros(0, dtype=np.int64)
+            if present is not None:
+                stray = np.setdiff1d(present, self._live_vector_ids())
+                stray = stray[~np.isin(stray, np.fromiter(self._tombstones, dtype=np.int64))]
+                if len(stray):
+                    self._drop_vectors(stray)
+                    self._dirty = True
+            if missing or len(stray):
+                logger.warning(f"[IndexService] {self.index_path.parent.name}: {len(missing)} file(s) missing "
+                               f"vectors, {len(stray)} stray vector(s) dropped")
+            report = {"files": self._store.count(), "missing": missing, "stray_vectors": int(len(stray)),
+                      "recovered": list(self.recovered)}
+            self.recovered = []
+            return report
+
+    def _present_vector_ids(self) -> Optional[np.ndarray]:
+        """Every id held by the snapshot and delta, or None when the snapshot keeps no id list (raw IVF)."""
+        found = []
+        for index in (self._index, self._delta):
+            if not isinstance(index, faiss.IndexIDMap):
+                return None
+            found.append(faiss.vector_to_array(index.id_map))
+        return np.concatenate(found)
+
+    def _resolve_model(self, store: MetadataStore) -> str:
+        model_name = store.get_value("model_name")
+        if model_name is None:
+            # Stores from before models were recorded hold the model they were created for.
+            model_name = self.model_name
+            store.set_value("model_name", model_name)
+            store.commit()
+        return model_name
+
+    def _resolve_projection(self, store: MetadataStore) -> Optional[Projection]:
+        tag = store.get_value("projection_tag")
+        has_wal = any(p.stat().st_size for p in self.wal_path.parent.glob(self.wal_path.name + "*"))
+        is_new = store.count() == 0 and not (self.index_path.exists() or has_wal)
+        if tag is None and is_new and self.model_name == get_active_model():
+            # A brand-new index starts in the active projection's space; the tag is
+            # committed before any vector lands so a crash can never mix spaces.
+            tag = active_projection_tag()
+            if tag:
+                store.set_value("projection_tag", tag)
+                store.commit()
+        return get_projection(tag) if tag else None
+
+    @property
+    def projection_tag(self) -> Optional[str]:
+        """Tag of the PCA space this index lives in, or None for full-dimension vectors."""
+        self.load()
+        return self._projection.tag if self._projection else None
+
+    def close(self, checkpoint: bool = True) -> None:
+        """
+        Stops the checkpointer and folds any outstanding WAL records into a snapshot.
+        With `checkpoint=False` nothing is written, e.g. when the files are about to be
+        deleted; uncommitted metadata is rolled back.
+        """
+        self._stop.set()
+        if self._flusher is not None:
+            self._flusher.join(timeout=self.flush_interval + 1.0)
+            self._flusher = None
+        if checkpoint:
+            self.checkpoint(force=True)
+        elif self._store is not None:
+            self._store.rollback()
+        with self._lock:
+            if self._wal is not None:
+                self._wal.close()
+            if self._store is not None:
+                self._store.close()
+            self._index = None
+            self._delta = None
+            self._mapped = None
+            self._store = None
+            self._wal = None
+            self._folder_index = None
+            self._file_index = None
+            self._writer.release()
+
+    # --- Queries ---
+    def search(
+        self,
+        query_array: np.ndarray,
+        top_k: int,
+        top_folders: Optional[int] = None,
+        folders: Optional[Sequence[str]] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Searches the in-memory index and joins each hit with its metadata row.
+
+        On large corpora the query is first matched against folder centroids, and
+        only the chunks of the shortlisted folders are searched (exactly).
+        `top_folders` overrides the configured shortlist size; 0 forces a full search.
+        `folders` restricts the search to the chunks of exactly those folders.
+        """
+        return self.search_many([query_array], top_k, top_folders, folders)[0]
+
+    def search_many(
+        self,
+        query_arrays: Sequence[np.ndarray],
+        top_k: int,
+        top_folders: Optional[int] = None,
+        folders: Optional[Sequence[str]] = None,
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        `search` for several independent queries at once. Each keeps its own folder
+        shortlist; every query that needs a full search shares one FAISS call.
+        """
+        self.load()
+        with self._lock:
+            if self._ntotal() == 0:
+                return [[] for _ in query_arrays]
+            queries = [self._to_index_space(normalize_vectors(q)) for q in query_arrays]
+            found: List[Optional[Tuple[np.ndarray, np.ndarray]]] = [None] * len(queries)
+            full = []
+            for i, q in enumerate(queries):
+                if folders is not None:
+                    within = self._search_within(q, list(folders), top_k)
+                    found[i] = within if within is not None else (np.zeros((0, 0)), np.zeros((0, 0), dtype=np.int64))
+                    continue
+                shortlist = self.shortlist_folders(q, top_folders)
+                found[i] = self._search_within(q, shortlist, top_k) if shortlist else None
+                if found[i] is None:
+                    full.append(i)
+            if full:
+                D, I = self._search_all(np.vstack([queries[i] for i in full]), top_k)
+                offset = 0
+                for i in full:
+                    rows = len(queries[i])
+                    found[i] = (D[offset:offset + rows], I[offset:offset + rows])
+                    offset += rows
+            return [self._join_hits(D, I) for D, I in found]
+
+    def _join_hits(self, D: np.ndarray, I: np.ndarray) -> List[Dict[str, Any]]:
+        files = self._store.get_many(file_id_of(v) for v in I.ravel() if v != -1)
+        results = []
+        for q_idx, (distances, ids) in enumerate(zip(D, I)):
+            for dist, vector_id in zip(distances, ids):
+                if vector_id == -1:
+                    continue
+                meta = files.get(file_id_of(vector_id))
+                if meta is None:
+                    continue
+                match = meta.copy()
+                match.update({
+                    # Cosine distance, so `1 - distance` stays a similarity for the sorter.
+                    "distance": 1.0 - float(dist),
+                    "match_index": int(vector_id),
+                    "query_chunk": q_idx
+                })
+                results.append(match)
+        return results
+
+    def _search_all(self, queries: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        sel = None
+        if self._tombstones:
+            sel = faiss.IDSelectorNot(faiss.IDSelectorBatch(np.fromiter(self._tombstones, dtype=np.int64)))
+        params = make_search_params(self._index, self._settings, sel)
+        D, I = self._index.search(queries, top_k, params=params)
+        if not self._delta.ntotal:
+            return D, I
+        # Merge the exact delta hits into the snapshot hits by similarity.
+        dD, dI = self._delta.search(queries, top_k)
+        D, I = np.hstack([D, dD]), np.hstack([I, dI])
+        order = np.argsort(-D, axis=1, kind="stable")[:, :top_k]
+        return np.take_along_axis(D, order, axis=1), np.take_along_axis(I, order, axis=1)
+
+    def _search_within(self, queries: np.ndarray, folders: List[str],
+                       top_k: int) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        counts = [(fid, n) for fid, n in self._store.chunk_counts_in_folders(folders) if n]
+        if not counts:
+            return None
+        ids = np.concatenate([make_vector_ids(fid, n) for fid, n in counts])
+        D, pos = faiss.knn(queries, self._reconstruct(ids), min(top_k, len(ids)),
+                           metric=faiss.METRIC_INNER_PRODUCT)
+        return D, np.where(pos >= 0, ids[np.maximum(pos, 0)], -1)
+
+    def search_files(self, query_array: np.ndarray, top_k: int) -> List[Dict[str, Any]]:
+        """
+        Pools the query chunks into one vector and returns the `top_k` files whose
+        pooled vectors match it best, one row per file (`query_chunk` is always 0).
+        """
+        return self.search_files_many([query_array], top_k)[0]
+
+    def search_files_many(self, query_arrays: Sequence[np.ndarray], top_k: int) -> List[List[Dict[str, Any]]]:
+        """`search_files` for several independent queries, pooled separately and searched in one FAISS call."""
+        self.load()
+        with self._lock:
+            self._sync_file_index()
+            results: List[List[Dict[str, Any]]] = [[] for _ in query_arrays]
+            if self._file_index.ntotal == 0:
+                return results
+            pooled, rows = [], []
+            for i, query_array in enumerate(query_arrays):
+                queries = self._to_index_space(normalize_vectors(query_array))
+                vector = self._centroid(queries.sum(axis=0, dtype=np.float64))
+                if vector is not None:
+                    pooled.append(vector)
+                    rows.append(i)
+            if not pooled:
+                return results
+            D, I = self._file_index.search(np.vstack(pooled), min(top_k, self._file_index.ntotal))
+            files = self._store.get_many(int(f) for f in I.ravel() if f != -1)
+            for i, sims, file_ids in zip(rows, D, I):
+                for sim, file_id in zip(sims, file_ids):
+                    meta = files.get(int(file_id))
+                    if meta is None:
+                        continue
+                    results[i].append({**meta, "distance": 1.0 - float(sim), "match_index": int(file_id),
+                                       "query_chunk": 0})
+        return results
+
+    def _build_file_index(self) -> None:
+        self._file_index = faiss.IndexIDMap2(faiss.IndexFlatIP(self._index.d))
+        ids, pooled = [], []
+        for file_id, vec_sum in self._store.iter_file_sums():
+            vector = self._centroid(vec_sum)
+            if vector is not None:
+                ids.append(file_id)
+                pooled.append(vector)
+        if ids:
+            self._file_index.add_with_ids(np.vstack(pooled), np.array(ids, dtype=np.int64))
+        self._store.pop_touched_files()
+
+    def _sync_file_index(self) -> None:
+        """Re-pools the files written or deleted since the last sync."""
+        touched = self._store.pop_touched_files()
+        if not touched:
+            return
+        ids = np.fromiter(touched, dtype=np.int64)
+        self._file_index.remove_ids(ids)
+        for file_id in ids:
+            vec_sum = self._store.file_sum(int(file_id))
+            vector = self._centroid(vec_sum) if vec_sum is not None else None
+            if vector is not None:
+                self._file_index.add_with_ids(vector, np.array([file_id], dtype=np.int64))
+
+    # --- Folder Routing ---
+    def shortlist_folders(self, queries: np.ndarray, top_m: Optional[int] = None) -> Optional[List[str]]:
+        """
+        Returns the `top_m` (default `index_route_top_folders`) folders whose
+        centroids best match any query chunk, or None when routing is off or would
+        not narrow the search.
+        """
+        self._sync_folder_index()
+        if top_m is None:
+            top_m = int(self._settings["index_route_top_folders"])
+            live = self._ntotal() - len(self._tombstones)
+            if live < int(self._settings["index_route_min_vectors"]):
+                return None
+        if top_m <= 0:
+            return None
+        if self._folder_index.ntotal <= top_m:
+            return None
+        D, I = self._folder_index.search(queries, top_m)
+        best: Dict[int, float] = {}
+        for sims, folder_ids in zip(D, I):
+            for sim, folder_id in zip(sims, folder_ids):
+                if folder_id != -1:
+                    best[int(folder_id)] = max(best.get(int(folder_id), -1.0), float(sim))
+        ranked = sorted(best, key=best.get, reverse=True)[:top_m]
+        return [self._folder_paths[f] for f in ranked]
+
+    @staticmethod
+    def _centroid(vec_sum: np.ndarray) -> Optional[np.ndarray]:
+        norm = np.linalg.norm(vec_sum)
+        return (vec_sum / norm).astype(np.float32).reshape(1, -1) if norm > 0 else None
+
+    def _build_folder_index(self) -> None:
+        self._folder_index = faiss.IndexIDMap2(faiss.IndexFlatIP(self._index.d))
+        self._folder_ids, self._folder_paths = {}, {}
+        for folder_id, folder_path, _, vec_sum in self._store.iter_folder_summaries():
+            self._add_folder(folder_id, folder_path, vec_sum)
+        self._store.pop_touched_folders()
+
+    def _add_folder(self, folder_id: int, folder_path: str, vec_sum: np.ndarray) -> None:
+        centroid = self._centroid(vec_sum)
+        if centroid is None:
+            return
+        self._folder_index.add_with_ids(centroid, np.array([folder_id], dtype=np.int64))
+        self._folder_ids[folder_path] = folder_id
+        self._folder_paths[folder_id] = folder_path
+
+    def _sync_folder_index(self) -> None:
+        """Refreshes the centroids of folders whose files changed since the last sync."""
+        for folder_path in self._store.pop_touched_folders():
+            old_id = self._folder_ids.pop(folder_path, None)
+            if old_id is not None:
+                self._folder_index.remove_ids(np.array([old_id], dtype=np.int64))
+                self._folder_paths.pop(old_id, None)
+            summary = self._store.folder_summary(folder_path)
+            if summary is not None:
+                folder_id, _, vec_sum = summary
+                self._add_folder(folder_id, folder_path, vec_sum)
+
+    def _backfill_folder_summaries(self) -> None:
+        """Computes per-file vector sums from the index for stores that predate them."""
+        file_sums = {}
+        for file_id, count in self._store.chunk_counts():
+            if count:
+                file_sums[file_id] = self._reconstruct(make_vector_ids(file_id, count)).sum(axis=0)
+        self._store.rebuild_folder_summaries(file_sums)
+        self._store.set_value("folder_summaries_ready", True)
+        logger.info(f"[IndexService] Built folder summaries for {len(file_sums)} file(s)")
+
+    def file_id_for(self, file_path: str) -> Optional[int]:
+        self.load()
+        with self._lock:
+            return self._store.id_for_path(normalize_path(file_path))
+
+    def get_file(self, file_id: int) -> Optional[Dict[str, Any]]:
+        self.load()
+        with self._lock:
+            return self._store.get(file_id)
+
+    def files_with_hash(self, content_hash: str) -> List[Dict[str, Any]]:
+        self.load()
+        with self._lock:
+            return list(self._store.get_many(self._store.ids_for_hash(content_hash)).values())
+
+    def file_vectors(self, file_path: str) -> Optional[Tuple[Dict[str, Any], np.ndarray]]:
+        """Returns (metadata, chunk vectors in this index's space) for an indexed file."""
+        self.load()
+        with self._lock:
+            file_id = self._store.id_for_path(normalize_path(file_path))
+            if file_id is None:
+                return None
+            meta = self._store.get(file_id)
+            ids = make_vector_ids(file_id, int(meta.get("num_chunks", 0)))
+            if not len(ids):
+                return meta, np.zeros((0, self._index.d), dtype=np.float32)
+            return meta, self._reconstruct(ids)
+
+    def get_value(self, key: str, default: Any = None) -> Any:
+        self.load()
+        with self._lock:
+            return self._store.get_value(key, default)
+
+    def set_value(self, key: str, value: Any) -> None:
+        """Stores a store-level value; it becomes durable with the next checkpoint."""
+        self.load()
+        with self._lock:
+            self._store.set_value(key, value)
+            self._dirty = True
+
+    def removed_since(self, since: float) -> List[str]:
+        """Paths deleted or moved away from at or after `since` (remembered for REMOVAL_LOG_SECONDS)."""
+        self.load()
+        with self._lock:
+            return self._store.removed_since(since)
+
+    def stats(self) -> Dict[str, int]:
+        """Counts and on-disk size of this index (snapshot, WAL and metadata files)."""
+        self.load()
+        with self._lock:
+            files = [self.index_path, *self.wal_path.parent.glob(self.wal_path.name + "*"),
+                     *self.metadata_path.parent.glob(self.metadata_path.name + "*")]
+            return {
+                "files": self._store.count(),
+                "vectors": self._ntotal(),
+                "live_vectors": len(self._live_vector_ids()),
+                "bytes": sum(p.stat().st_size for p in files if p.exists()),
+            }
+
+    def count(self) -> int:
+        self.load()
+        with self._lock:
+            return self._store.count()
+
+    def iter_files(self) -> List[Dict[str, Any]]:
+        self.load()
+        with self._lock:
+            return [meta for _, meta in self._store.iter_files()]
+
+    def export_vectors(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns (ids, vectors) for every live vector, in metadata order."""
+        self.load()
+        with self._lock:
+            ids = self._live_vector_ids()
+            if not len(ids):
+                return ids, np.zeros((0, self._index.d), dtype=np.float32)
+            return ids, self._reconstruct(ids)
+
+    def export_snapshot(self) -> Tuple[bytes, Dict[str, Any]]:
+        """
+        Serializes the index together with a consistent copy of its metadata, as
+        (index bytes, {"files": {file_id: meta}, "next_file_id", "tombstones", "projection_tag"}).
+        """
+        self.load()
+        with self._lock:
+            if self._delta.ntotal:
+                self._merge_delta()
+                self._dirty = True
+            data = faiss.serialize_index(self._index).tobytes()
+            store = {
+                "files": {file_id: meta for file_id, meta in self._store.iter_files()},
+                "next_file_id": int(self._store.get_value("next_file_id", 0)),
+                "tombstones": sorted(self._tombstones),
+                "projection_tag": self._projection.tag if self._projection else None,
+            }
+            return data, store
+
+    # --- Mutations ---
+    # Each public mutation builds a self-describing record, logs it, then applies it.
+    # Records list exactly which vector ranges to drop, so replay never has to
+    # consult state that may be newer or older than the record itself.
+    def upsert(self, embedding_array: np.ndarray, file_metadata: Dict[str, Any]) -> int:
+        """Stores a file's vectors under its stable id, replacing any previous vectors."""
+        self.load()
+        if len(embedding_array) > MAX_CHUNKS_PER_FILE:
+            logger.warning(f"[IndexService] Truncating {len(embedding_array)} chunks to {MAX_CHUNKS_PER_FILE}")
+            embedding_array = embedding_array[:MAX_CHUNKS_PER_FILE]
+        embedding_array = self._to_index_space(normalize_vectors(embedding_array))
+
+        file_path = normalize_path(file_metadata["file_path"])
+        file_metadata = {**file_metadata, **_file_stat(file_path), "file_path": file_path, "indexed_at": time.time()}
+        with self._lock:
+            record: Dict[str, Any] = {"op": "upsert", "drop": [], "forget": []}
+            file_id = self._store.id_for_path(file_metadata["file_path"])
+            if file_id is not None:
+                record["drop"].append([file_id, self._chunk_count(file_id)])
+                if not self._removable():
+                    # Masked HNSW ids must never be reused, so the new vectors get a fresh id.
+                    record["forget"].append(file_id)
+                    file_id = None
+            if file_id is None:
+                file_id = int(self._store.get_value("next_file_id", 0))
+            record.update({
+                "file_id": file_id,
+                "next_file_id": max(file_id + 1, int(self._store.get_value("next_file_id", 0))),
+                "meta": {**file_metadata, "num_chunks": len(embedding_array)},
+            })
+            self._wal.append(record, embedding_array)
+            self._apply(record, embedding_array)
+        return file_id
+
+    def delete(self, file_path: str) -> bool:
+        """Drops a file's vectors and metadata record."""
+        self.load()
+        with self._lock:
+            file_id = self._store.id_for_path(normalize_path(file_path))
+            if file_id is None:
+                return False
+            record = {"op": "delete", "drop": [[file_id, self._chunk_count(file_id)]], "forget": [file_id],
+                      "removed": [normalize_path(file_path)], "at": time.time()}
+            self._wal.append(record)
+            self._apply(record)
+        return True
+
+    def relocate(self, old_path: str, file_metadata: Dict[str, Any]) -> bool:
+        """Rewrites a file's metadata in place after a move; its vectors are reused as-is."""
+        self.load()
+        new_path = normalize_path(file_metadata["file_path"])
+        with self._lock:
+            file_id = self._store.id_for_path(normalize_path(old_path))
+            if file_id is None:
+                return False
+
+            record: Dict[str, Any] = {"op": "relocate", "file_id": file_id, "drop": [], "forget": []}
+            # A different record already living at the destination is now stale.
+            displaced = self._store.id_for_path(new_path)
+            if displaced is not None and displaced != file_id:
+                record["drop"].append([displaced, self._chunk_count(displaced)])
+                record["forget"].append(displaced)
+
+            old_meta = self._store.get(file_id) or {}
+            merged = {**old_meta, **{k: v for k, v in file_metadata.items() if v is not None}}
+            merged.update(_file_stat(new_path))
+            merged["file_path"] = new_path
+            merged["num_chunks"] = old_meta.get("num_chunks", 0)
+            merged["indexed_at"] = time.time()
+            record["meta"] = merged
+            if normalize_path(old_path) != new_path:
+                record.update(removed=[normalize_path(old_path)], at=merged["indexed_at"])
+            self._wal.append(record)
+            self._apply(record)
+        return True
+
+    def _apply(self, record: Dict[str, Any], vectors: Optional[np.ndarray] = None, replaying: bool = False) -> None:
+        """Applies one logged mutation. Safe to run again over a snapshot that already has it."""
+        for file_id, count in record.get("drop", []):
+            if count:
+                self._drop_vectors(make_vector_ids(file_id, count))
+        for file_id in record.get("forget", []):
+            self._store.delete(file_id)
+        for file_path in record.get("removed", []):
+            self._store.note_removed(file_path, record["at"])
+
+        if "meta" in record:
+            vec_sum = vectors.sum(axis=0, dtype=np.float64) if vectors is not None else None
+            self._store.put(record["file_id"], record["meta"], vec_sum)
+        if vectors is not None:
+            ids = make_vector_ids(record["file_id"], len(vectors))
+            if replaying and self._removable():
+                self._index.remove_ids(ids)
+            if not (replaying and self._has_vector(ids[0])):
+                self._add_vectors(vectors, ids)
+        if "next_file_id" in record:
+            current = int(self._store.get_value("next_file_id", 0))
+            self._store.set_value("next_file_id", max(current, int(record["next_file_id"])))
+
+    def _to_index_space(self, vectors: np.ndarray) -> np.ndarray:
+        """Projects full-dimension embeddings; vectors already in this index's space pass through."""
+        if self._projection is not None and vectors.shape[1] == self._projection.input_dim:
+            return self._projection.apply(vectors)
+        if vectors.shape[1] != self._index.d:
+            raise ValueError(f"[IndexService] Vector dim {vectors.shape[1]} does not match index dim {self._index.d}")
+        return vectors
+
+    def _chunk_count(self, file_id: int) -> int:
+        meta = self._store.get(file_id)
+        return int(meta.get("num_chunks", 0)) if meta else 0
+
+    def _ntotal(self) -> int:
+        return self._index.ntotal + self._delta.ntotal
+
+    def _removable(self) -> bool:
+        """Whether dropped vectors can be physically removed from the live index."""
+        return not self._use_mmap and supports_removal(self._index)
+
+    def _has_vector(self, vector_id: int) -> bool:
+        for index in (self._delta, self._index):
+            try:
+                index.reconstruct(int(vector_id))
+                return True
+            except RuntimeError:
+                pass
+        return False
+
+    def _reconstruct(self, ids: np.ndarray) -> np.ndarray:
+        if not self._delta.ntotal:
+            return self._index.reconstruct_batch(ids)
+        in_delta = np.isin(ids, faiss.vector_to_array(self._delta.id_map))
+        vectors = np.empty((len(ids), self._index.d), dtype=np.float32)
+        if in_delta.any():
+            vectors[in_delta] = self._delta.reconstruct_batch(ids[in_delta])
+        if not in_delta.all():
+            vectors[~in_delta] = self._index.reconstruct_batch(ids[~in_delta])
+        return vectors
+
+    def _add_vectors(self, vectors: np.ndarray, ids: np.ndarray) -> None:
+        (self._delta if self._use_mmap else self._index).add_with_ids(vectors, ids)
+        if self._pending_ops is not None:
+            self._pending_ops.append(("add", vectors, ids))
+
+    def _drop_vectors(self, ids: np.ndarray) -> None:
+        if self._use_mmap:
+            self._delta.remove_ids(ids)
+            self._tombstones.update(int(i) for i in ids)
+        else:
+            self._drop_ids(self._index, ids, self._tombstones)
+        if self._pending_ops is not None:
+            self._pending_ops.append(("remove", None, ids))
+
+    @staticmethod
+    def _drop_ids(index: faiss.Index, ids: np.ndarray, tombstones: set) -> None:
+        if supports_removal(index):
+            index.remove_ids(ids)
+        else:
+            tombstones.update(int(i) for i in ids)
+
+    def _live_vector_ids(self) -> np.ndarray:
+        counts = self._store.chunk_counts()
+        if not counts:
+            return np.zeros(0, dtype=np.int64)
+        return np.concatenate([make_vector_ids(fid, n) for fid, n in counts])
+
+    # --- Tiering ---
+    def reload_settings(self) -> Dict[str, Any]:
+        self._settings = get_index_settings()
+        return self._settings
+
+    def layout(self) -> Tuple[str, str]:
+        """Returns the (tier, storage) the in-memory index currently uses."""
+        self.load()
+        with self._lock:
+            return index_tier(self._index), index_storage(self._index)
+
+    def maybe_retier(self, force: bool = False) -> bool:
+        """
+        Rebuilds the index into the tier and storage that fit its current size and
+        settings, or to drop masked HNSW entries. The build (including quantizer
+        training) runs outside the lock; mutations made in the meantime are replayed
+        onto the new index before it is swapped in.
+        """
+        with self._lock:
+            if not self.loaded or self._pending_ops is not None:
+                return False
+            ids = self._live_vector_ids()
+            current = (index_tier(self._index), index_storage(self._index))
+            target = (desired_tier(len(ids), current[0], self._settings),
+                      desired_storage(len(ids), current[1], self._settings))
+            too_many_tombstones = len(self._tombstones) > TOMBSTONE_REBUILD_RATIO * max(self._ntotal(), 1)
+            if target == current and not (force or too_many_tombstones):
+                return False
+            ids, vectors = self.export_vectors()
+            dim = self._index.d
+            self._pending_ops = []
+
+        logger.info(f"[IndexService] Re-tiering {'/'.join(current)} -> {'/'.join(target)} ({len(ids)} vector(s))")
+        try:
+            new_index = build_faiss_index(target[0], dim, vectors, ids, self._settings, target[1])
+        except Exception as e:
+            with self._lock:
+                self._pending_ops = None
+            logger.error(f"[IndexService] Re-tier failed, keeping {'/'.join(current)} index: {repr(e)}")
+            return False
+
+        with self._lock:
+            new_tombstones: set = set()
+            for op, op_vectors, op_ids in self._pending_ops:
+                if op == "add":
+                    new_index.add_with_ids(op_vectors, op_ids)
+                else:
+                    self._drop_ids(new_index, op_ids, new_tombstones)
+            self._index = new_index
+            self._delta = new_faiss_index(dim)
+            self._mapped = None
+            self._tombstones = new_tombstones
+            self._pending_ops = None
+            self._dirty = True
+        return True
+
+    def compact(self) -> None:
+        """
+        Rebuilds the index from live vectors only (dropping tombstones and list
+        fragmentation), writes it as a new snapshot and VACUUMs the metadata file.
+        """
+        self.load()
+        self.maybe_retier(force=True)
+        self.checkpoint(force=True)
+        with self._lock:
+            # VACUUM commits; only safe while nothing is pending beyond the snapshot.
+            if not (self._dirty or self._wal.size_bytes()):
+                self._store.vacuum()
+
+    # --- Checkpointing ---
+    def checkpoint_due(self) -> bool:
+        with self._lock:
+            if not self.loaded:
+                return False
+            if self._dirty:
+                return True
+            wal_bytes = self._wal.size_bytes()
+            return bool(wal_bytes) and (
+                wal_bytes >= float(self._settings["index_wal_max_mb"]) * 1024 * 1024
+                or self._wal.age_seconds() >= float(self._settings["index_checkpoint_interval"])
+            )
+
+    def checkpoint(self, force: bool = False) -> bool:
+        """
+        Writes a new index snapshot and truncates the WAL it covers.
+
+        The snapshot is serialized under the lock, then written without it so sorting
+        continues. The metadata commit records the snapshot's WAL seq; anything logged
+        after that seq is replayed (idempotently) on the next load. In mmap mode the
+        delta is merged first and the written file is mapped in place of the merge.
+        """
+        if not (force or self.checkpoint_due()):
+            return False
+        with self._lock:
+            if not self.loaded or not (self._dirty or self._wal.size_bytes()):
+                return False
+            if self._use_mmap:
+                self._merge_delta()
+            self._store.set_value("tombstones", sorted(self._tombstones))
+            self._store.prune_removed(time.time() - REMOVAL_LOG_SECONDS)
+            snapshot = self._index
+            # An untouched mapped snapshot is already on disk (and may not be replaceable while mapped).
+            index_bytes = None if snapshot is self._mapped else faiss.serialize_index(snapshot)
+            sealed_seq = self._wal.rotate()
+            self._dirty = False
+
+        try:
+            if index_bytes is not None:
+                data = index_bytes.tobytes()
+                entry = {"index_bytes": len(data), "index_crc32": zlib.crc32(data), "vectors": int(snapshot.ntotal)}
+                # Two-phase: a crash between the writes leaves a manifest that still vouches for the file.
+                self._write_manifest(pending=entry)
+                _atomic_write_bytes(self.index_path, data)
+                self._write_manifest(current=entry, pending=None)
+            with self._lock:
+                self._store.set_value("checkpoint_seq", sealed_seq)
+                self._store.commit()
+                if self._use_mmap:
+                    self._remap(snapshot)
+            self._wal.discard_through(sealed_seq)
+            logger.info(f"[IndexService] Checkpointed index through WAL seq {sealed_seq}")
+            return True
+        except Exception as e:
+            with self._lock:
+                self._dirty = True
+            logger.error(f"[IndexService] Checkpoint failed; WAL retained: {repr(e)}")
+            return False
+
+    def _merge_delta(self) -> None:
+        """Replaces the read-only snapshot with a heap copy holding the delta and removals."""
+        purge = bool(self._tombstones) and supports_removal(self._index)
+        if not (self._delta.ntotal or purge):
+            return
+        merged = faiss.deserialize_index(faiss.serialize_index(self._index))
+        if purge:
+            merged.remove_ids(np.fromiter(self._tombstones, dtype=np.int64))
+            self._tombstones = set()
+        if self._delta.ntotal:
+            ids = faiss.vector_to_array(self._delta.id_map)
+            merged.add_with_ids(self._delta.reconstruct_batch(ids), ids)
+        self._index = merged
+        self._delta = new_faiss_index(merged.d)
+        self._mapped = None  # drop the mapping so the file can be replaced
+
+    def _remap(self, snapshot: faiss.Index) -> None:
+        # Later mutations live in the delta/tombstones, so the file on disk is exactly
+        # `snapshot`, unless a re-tier or another checkpoint has replaced it meanwhile.
+        if self._index is snapshot and snapshot is not self._mapped and supports_mmap(snapshot):
+            self._index = self._mapped = load_faiss_index(self.index_path, snapshot.d, mmap=True)
+
+    def flush(self) -> None:
+        """Forces a checkpoint so other processes see the current index on disk."""
+        self.checkpoint(force=True)
+
+    def _flush_loop(self) -> None:
+        while not self._stop.wait(self.flush_interval):
+            self.reload_settings()
+            try:
+                self.maybe_retier()
+            except Exception as e:
+                logger.error(f"[IndexService] Re-tier check failed: {repr(e)}")
+            self.checkpoint()
+
+
+# --- Internal Helpers ---
+def _file_stat(file_path: str) -> Dict[str, int]:
+    """Size and mtime recorded with each row so a vacuum can skip unchanged files."""
+    try:
+        st = os.stat(file_path)
+    except OSError:
+        return {}
+    return {"file_size": st.st_size, "file_mtime_ns": st.st_mtime_ns}
+
+
+def _file_crc32(path: Path) -> Tuple[int, int]:
+    crc, size = 0, 0
+    with path.open("rb") as f:
+        while chunk := f.read(1 << 20):
+            crc = zlib.crc32(chunk, crc)
+            size += len(chunk)
+    return size, crc
+
+
+def _manifest_entry(path: Path, vectors: int) -> Dict[str, int]:
+    size, crc = _file_crc32(path)
+    return {"index_bytes": size, "index_crc32": crc, "vectors": int(vectors)}
+
+
+def _quarantine(path: Path) -> None:
+    """Moves a corrupt file aside (keeping it for inspection) so it is never read again."""
+    if path.exists():
+        os.replace(path, path.with_name(path.name + ".corrupt"))
+
+
+def writer_lock_path(index_path: Path) -> Path:
+    """The lock file a process holds while it serves the index at `index_path`."""
+    return Path(index_path).with_name(Path(index_path).stem + ".lock")
+
+
+def _atomic_write_bytes(path: Path, data: bytes) -> None:
+    """Writes to a sibling temp file and renames it over the target."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with tmp_path.open("wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+# --- Process-wide Registry ---
+_services: Dict[tuple, IndexService] = {}
+_services_lock = threading.Lock()
+
+
+def get_index_service(
+    index_path: Optional[Path] = None,
+    metadata_path: Optional[Path] = None,
+    model_name: Optional[str] = None,
+) -> IndexService:
+    """
+    Returns the shared service for the given index files (defaults to the main index).
+    `model_name` is the encoder a new index is created for (the active one by default).
+    """
+    index_path = Path(index_path or get_faiss_index_path()).resolve()
+    metadata_path = Path(metadata_path or get_faiss_metadata_path()).resolve()
+    # Only the default model's main store can have a JSON-era predecessor to migrate from.
+    is_main = metadata_path == get_faiss_metadata_path(DEFAULT_MODEL).resolve()
+    legacy_path = get_legacy_faiss_metadata_path() if is_main else None
+    key = (str(index_path), str(metadata_path))
+    with _services_lock:
+        service = _services.get(key)
+        if service is None:
+            service = IndexService(index_path, metadata_path, legacy_metadata_path=legacy_path, model_name=model_name)
+            _services[key] = service
+        return service
+
+
+def release_index_service(index_path: Path, metadata_path: Path, checkpoint: bool = True) -> None:
+    """Closes the service for the given files, if any, and forgets it."""
+    key = (str(Path(index_path).resolve()), str(Path(metadata_path).resolve()))
+    with _services_lock:
+        service = _services.pop(key, None)
+    if service is not None:
+        service.close(checkpoint=checkpoint)
+
+
+def close_all_services() -> None:
+    """Checkpoints and stops every service created in this process."""
+    with _services_lock:
+        services = list(_services.values())
+    for service in services:
+        service.close()
+
+
+atexit.register(close_all_services)
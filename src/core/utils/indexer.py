@@ -1,85 +1,373 @@
 import json
 import logging
+import math
+import os
 import faiss
 import numpy as np
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 
-from src.core.utils.processor import embedding_dim
+from src.core.utils.lockfile import LockHeld
+from src.core.utils.processor import get_embedding_dim
 
 # --- Logger Setup ---
 logger = logging.getLogger(__name__)
 
+# --- Vector ID Layout ---
+# Every vector id encodes its owning file: (file_id << CHUNK_ID_BITS) | chunk_index.
+# This keeps ids stable across moves and lets a whole file be dropped by id range.
+CHUNK_ID_BITS = 16
+MAX_CHUNKS_PER_FILE = 1 << CHUNK_ID_BITS
+
+
+def make_vector_ids(file_id: int, count: int) -> np.ndarray:
+    return (np.int64(file_id) << CHUNK_ID_BITS) + np.arange(count, dtype=np.int64)
+
+
+def file_id_of(vector_id: int) -> int:
+    return int(vector_id) >> CHUNK_ID_BITS
+
+
+# --- Index Tiers ---
+# Vectors are L2-normalized and searched by inner product, so scores are cosine
+# similarities. Small corpora use an exact flat index; larger ones move to HNSW or IVF.
+TIER_FLAT = "flat"
+TIER_HNSW = "hnsw"
+TIER_IVF = "ivf"
+
+# Vector storage inside a tier: raw float32, 8-bit scalar-quantized, or product-quantized.
+# Compressed codes are lossy; rebuilding from them re-quantizes already-quantized vectors.
+STORAGE_FLAT = "flat"
+STORAGE_SQ8 = "sq8"
+STORAGE_PQ = "pq"
+MAX_TRAINING_VECTORS = 100_000
+
+
+def normalize_vectors(array: np.ndarray) -> np.ndarray:
+    normalized = np.ascontiguousarray(array, dtype=np.float32).copy()
+    faiss.normalize_L2(normalized)
+    return normalized
+
+
+def _inner_index(index: faiss.Index) -> faiss.Index:
+    return faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else faiss.downcast_index(index)
+
+
+def index_tier(index: faiss.Index) -> str:
+    inner = _inner_index(index)
+    if isinstance(inner, faiss.IndexHNSW):
+        return TIER_HNSW
+    if isinstance(inner, faiss.IndexIVF):
+        return TIER_IVF
+    return TIER_FLAT
+
+
+def index_storage(index: faiss.Index) -> str:
+    inner = _inner_index(index)
+    if isinstance(inner, faiss.IndexHNSW):
+        inner = faiss.downcast_index(inner.storage)
+    if isinstance(inner, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)):
+        return STORAGE_SQ8
+    if isinstance(inner, (faiss.IndexPQ, faiss.IndexIVFPQ)):
+        return STORAGE_PQ
+    return STORAGE_FLAT
+
+
+def supports_removal(index: faiss.Index) -> bool:
+    # HNSW graphs cannot drop nodes; removed ids are masked at search time instead.
+    return index_tier(index) != TIER_HNSW
+
+
+def supports_mmap(index: faiss.Index) -> bool:
+    # IVF lists are only mappable as writable on-disk lists, which cannot be copied.
+    return index_tier(index) != TIER_IVF
+
+
+def desired_tier(live_vectors: int, current_tier: str, settings: Dict[str, Any]) -> str:
+    flat_max = int(settings["index_flat_max_vectors"])
+    ann_type = settings["index_ann_type"] if settings["index_ann_type"] in (TIER_HNSW, TIER_IVF) else TIER_HNSW
+    # Hysteresis: only fall back to flat once the corpus has shrunk well below the limit.
+    if current_tier == TIER_FLAT:
+        return ann_type if live_vectors >= flat_max else TIER_FLAT
+    return TIER_FLAT if live_vectors < flat_max // 2 else ann_type
+
+
+def desired_storage(live_vectors: int, current_storage: str, settings: Dict[str, Any]) -> str:
+    storage = settings["index_storage"] if settings["index_storage"] in (STORAGE_SQ8, STORAGE_PQ) else STORAGE_FLAT
+    min_vectors = int(settings["index_compress_min_vectors"])
+    if storage == STORAGE_FLAT:
+        return STORAGE_FLAT
+    # Same hysteresis as tiers: keep trained codes until the corpus has clearly shrunk.
+    threshold = min_vectors // 2 if current_storage == storage else min_vectors
+    return storage if live_vectors >= threshold else STORAGE_FLAT
+
+
+def _pq_subquantizers(dim: int, requested: int) -> int:
+    m = max(1, min(int(requested), dim))
+    while dim % m:
+        m -= 1
+    return m
+
+
+def _training_sample(vectors: np.ndarray, limit: int) -> np.ndarray:
+    if len(vectors) <= limit:
+        return vectors
+    return vectors[np.random.default_rng(0).choice(len(vectors), limit, replace=False)]
+
+
+def build_faiss_index(
+    tier: str,
+    dim: int,
+    vectors: np.ndarray,
+    ids: np.ndarray,
+    settings: Dict[str, Any],
+    storage: str = STORAGE_FLAT
+) -> faiss.Index:
+    """Creates an index of the requested tier and storage, trains it on `vectors` and fills it."""
+    ip = faiss.METRIC_INNER_PRODUCT
+    sq8 = faiss.ScalarQuantizer.QT_8bit
+    pq_m = _pq_subquantizers(dim, settings["index_pq_m"])
+
+    if tier == TIER_HNSW:
+        m = int(settings["index_hnsw_m"])
+        if storage == STORAGE_SQ8:
+            hnsw = faiss.IndexHNSWSQ(dim, sq8, m, ip)
+        elif storage == STORAGE_PQ:
+            hnsw = faiss.IndexHNSWPQ(dim, pq_m, m, 8, ip)
+        else:
+            hnsw = faiss.IndexHNSWFlat(dim, m, ip)
+        hnsw.hnsw.efConstruction = int(settings["index_hnsw_ef_construction"])
+        index = faiss.IndexIDMap2(hnsw)
+    elif tier == TIER_IVF:
+        nlist = max(1, min(int(4 * math.sqrt(len(vectors))), len(vectors) // 39))
+        quantizer = faiss.IndexFlatIP(dim)
+        if storage == STORAGE_SQ8:
+            index = faiss.IndexIVFScalarQuantizer(quantizer, dim, nlist, sq8, ip)
+        elif storage == STORAGE_PQ:
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, pq_m, 8, ip)
+        else:
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist, ip)
+        # Coarse centroids need ~64 points each; PQ codebooks want a larger sample still.
+        sample_limit = MAX_TRAINING_VECTORS if storage == STORAGE_PQ else 64 * nlist
+        index.train(_training_sample(vectors, max(sample_limit, 64 * nlist)))
+        # IVF stores external ids natively; a hashtable direct map keeps reconstruct() working.
+        index.set_direct_map_type(faiss.DirectMap.Hashtable)
+    else:
+        if storage == STORAGE_SQ8:
+            index = faiss.IndexIDMap2(faiss.IndexScalarQuantizer(dim, sq8, ip))
+        elif storage == STORAGE_PQ:
+            index = faiss.IndexIDMap2(faiss.IndexPQ(dim, pq_m, 8, ip))
+        else:
+            index = new_faiss_index(dim)
+
+    if not index.is_trained:
+        index.train(_training_sample(vectors, MAX_TRAINING_VECTORS))
+    if len(vectors):
+        index.add_with_ids(vectors, ids)
+    logger.info(f"[Indexer] Built {tier}/{storage} index with {index.ntotal} vector(s)")
+    return index
+
+
+def make_search_params(
+    index: faiss.Index,
+    settings: Dict[str, Any],
+    sel: Optional[faiss.IDSelector] = None
+) -> Optional[faiss.SearchParameters]:
+    tier = index_tier(index)
+    if tier == TIER_HNSW:
+        return faiss.SearchParametersHNSW(efSearch=int(settings["index_hnsw_ef_search"]), sel=sel)
+    if tier == TIER_IVF:
+        return faiss.SearchParametersIVF(nprobe=int(settings["index_ivf_nprobe"]), sel=sel)
+    return faiss.SearchParameters(sel=sel) if sel is not None else None
+
 
 # --- FAISS Index Handling ---
-def load_faiss_index(index_path: Path, expected_dim: int) -> faiss.IndexFlatL2:
+def new_faiss_index(dim: int) -> faiss.IndexIDMap2:
+    return faiss.IndexIDMap2(faiss.IndexFlatIP(dim))
+
+
+def load_faiss_index(index_path: Path, expected_dim: int, mmap: bool = False) -> faiss.Index:
+    """
+    Reads the index, or creates an empty one. With `mmap`, vector codes are mapped
+    read-only from the file instead of copied to the heap, so opening is near-constant
+    time and processes share the page cache; such an index must never be mutated.
+    """
     if index_path.exists():
-        logger.info(f"[Indexer] Loading existing FAISS index from {index_path.name}")
-        index = faiss.read_index(str(index_path))
+        flags = 0
+        if mmap:
+            with index_path.open("rb") as f:
+                is_ivf = f.read(2) == b"Iw"  # IVF fourccs all start with "Iw"
+            if not is_ivf:
+                flags = faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY
+        logger.info(f"[Indexer] Loading existing FAISS index from {index_path.name}"
+                    f"{' (memory-mapped)' if flags else ''}")
+        index = faiss.read_index(str(index_path), flags)
         if index.d != expected_dim:
             raise ValueError(f"[Indexer] FAISS index dimension mismatch: "
                              f"expected {expected_dim}, found {index.d}")
         return index
 
     logger.info(f"[Indexer] Creating new FAISS index with dim={expected_dim}")
-    return faiss.IndexFlatL2(expected_dim)
+    return new_faiss_index(expected_dim)
 
 
 # --- Metadata Store Handling ---
-def load_metadata_store(path: Path) -> List[Dict[str, Any]]:
+def empty_metadata_store() -> Dict[str, Any]:
+    return {"next_file_id": 0, "files": {}}
+
+
+def load_metadata_store(path: Path) -> Any:
+    """
+    Reads a JSON-era metadata file for migration into the SQLite store. Files written
+    before stable ids existed hold a flat list with one row per vector; those are
+    returned unchanged.
+    """
     if path.exists():
         try:
             with path.open("r", encoding="utf-8") as f:
-                return json.load(f)
-        except json.JSONDecodeError:
-            logger.warning(f"[Indexer] Corrupted metadata file. Starting fresh: {path}")
-            return []
-    return []
+                data = json.load(f)
+            return data if data else empty_metadata_store()
+        except json.JSONDecodeError as e:
+            # Set the file aside (never silently overwrite it); the startup check rebuilds what it held.
+            quarantined = path.with_name(path.name + ".corrupt")
+            os.replace(path, quarantined)
+            logger.error(f"[Indexer] Corrupted metadata file ({e}); moved to {quarantined.name}")
+            return empty_metadata_store()
+    return empty_metadata_store()
 
 
-def save_metadata_store(path: Path, metadata: List[Dict[str, Any]]) -> None:
-    with path.open("w", encoding="utf-8") as f:
-        json.dump(metadata, f, indent=2)
-    logger.info(f"[Indexer] Saved metadata to {path.name} ({len(metadata)} entries)")
+def migrate_legacy_store(
+    index: faiss.Index,
+    legacy_rows: List[Dict[str, Any]]
+) -> Tuple[faiss.IndexIDMap2, Dict[str, Any]]:
+    """
+    Converts a positional IndexFlatL2 + per-vector metadata list into an id-mapped
+    cosine index keyed by file. Rows for the same path are folded into one file record,
+    and only the newest copy of a re-indexed path is kept.
+    """
+    vectors = index.reconstruct_n(0, index.ntotal) if index.ntotal else np.zeros((0, index.d), dtype=np.float32)
+    vectors = normalize_vectors(vectors)
+    rows_by_path: Dict[str, List[int]] = {}
+    meta_by_path: Dict[str, Dict[str, Any]] = {}
+    for row, meta in enumerate(legacy_rows[:index.ntotal]):
+        path = meta.get("file_path")
+        if not path:
+            continue
+        rows = rows_by_path.setdefault(path, [])
+        # A path that reappears after other files was re-indexed; keep the latest run.
+        if rows and rows[-1] != row - 1:
+            rows.clear()
+        rows.append(row)
+        meta_by_path[path] = meta
 
+    new_index = new_faiss_index(index.d)
+    store = empty_metadata_store()
+    for file_id, (path, rows) in enumerate(rows_by_path.items()):
+        rows = rows[:MAX_CHUNKS_PER_FILE]
+        new_index.add_with_ids(vectors[rows], make_vector_ids(file_id, len(rows)))
+        store["files"][str(file_id)] = {**meta_by_path[path], "num_chunks": len(rows)}
+    store["next_file_id"] = len(rows_by_path)
 
-# --- Main Indexing Function ---
-def index_file(
+    logger.info(f"[Indexer] Migrated {len(legacy_rows)} legacy row(s) into {len(rows_by_path)} file record(s)")
+    return new_index, store
+
+
+# --- Shared Input Validation ---
+def _to_embedding_array(embeddings: List[List[float]]) -> np.ndarray:
+    embedding_array = np.array(embeddings, dtype=np.float32)
+    if embedding_array.ndim == 1:
+        embedding_array = embedding_array.reshape(1, -1)
+
+    actual_dim = embedding_array.shape[1]
+    expected_dim = get_embedding_dim()
+    if actual_dim != expected_dim:
+        raise ValueError(f"[Indexer] Embedding dim mismatch: expected {expected_dim}, got {actual_dim}")
+    return embedding_array
+
+
+def _service_for(faiss_index_path: Optional[Path], metadata_store_path: Optional[Path]):
+    # Explicit paths address one index; otherwise the file is routed to its root's shard,
+    # on the index server when one is in use.
+    if faiss_index_path is None and metadata_store_path is None:
+        from src.core.utils.backend import get_backend
+        from src.core.utils.shards import get_sharded_index
+        return get_backend() or get_sharded_index()
+    from src.core.utils.index_service import get_index_service
+    return get_index_service(faiss_index_path, metadata_store_path)
+
+
+# --- Public Indexing API ---
+def upsert_file(
     embeddings: List[List[float]],
     file_metadata: Dict[str, str],
-    faiss_index_path: Path,
-    metadata_store_path: Path
-) -> None:
+    faiss_index_path: Optional[Path] = None,
+    metadata_store_path: Optional[Path] = None
+) -> Optional[int]:
+    """Indexes a file, replacing any vectors previously stored for the same path."""
     file_label = file_metadata.get("file_name", "UNKNOWN")
 
     if not embeddings:
         logger.warning(f"[Indexer] Skipping {file_label}: No embeddings provided.")
-        return
+        return None
 
     try:
-        # Convert to 2D NumPy array
-        embedding_array = np.array(embeddings, dtype=np.float32)
-        if embedding_array.ndim == 1:
-            embedding_array = embedding_array.reshape(1, -1)
+        embedding_array = _to_embedding_array(embeddings)
+        service = _service_for(faiss_index_path, metadata_store_path)
+        file_id = service.upsert(embedding_array, file_metadata)
+        logger.info(f"[Indexer] Upserted {len(embedding_array)} vector(s) for {file_label} (id={file_id})")
+        return file_id
 
-        actual_dim = embedding_array.shape[1]
-        expected_dim = embedding_dim
-
-        if actual_dim != expected_dim:
-            raise ValueError(f"[Indexer] Embedding dim mismatch: expected {expected_dim}, got {actual_dim}")
+    except LockHeld:
+        raise  # another process serves the index: the caller must know this write was not made
+    except Exception as e:
+        logger.error(f"[Indexer] Failed to index file: {file_label} | Error: {repr(e)}")
+        return None
 
-        # Load or create FAISS index
-        index = load_faiss_index(faiss_index_path, expected_dim)
 
-        # Add vectors to index
-        index.add(embedding_array)
-        faiss.write_index(index, str(faiss_index_path))
-        logger.info(f"[Indexer] Added {len(embedding_array)} vector(s) for {file_label}")
+def delete_file(
+    file_path: str,
+    faiss_index_path: Optional[Path] = None,
+    metadata_store_path: Optional[Path] = None
+) -> bool:
+    """Removes a file's vectors and metadata. Returns False if it was not indexed."""
+    try:
+        removed = _service_for(faiss_index_path, metadata_store_path).delete(file_path)
+        if removed:
+            logger.info(f"[Indexer] Deleted {Path(file_path).name} from index")
+        return removed
+    except LockHeld:
+        raise
+    except Exception as e:
+        logger.error(f"[Indexer] Failed to delete file: {file_path} | Error: {repr(e)}")
+        return False
 
-        # Append metadata
-        metadata = load_metadata_store(metadata_store_path)
-        metadata.extend([file_metadata] * len(embedding_array))
-        save_metadata_store(metadata_store_path, metadata)
 
+def relocate_file(
+    old_path: str,
+    file_metadata: Dict[str, str],
+    faiss_index_path: Optional[Path] = None,
+    metadata_store_path: Optional[Path] = None
+) -> bool:
+    """
+    Points an indexed file at its new location, keeping its vectors as they are.
+    Returns False if `old_path` was not indexed.
+    """
+    try:
+        moved = _service_for(faiss_index_path, metadata_store_path).relocate(old_path, file_metadata)
+        if moved:
+            logger.info(f"[Indexer] Relocated {Path(old_path).name} -> {file_metadata.get('parent_folder_path')}")
+        return moved
+    except LockHeld:
+        raise
     except Exception as e:
-        logger.error(f"[Indexer] Failed to index file: {file_label} | Error: {repr(e)}")
+        logger.error(f"[Indexer] Failed to relocate file: {old_path} | Error: {repr(e)}")
+        return False
+
+
+def index_file(
+    embeddings: List[List[float]],
+    file_metadata: Dict[str, str],
+    faiss_index_path: Path,
+    metadata_store_path: Path
+) -> None:
+    upsert_file(embeddings, file_metadata, faiss_index_path, metadata_store_path)
@@ -0,0 +1,84 @@
+# [lockfile.py] — Exclusive per-process lock files, released by the OS when the holder exits
+
+import os
+from pathlib import Path
+from typing import Optional
+
+if os.name == "nt":
+    import msvcrt
+
+    def _lock(fd: int) -> None:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+
+    def _unlock(fd: int) -> None:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+else:
+    import fcntl
+
+    def _lock(fd: int) -> None:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def _unlock(fd: int) -> None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+class LockHeld(RuntimeError):
+    pass
+
+
+class LockFile:
+    """
+    An exclusive lock on `path`, held until `release()`. The OS drops it when the
+    holding process exits or crashes, so a lock is never left stale; the file itself
+    stays in place and only carries the holder's PID for error messages.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._fd: Optional[int] = None
+
+    @property
+    def held(self) -> bool:
+        return self._fd is not None
+
+    def holder(self) -> Optional[int]:
+        """PID of the process that last took the lock, if it can be read."""
+        try:
+            return int(self.path.read_text(encoding="utf-8").strip())
+        except (OSError, ValueError):
+            return None
+
+    def acquire(self) -> "LockFile":
+        """Takes the lock, or raises LockHeld at once when another process has it."""
+        if self._fd is not None:
+            return self
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            _lock(fd)
+        except OSError:
+            os.close(fd)
+            holder = self.holder()
+            raise LockHeld(f"{self.path} is held by {f'process {holder}' if holder else 'another process'}") from None
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode("ascii"))
+        self._fd = fd
+        return self
+
+    def try_acquire(self) -> bool:
+        try:
+            self.acquire()
+            return True
+        except LockHeld:
+            return False
+
+    def release(self) -> None:
+        if self._fd is None:
+            return
+        try:
+            _unlock(self._fd)
+        finally:
+            os.close(self._fd)
+            self._fd = None
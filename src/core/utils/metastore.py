@@ -0,0 +1,347 @@
+# [metastore.py] — SQLite-backed, file-normalized metadata for the FAISS index
+
+import json
+import logging
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+
+from src.core.utils.indexer import file_id_of
+
+# --- Logger Setup ---
+logger = logging.getLogger(__name__)
+
+# --- Schema ---
+# One row per file. Chunk vectors need no rows of their own: a vector id encodes its
+# file id (see indexer.make_vector_ids), so FAISS row -> file is a primary-key lookup.
+# Each file also keeps the sum of its (normalized) chunk vectors, and `folders` keeps
+# the running sum per parent folder, so folder centroids never need a full rescan.
+SCHEMA_VERSION = 2
+COLUMNS = ("file_path", "file_name", "parent_folder", "parent_folder_path", "file_type", "content_hash")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    file_id            INTEGER PRIMARY KEY,
+    file_path          TEXT NOT NULL UNIQUE,
+    file_name          TEXT,
+    parent_folder      TEXT,
+    parent_folder_path TEXT,
+    file_type          TEXT,
+    content_hash       TEXT,
+    num_chunks         INTEGER NOT NULL DEFAULT 0,
+    extra              TEXT,
+    vec_sum            BLOB
+);
+CREATE INDEX IF NOT EXISTS idx_files_hash ON files(content_hash);
+CREATE INDEX IF NOT EXISTS idx_files_folder ON files(parent_folder_path);
+CREATE TABLE IF NOT EXISTS folders (
+    folder_id   INTEGER PRIMARY KEY,
+    folder_path TEXT NOT NULL UNIQUE,
+    num_files   INTEGER NOT NULL DEFAULT 0,
+    num_vectors INTEGER NOT NULL DEFAULT 0,
+    vec_sum     BLOB
+);
+CREATE TABLE IF NOT EXISTS store_meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS removed_paths (
+    file_path  TEXT PRIMARY KEY,
+    removed_at REAL NOT NULL
+);
+"""
+
+
+class MetadataStore:
+    """
+    File-level metadata keyed by file id, with lookups by path and content hash.
+
+    Writes join an open transaction and only become durable on `commit()`, which
+    the index service calls right after it persists the matching FAISS index.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        columns = {r["name"] for r in self._conn.execute("PRAGMA table_info(files)")}
+        if "vec_sum" not in columns:
+            # v1 stores predate folder summaries; the index service backfills them.
+            self._conn.execute("ALTER TABLE files ADD COLUMN vec_sum BLOB")
+        if self.get_value("schema_version") != SCHEMA_VERSION:
+            self.set_value("schema_version", SCHEMA_VERSION)
+        self._conn.commit()
+        self._touched_folders: Set[str] = set()
+        self._touched_files: Set[int] = set()
+
+    # --- Row Conversion ---
+    @staticmethod
+    def _row_to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+        meta = {c: row[c] for c in COLUMNS}
+        if row["extra"]:
+            meta.update(json.loads(row["extra"]))
+        meta["num_chunks"] = row["num_chunks"]
+        return meta
+
+    @staticmethod
+    def _to_blob(vec: Optional[np.ndarray]) -> Optional[bytes]:
+        return None if vec is None else np.asarray(vec, dtype=np.float64).tobytes()
+
+    @staticmethod
+    def _from_blob(blob: Optional[bytes]) -> Optional[np.ndarray]:
+        return None if blob is None else np.frombuffer(blob, dtype=np.float64).copy()
+
+    @staticmethod
+    def _split(meta: Dict[str, Any]) -> Tuple[List[Any], Optional[str]]:
+        known = [meta.get(c) for c in COLUMNS]
+        extra = {k: v for k, v in meta.items() if k not in COLUMNS and k != "num_chunks"}
+        return known, (json.dumps(extra) if extra else None)
+
+    # --- Lookups ---
+    def get(self, file_id: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM files WHERE file_id = ?", (int(file_id),)).fetchone()
+        return self._row_to_dict(row) if row else None
+
+    def get_many(self, file_ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+        ids = sorted({int(i) for i in file_ids})
+        found: Dict[int, Dict[str, Any]] = {}
+        with self._lock:
+            for start in range(0, len(ids), 500):
+                batch = ids[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                for row in self._conn.execute(f"SELECT * FROM files WHERE file_id IN ({placeholders})", batch):
+                    found[row["file_id"]] = self._row_to_dict(row)
+        return found
+
+    def get_by_vector_id(self, vector_id: int) -> Optional[Dict[str, Any]]:
+        return self.get(file_id_of(vector_id))
+
+    def id_for_path(self, file_path: str) -> Optional[int]:
+        with self._lock:
+            row = self._conn.execute("SELECT file_id FROM files WHERE file_path = ?", (file_path,)).fetchone()
+        return row["file_id"] if row else None
+
+    def ids_for_hash(self, content_hash: str) -> List[int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT file_id FROM files WHERE content_hash = ?", (content_hash,)).fetchall()
+        return [r["file_id"] for r in rows]
+
+    def chunk_counts(self) -> List[Tuple[int, int]]:
+        """Returns (file_id, num_chunks) for every file, ordered by id."""
+        with self._lock:
+            rows = self._conn.execute("SELECT file_id, num_chunks FROM files ORDER BY file_id").fetchall()
+        return [(r["file_id"], r["num_chunks"]) for r in rows]
+
+    def iter_files(self) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM files ORDER BY file_id").fetchall()
+        for row in rows:
+            yield row["file_id"], self._row_to_dict(row)
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+    def chunk_counts_in_folders(self, folder_paths: Iterable[str]) -> List[Tuple[int, int]]:
+        """Returns (file_id, num_chunks) for every file directly inside the given folders."""
+        paths = sorted(set(folder_paths))
+        counts: List[Tuple[int, int]] = []
+        with self._lock:
+            for start in range(0, len(paths), 500):
+                batch = paths[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                counts.extend(
+                    (r["file_id"], r["num_chunks"]) for r in self._conn.execute(
+                        f"SELECT file_id, num_chunks FROM files WHERE parent_folder_path IN ({placeholders})", batch)
+                )
+        return sorted(counts)
+
+    # --- Folder Summaries ---
+    def folder_summary(self, folder_path: str) -> Optional[Tuple[int, int, np.ndarray]]:
+        """Returns (folder_id, num_vectors, vec_sum) for a folder, if it holds any files."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT folder_id, num_vectors, vec_sum FROM folders WHERE folder_path = ?", (folder_path,)
+            ).fetchone()
+        if row is None or row["vec_sum"] is None:
+            return None
+        return row["folder_id"], row["num_vectors"], self._from_blob(row["vec_sum"])
+
+    def iter_folder_summaries(self) -> Iterator[Tuple[int, str, int, np.ndarray]]:
+        """Yields (folder_id, folder_path, num_vectors, vec_sum) for every non-empty folder."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM folders WHERE vec_sum IS NOT NULL ORDER BY folder_id").fetchall()
+        for row in rows:
+            yield row["folder_id"], row["folder_path"], row["num_vectors"], self._from_blob(row["vec_sum"])
+
+    # --- File Summaries ---
+    def iter_file_sums(self) -> Iterator[Tuple[int, np.ndarray]]:
+        """Yields (file_id, vec_sum) for every file whose sum is known."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT file_id, vec_sum FROM files WHERE vec_sum IS NOT NULL ORDER BY file_id").fetchall()
+        for row in rows:
+            yield row["file_id"], self._from_blob(row["vec_sum"])
+
+    def file_sum(self, file_id: int) -> Optional[np.ndarray]:
+        with self._lock:
+            row = self._conn.execute("SELECT vec_sum FROM files WHERE file_id = ?", (int(file_id),)).fetchone()
+        return self._from_blob(row["vec_sum"]) if row else None
+
+    def pop_touched_files(self) -> Set[int]:
+        """Returns the ids of files written or deleted since the last call."""
+        with self._lock:
+            touched, self._touched_files = self._touched_files, set()
+        return touched
+
+    def pop_touched_folders(self) -> Set[str]:
+        """Returns the folder paths whose summaries changed since the last call."""
+        with self._lock:
+            touched, self._touched_folders = self._touched_folders, set()
+        return touched
+
+    def _adjust_folder(self, folder_path: Optional[str], sign: int, num_vectors: int, vec_sum: Optional[np.ndarray]) -> None:
+        if not folder_path or vec_sum is None:
+            return
+        row = self._conn.execute(
+            "SELECT num_files, num_vectors, vec_sum FROM folders WHERE folder_path = ?", (folder_path,)
+        ).fetchone()
+        files = (row["num_files"] if row else 0) + sign
+        vectors = (row["num_vectors"] if row else 0) + sign * num_vectors
+        current = self._from_blob(row["vec_sum"]) if row and row["vec_sum"] is not None else np.zeros_like(vec_sum)
+        if files <= 0:
+            self._conn.execute("DELETE FROM folders WHERE folder_path = ?", (folder_path,))
+        elif row is None:
+            self._conn.execute(
+                "INSERT INTO folders (folder_path, num_files, num_vectors, vec_sum) VALUES (?, ?, ?, ?)",
+                (folder_path, files, vectors, self._to_blob(current + sign * vec_sum)),
+            )
+        else:
+            self._conn.execute(
+                "UPDATE folders SET num_files = ?, num_vectors = ?, vec_sum = ? WHERE folder_path = ?",
+                (files, vectors, self._to_blob(current + sign * vec_sum), folder_path),
+            )
+        self._touched_folders.add(folder_path)
+
+    def rebuild_folder_summaries(self, file_sums: Dict[int, np.ndarray]) -> None:
+        """Replaces every per-file vector sum and recomputes the folder table from them."""
+        with self._lock:
+            self._conn.execute("UPDATE files SET vec_sum = NULL")
+            self._conn.execute("DELETE FROM folders")
+            for file_id, vec_sum in file_sums.items():
+                self._conn.execute("UPDATE files SET vec_sum = ? WHERE file_id = ?",
+                                   (self._to_blob(vec_sum), int(file_id)))
+            rows = self._conn.execute(
+                "SELECT parent_folder_path, num_chunks, vec_sum FROM files WHERE vec_sum IS NOT NULL").fetchall()
+            for row in rows:
+                self._adjust_folder(row["parent_folder_path"], 1, row["num_chunks"], self._from_blob(row["vec_sum"]))
+            self._touched_folders.clear()
+            self._touched_files.clear()
+
+    # --- Mutations ---
+    # Folder sums follow every put/delete inside the same transaction, so they are
+    # exactly as durable as the file rows they summarize.
+    def put(self, file_id: int, meta: Dict[str, Any], vec_sum: Optional[np.ndarray] = None) -> None:
+        """Inserts or replaces a file row. Without `vec_sum` the row keeps its previous sum."""
+        known, extra = self._split(meta)
+        num_chunks = int(meta.get("num_chunks", 0))
+        with self._lock:
+            old = self._conn.execute(
+                "SELECT parent_folder_path, num_chunks, vec_sum FROM files WHERE file_id = ?", (int(file_id),)
+            ).fetchone()
+            old_sum = self._from_blob(old["vec_sum"]) if old else None
+            if old is not None:
+                self._adjust_folder(old["parent_folder_path"], -1, old["num_chunks"], old_sum)
+            new_sum = vec_sum if vec_sum is not None else old_sum
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO files (file_id, {', '.join(COLUMNS)}, num_chunks, extra, vec_sum) "
+                f"VALUES (?, {', '.join('?' * len(COLUMNS))}, ?, ?, ?)",
+                [int(file_id), *known, num_chunks, extra, self._to_blob(new_sum)],
+            )
+            self._adjust_folder(meta.get("parent_folder_path"), 1, num_chunks, new_sum)
+            self._touched_files.add(int(file_id))
+
+    def delete(self, file_id: int) -> None:
+        with self._lock:
+            old = self._conn.execute(
+                "SELECT parent_folder_path, num_chunks, vec_sum FROM files WHERE file_id = ?", (int(file_id),)
+            ).fetchone()
+            if old is not None:
+                self._adjust_folder(old["parent_folder_path"], -1, old["num_chunks"], self._from_blob(old["vec_sum"]))
+            self._conn.execute("DELETE FROM files WHERE file_id = ?", (int(file_id),))
+            self._touched_files.add(int(file_id))
+
+    # --- Removal Log ---
+    # Paths deleted or moved away from, so a rebuild that scanned the tree while they
+    # still existed can drop them before it is swapped in (see ShardedIndex._swap).
+    def note_removed(self, file_path: str, removed_at: float) -> None:
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO removed_paths (file_path, removed_at) VALUES (?, ?)",
+                               (file_path, float(removed_at)))
+
+    def removed_since(self, since: float) -> List[str]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT file_path FROM removed_paths WHERE removed_at >= ? ORDER BY removed_at", (float(since),))
+            return [row["file_path"] for row in rows.fetchall()]
+
+    def prune_removed(self, before: float) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM removed_paths WHERE removed_at < ?", (float(before),))
+
+    # --- Store-level Values ---
+    def get_value(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM store_meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row["value"]) if row else default
+
+    def set_value(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO store_meta (key, value) VALUES (?, ?)", (key, json.dumps(value)))
+
+    def integrity_ok(self) -> bool:
+        """Runs SQLite's quick_check (page and index structure, no row-by-row compare)."""
+        with self._lock:
+            return self._conn.execute("PRAGMA quick_check").fetchone()[0] == "ok"
+
+    # --- Transactions ---
+    def commit(self) -> None:
+        with self._lock:
+            self._conn.commit()
+
+    def rollback(self) -> None:
+        with self._lock:
+            self._conn.rollback()
+
+    def vacuum(self) -> None:
+        """Commits, then rewrites the database file without free pages and truncates its WAL."""
+        with self._lock:
+            self._conn.commit()
+            self._conn.execute("VACUUM")
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.commit()
+            self._conn.close()
+
+    # --- Bulk Import ---
+    def import_legacy(self, store: Dict[str, Any]) -> None:
+        """Loads a JSON-era {"next_file_id", "files", "tombstones"} store."""
+        with self._lock:
+            for fid, meta in store.get("files", {}).items():
+                self.put(int(fid), meta)
+            self.set_value("next_file_id", int(store.get("next_file_id", 0)))
+            self.set_value("tombstones", list(store.get("tombstones", [])))
+            self._conn.commit()
+        logger.info(f"[MetaStore] Imported {len(store.get('files', {}))} file record(s) into {self.path.name}")
@@ -1,6 +1,9 @@
 import json
+import os
+import re
+import hashlib
 from pathlib import Path
-from typing import List, Union, Dict
+from typing import Any, List, Optional, Union, Dict
 import logging
 
 logger = logging.getLogger(__name__)
@@ -17,7 +20,129 @@ LOGS_FILE = DATA_DIR / "logs.jsonl"
 
 # --- FAISS files (directly in data/) ---
 FAISS_INDEX_FILE = DATA_DIR / "index.faiss"
-FAISS_METADATA_FILE = DATA_DIR / "index_meta.jsonl"
+FAISS_METADATA_FILE = DATA_DIR / "index_meta.sqlite3"
+LEGACY_FAISS_METADATA_FILE = DATA_DIR / "index_meta.jsonl"  # JSON store, migrated on first load
+SHARDS_DIR = DATA_DIR / "shards"  # one index + metadata store per organized root
+PROJECTIONS_DIR = DATA_DIR / "projections"  # fitted PCA projections, one file per tag
+MODELS_DIR = DATA_DIR / "models"  # index namespaces of encoder models other than the default
+EMBED_CACHE_FILE = DATA_DIR / "embed_cache.sqlite3"  # chunk vectors by content hash, shared by every model
+EXTRACT_CACHE_FILE = DATA_DIR / "extract_cache.sqlite3"  # extracted document text by path, size and mtime
+
+# --- Encoder model ---
+# The default model's index lives directly in data/; any other model gets its own
+# namespace under data/models/, so two models' indexes can coexist during a switch.
+DEFAULT_MODEL = "all-MiniLM-L6-v2"
+MODEL_DEFAULTS: Dict[str, Any] = {
+    "embedding_model": DEFAULT_MODEL,      # the encoder the index is served with
+    "reembed_batch_files": 16,             # files re-embedded between pauses during a model switch
+    "reembed_pause_seconds": 2.0,          # pause after each batch, so sorting keeps priority
+}
+
+# --- Per-file budget ---
+# Bounds the latency of one file: long documents are sampled, not read in full.
+BUDGET_DEFAULTS: Dict[str, Any] = {
+    "file_max_pages": 50,                  # PDF pages / PPTX slides parsed per file (0 = all)
+    "file_max_chunks": 40,                 # chunks embedded per file (0 = all)
+    "file_sampling": "spread",             # "spread" (head, tail, even middle), "head_tail" or "head"
+    "file_max_mb": 4,                      # read from text and CSV files (0 = all)
+    "file_max_rows": 20_000,               # CSV rows / workbook rows read (0 = all)
+    "file_max_cells": 100_000,             # non-empty workbook cells read (0 = all)
+}
+
+# --- Chunking ---
+# Chunks are sized in the encoder's own tokens, so none runs past its max_seq_length.
+CHUNKING_DEFAULTS: Dict[str, Any] = {
+    "chunk_by_tokens": True,               # False (or no local tokenizer) falls back to 300-word chunks
+    "chunk_overlap_ratio": 0.15,           # share of each chunk repeated at the start of the next
+}
+
+# --- Extractors ---
+EXTRACTOR_DEFAULTS: Dict[str, Any] = {
+    # Extractors tried first per file type; the rest follow in registration order.
+    "extract_order": {"pdf": ["pymupdf", "pdfplumber", "pypdf"]},
+}
+
+# --- Bulk builds ---
+BUILDER_DEFAULTS: Dict[str, Any] = {
+    "builder_workers": 0,                  # extraction processes (0 = one per CPU, less one for the encoder)
+    "builder_parallel_min_files": 32,      # smaller folders are processed in-process
+    "builder_encode_batch_chunks": 256,    # chunks gathered from several files per forward pass
+    "builder_progress_seconds": 10,        # interval of the build's progress log lines
+}
+
+# --- Caches ---
+EMBED_CACHE_DEFAULTS: Dict[str, Any] = {
+    "embed_cache_enabled": True,           # reuse chunk vectors of content already embedded
+    "embed_cache_max_mb": 512,             # least recently used entries are evicted beyond this
+}
+EXTRACT_CACHE_DEFAULTS: Dict[str, Any] = {
+    "extract_cache_enabled": True,         # reuse text parsed from unchanged PDF/Office/CSV files
+    "extract_cache_max_mb": 256,           # compressed size; least recently used entries are evicted beyond this
+    "extract_cache_max_entry_mb": 8,       # larger (compressed) extractions are not cached
+}
+
+# --- Index tuning defaults (any key can be overridden in config.json) ---
+INDEX_DEFAULTS: Dict[str, Any] = {
+    "index_ann_type": "hnsw",              # "hnsw" or "ivf" once the flat tier is outgrown
+    "index_flat_max_vectors": 200_000,     # exact search up to this many live vectors
+    "index_hnsw_m": 32,
+    "index_hnsw_ef_construction": 80,
+    "index_hnsw_ef_search": 64,
+    "index_ivf_nprobe": 16,
+    "index_storage": "flat",               # "flat" (float32), "sq8" or "pq" vector codes
+    "index_compress_min_vectors": 20_000,  # compressed codes need this many vectors to train
+    "index_pq_m": 48,                      # PQ sub-quantizers (must divide the dimension)
+    "index_route_top_folders": 8,          # folders shortlisted by centroid before chunk search (0 = off)
+    "index_route_min_vectors": 50_000,     # below this a full chunk search is cheap enough
+    "index_search_workers": 0,             # threads for shard fan-out (0 = one per CPU)
+    "index_mmap": True,                    # map the snapshot read-only; new vectors go to a heap delta
+    "index_projection": "",                # tag of the PCA projection new indexes use ("" = full dim)
+    "index_checkpoint_interval": 300,      # seconds of WAL activity before a checkpoint
+    "index_wal_max_mb": 64,                # WAL size that forces an early checkpoint
+    "index_vacuum_interval_hours": 168,    # scheduled vacuum run by the watcher (0 = off)
+    "index_vacuum_verify_hashes": False,   # scheduled runs also re-hash rows without a recorded stat
+    "index_server": False,                 # route embed/search/index calls to a running index server
+    "index_server_socket": "",             # Unix socket path ("" = data/index.sock)
+    "index_server_batch_ms": 5,            # how long the server waits to coalesce concurrent calls
+    "index_server_max_batch": 64,          # most calls served by one forward pass / FAISS search
+}
+
+# --- Active model ---
+# Resolved once per process; the switch-over changes config.json and every process
+# moves to the new namespace on its next index refresh (see ShardedIndex.refresh).
+_active_model: Optional[str] = None
+
+def get_model_settings() -> Dict[str, Any]:
+    return _load_settings(MODEL_DEFAULTS)
+
+def configured_model() -> str:
+    """The model config.json names. While the file is mid-rewrite, the one already active."""
+    if not CONFIG_FILE.exists():
+        return DEFAULT_MODEL
+    try:
+        with CONFIG_FILE.open("r", encoding="utf-8") as f:
+            return json.load(f).get("embedding_model") or DEFAULT_MODEL
+    except (OSError, ValueError):
+        return _active_model or DEFAULT_MODEL
+
+def get_active_model() -> str:
+    global _active_model
+    if _active_model is None:
+        _active_model = configured_model()
+    return _active_model
+
+def set_active_model(model_name: str) -> None:
+    global _active_model
+    _active_model = model_name
+
+def get_namespace_dir(model: Optional[str] = None) -> Path:
+    """Directory holding a model's index files (the active model by default)."""
+    model = model or get_active_model()
+    if model == DEFAULT_MODEL:
+        return DATA_DIR
+    slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", model)[:60]
+    digest = hashlib.sha1(model.encode("utf-8")).hexdigest()[:8]
+    return MODELS_DIR / f"{slug}-{digest}"
 
 # --- Path normalization ---
 def normalize_path(p: Union[str, Path]) -> str:
@@ -33,15 +158,37 @@ def get_config_file() -> Path:
 def get_logs_path() -> Path:
     return LOGS_FILE
 
-def get_faiss_index_path() -> Path:
-    return FAISS_INDEX_FILE
+def get_faiss_index_path(model: Optional[str] = None) -> Path:
+    model = model or get_active_model()
+    return FAISS_INDEX_FILE if model == DEFAULT_MODEL else get_namespace_dir(model) / "index.faiss"
+
+def get_faiss_metadata_path(model: Optional[str] = None) -> Path:
+    model = model or get_active_model()
+    return FAISS_METADATA_FILE if model == DEFAULT_MODEL else get_namespace_dir(model) / "index_meta.sqlite3"
+
+def get_legacy_faiss_metadata_path() -> Path:
+    return LEGACY_FAISS_METADATA_FILE
 
-def get_faiss_metadata_path() -> Path:
-    return FAISS_METADATA_FILE
+def get_shards_dir(model: Optional[str] = None) -> Path:
+    model = model or get_active_model()
+    return SHARDS_DIR if model == DEFAULT_MODEL else get_namespace_dir(model) / "shards"
+
+def get_projections_dir() -> Path:
+    return PROJECTIONS_DIR
+
+def get_embed_cache_path() -> Path:
+    return EMBED_CACHE_FILE
+
+def get_extract_cache_path() -> Path:
+    return EXTRACT_CACHE_FILE
 
 def get_data_dir() -> Path:
     return DATA_DIR
 
+def get_server_socket_path() -> Path:
+    configured = get_index_settings()["index_server_socket"]
+    return Path(configured).expanduser() if configured else DATA_DIR / "index.sock"
+
 def get_unsorted_folder() -> Path:
     return Path.home() / "Documents" / "sortedpc" / "unsorted"
 
@@ -65,6 +212,13 @@ def get_watch_paths() -> List[str]:
 def get_organized_paths() -> List[str]:
     return _load_list_from_json(PATHS_FILE, "organized_paths")
 
+def save_paths(watch_paths: List[str], organized_paths: List[str]) -> None:
+    """Replaces paths.json in one step: the watcher re-reads it on every poll and must never see it half-written."""
+    tmp_path = PATHS_FILE.with_name(PATHS_FILE.name + ".tmp")
+    with tmp_path.open("w", encoding="utf-8") as f:
+        json.dump({"watch_paths": watch_paths, "organized_paths": organized_paths}, f, indent=2)
+    os.replace(tmp_path, PATHS_FILE)
+
 # --- config.json accessors ---
 def get_builder_state() -> bool:
     return _load_config_flag("builder_busy")
@@ -78,6 +232,31 @@ def get_watcher_state() -> bool:
 def get_scoring_weights() -> Dict[str, float]:
     return _load_dict_from_json(CONFIG_FILE, keys=["alpha", "beta", "gamma", "delta"])
 
+def get_index_settings() -> Dict[str, Any]:
+    return _load_settings(INDEX_DEFAULTS)
+
+def get_budget_settings() -> Dict[str, Any]:
+    return _load_settings(BUDGET_DEFAULTS)
+
+def get_chunking_settings() -> Dict[str, Any]:
+    return _load_settings(CHUNKING_DEFAULTS)
+
+def get_processing_settings() -> Dict[str, Any]:
+    """Budget and chunking settings from one read of config.json, for one processed file."""
+    return _load_settings({**BUDGET_DEFAULTS, **CHUNKING_DEFAULTS})
+
+def get_extractor_settings() -> Dict[str, Any]:
+    return _load_settings(EXTRACTOR_DEFAULTS)
+
+def get_builder_settings() -> Dict[str, Any]:
+    return _load_settings(BUILDER_DEFAULTS)
+
+def get_embed_cache_settings() -> Dict[str, Any]:
+    return _load_settings(EMBED_CACHE_DEFAULTS)
+
+def get_extract_cache_settings() -> Dict[str, Any]:
+    return _load_settings(EXTRACT_CACHE_DEFAULTS)
+
 # --- log access helpers ---
 def load_all_logs() -> List[Dict]:
     if not LOGS_FILE.exists():
@@ -118,3 +297,14 @@ def _load_config_flag(key: str) -> bool:
     with CONFIG_FILE.open("r", encoding="utf-8") as f:
         config = json.load(f)
     return bool(config.get(key, False))
+
+def _load_settings(defaults: Dict[str, Any]) -> Dict[str, Any]:
+    if not CONFIG_FILE.exists():
+        return dict(defaults)
+    try:
+        with CONFIG_FILE.open("r", encoding="utf-8") as f:
+            config = json.load(f)
+    except json.JSONDecodeError:
+        logger.warning(f"[Paths] Unreadable config file, using defaults: {CONFIG_FILE}")
+        return dict(defaults)
+    return {k: config.get(k, v) for k, v in defaults.items()}
@@ -1,145 +1,494 @@
-# [processor.py] — Patched for Deferred Model Loading
+# [processor.py] — Turns a file into cleaned, budgeted chunks and their embeddings
 
 import hashlib
+import json
 import logging
 import re
+import sqlite3
+import threading
 from pathlib import Path
-from typing import Dict, List, Union
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple, Union
 
-import docx
 import numpy as np
-import pandas as pd
-import pdfplumber
-from openpyxl import load_workbook
-from pptx import Presentation
-from sentence_transformers import SentenceTransformer
-from nltk.corpus import stopwords
+
+from src.core.utils import extractor, paths
 
 # --- Logger Setup ---
 logging.getLogger("pdfminer").setLevel(logging.ERROR)
 logger = logging.getLogger(__name__)
 
 # --- Globals & Constants ---
-STOPWORDS = set(stopwords.words('english'))
-MODEL_NAME = "all-MiniLM-L6-v2"
+# Importing this module stays cheap: sentence_transformers is imported with the
+# first model, NLTK's stopwords with the first text cleaned, and each format's
+# parser library with the first file of that type (see extractor.py).
+_stopword_set: Optional[FrozenSet[str]] = None
+# The encoder the index is served with ("embedding_model" in config.json). During a
+# model switch the re-embedder also loads the target model alongside it.
+MODEL_NAME = paths.get_active_model()
+
+# --- Models ---
+# Models are loaded on first use, one instance per model name.
+_models: Dict[str, Any] = {}
+_model_lock = threading.Lock()
+# Output sizes of common encoders, so the index can be opened without loading the
+# model just to check this value. Other models are loaded once to ask.
+MODEL_DIMS: Dict[str, int] = {
+    "all-MiniLM-L6-v2": 384,
+    "all-MiniLM-L12-v2": 384,
+    "paraphrase-MiniLM-L6-v2": 384,
+    "multi-qa-MiniLM-L6-cos-v1": 384,
+    "BAAI/bge-small-en-v1.5": 384,
+    "all-mpnet-base-v2": 768,
+    "all-distilroberta-v1": 768,
+    "multi-qa-mpnet-base-dot-v1": 768,
+    "BAAI/bge-base-en-v1.5": 768,
+}
+_model_dims: Dict[str, int] = {}
+
+# Chunking parameters. Cached embeddings are keyed by them (see chunking_signature),
+# so changing how text is cleaned or split never serves vectors of the old chunks.
+# Chunks are measured in the model's tokens when its tokenizer is available locally;
+# the word counts are the fallback.
+CHUNK_WORDS = 300
+CHUNK_OVERLAP = 50
+_MAX_SEQ_FALLBACK = 512  # for tokenizers that report no real limit of their own
+_tokenizers: Dict[str, Any] = {}  # model name -> (tokenizer, max_seq_length), or None if it cannot be loaded
+_tokenizer_lock = threading.Lock()
+
+# Formats worth caching the extracted text of (see _extract_content). Bump
+# EXTRACTOR_VERSION whenever a parser's output changes, to invalidate old entries.
+CACHED_TYPES = ("pdf", "docx", "pptx", "xlsx", "csv")
+EXTRACTOR_VERSION = "2"  # 2: PyMuPDF replaced pdfplumber for PDFs
+
+
+def get_model_name() -> str:
+    return MODEL_NAME
+
+
+def get_model_dim(model_name: str) -> int:
+    """Embedding dimension of `model_name`."""
+    if model_name in MODEL_DIMS:
+        return MODEL_DIMS[model_name]
+    if model_name not in _model_dims:
+        _model_dims[model_name] = int(_load_model(model_name=model_name).get_sentence_embedding_dimension())
+    return _model_dims[model_name]
+
+
+def get_embedding_dim() -> int:
+    """Embedding dimension of the active model."""
+    return get_model_dim(MODEL_NAME)
 
-# --- Patched Block: Deferred Model Loading ---
-# The model is no longer loaded here. It is set to None.
-_model = None
-# The embedding dimension is a fixed constant for this model.
-# Hardcoding it here avoids loading the model just to check this value.
-embedding_dim = 384
-# --- End Patched Block ---
+
+def set_active_model(model_name: str) -> None:
+    """Makes this process embed with `model_name` from now on; other loaded models are released."""
+    global MODEL_NAME
+    with _model_lock:
+        MODEL_NAME = model_name
+        paths.set_active_model(model_name)
+        for name in [n for n in _models if n != model_name]:
+            del _models[name]
+
+
+def __getattr__(name: str) -> Any:
+    # `embedding_dim` follows the active model instead of being fixed at import.
+    if name == "embedding_dim":
+        return get_embedding_dim()
+    if name == "STOPWORDS":
+        return _stopwords()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 # --------------------------------------------------------------------------
-# --- TEXT EXTRACTION LOGIC (No changes needed)
+# --- TEXT EXTRACTION & CLEANING
 # --------------------------------------------------------------------------
-def _extract_content(path: Path, file_type: str) -> str:
-    """Extracts raw text content from a file."""
+def _sample_indices(total: int, budget: int, strategy: str) -> List[int]:
+    """
+    Which of `total` pages (or chunks) to keep within `budget`; all of them when
+    they fit. "head" keeps the first ones, "head_tail" splits the budget between
+    both ends, and "spread" keeps half at the head, a quarter at the tail and
+    spaces the rest evenly through the middle.
+    """
+    if budget <= 0 or total <= budget:
+        return list(range(total))
+    if strategy == "head" or budget < 3:
+        return list(range(budget))
+    if strategy == "head_tail":
+        head = (budget + 1) // 2
+        return list(range(head)) + list(range(total - (budget - head), total))
+    head, tail = budget // 2, max(1, budget // 4)
+    middle = budget - head - tail
+    step = (total - tail - head) / (middle + 1)
+    return list(range(head)) + [head + int(step * (i + 1)) for i in range(middle)] + list(range(total - tail, total))
+
+def _parse_content(path: Path, file_type: str, budget: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+    """
+    Parses raw text content out of a file with the fastest extractor that works
+    for it (see extractor.py); raises when none can read it. Paged formats are read
+    only up to the page budget, and text, CSV and workbooks are streamed up to the
+    byte, row and cell caps, so latency and memory stay bounded whatever the file's
+    size. The returned info says what was skipped.
+    """
+    max_pages, strategy = int(budget["file_max_pages"]), budget["file_sampling"]
+    limits = extractor.Limits(max_bytes=int(float(budget["file_max_mb"]) * 1e6), max_rows=int(budget["file_max_rows"]),
+                              max_cells=int(budget["file_max_cells"]))
+    result = extractor.extract(path, file_type, lambda num_pages: _sample_indices(num_pages, max_pages, strategy), limits)
+    info: Dict[str, Any] = {}
+    if result.pages_read < result.pages_total:
+        info.update(pages_total=result.pages_total, pages_read=result.pages_read)
+    if result.capped_by:
+        info["capped_by"] = result.capped_by
+    return result.text, info
+
+def _extractor_signature(budget: Dict[str, Any]) -> str:
+    return (f"{EXTRACTOR_VERSION}/pages-{budget['file_max_pages']}-{budget['file_sampling']}"
+            f"/caps-{budget['file_max_mb']}-{budget['file_max_rows']}-{budget['file_max_cells']}")
+
+def _extract(path: Path, file_type: str, budget: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+    """
+    Extracts raw text content from a file, with what the page budget left out.
+    Parsed documents are served from the extraction cache while the file's size
+    and mtime are unchanged; plain text is cheaper to re-read than to cache.
+    """
+    cache = None
+    if file_type in CACHED_TYPES:
+        from src.core.utils.extractcache import get_extract_cache
+        try:
+            cache = get_extract_cache()
+            key = cache.stat_key(path) if cache else None
+            cached = cache.get(key, _extractor_signature(budget)) if cache else None
+        except (OSError, sqlite3.Error) as e:
+            logger.warning(f"[Processor] Extraction cache lookup failed for {path.name}: {repr(e)}")
+            cache = cached = None
+        if cached is not None:
+            return cached
     try:
-        if file_type == "pdf":
-            with pdfplumber.open(path) as pdf:
-                return "\n".join(page.extract_text() or "" for page in pdf.pages)
-        elif file_type == "docx":
-            doc = docx.Document(path)
-            return "\n".join(p.text for p in doc.paragraphs)
-        elif file_type == "pptx":
-            prs = Presentation(path)
-            return "\n".join(shape.text for slide in prs.slides for shape in slide.shapes if hasattr(shape, "text"))
-        elif file_type == "xlsx":
-            wb = load_workbook(path, data_only=True)
-            return "\n".join(str(cell.value) for ws in wb.worksheets for row in ws.iter_rows() for cell in row if cell.value is not None)
-        elif file_type == "csv":
-            df = pd.read_csv(path)
-            return df.astype(str).to_string(index=False)
-        elif file_type in ("txt", "md"):
-            return path.read_text(encoding="utf-8", errors="ignore")
-        else:
-            return ""
+        text, info = _parse_content(path, file_type, budget)
     except Exception as e:
         logger.error(f"[Processor] Failed to read {path.name} ({file_type}): {e}")
-        return ""
+        return "", {}  # failures are not cached, so the next attempt parses again
+    if cache is not None:
+        try:
+            cache.put(key, _extractor_signature(budget), text, info)
+        except sqlite3.Error as e:
+            logger.warning(f"[Processor] Could not cache the text of {path.name}: {repr(e)}")
+    return text, info
+
+def _extract_content(path: Path, file_type: str) -> str:
+    """Extracts raw text content from a file."""
+    return _extract(path, file_type, paths.get_budget_settings())[0]
+
+def _stopwords() -> FrozenSet[str]:
+    global _stopword_set
+    if _stopword_set is None:
+        from nltk.corpus import stopwords
+        _stopword_set = frozenset(stopwords.words('english'))
+    return _stopword_set
+
+class _PunctuationTable(dict):
+    """
+    `str.translate` table that blanks punctuation and symbols: every character that
+    is neither a word character nor whitespace, exactly as `_pattern` defines them.
+    Entries are filled in the first time a code point is seen, so the table covers
+    all of Unicode while only holding the characters that actually occur.
+    """
+
+    _pattern = re.compile(r"[^\w\s]")
+
+    def __missing__(self, code_point: int) -> int:
+        value = 32 if self._pattern.match(chr(code_point)) else code_point  # 32 = " "
+        self[code_point] = value
+        return value
+
+_PUNCTUATION = _PunctuationTable()
 
 def _clean_text(text: str) -> str:
     """Cleans text by lowercasing, removing punctuation, and filtering stopwords."""
-    text = text.lower()
-    text = re.sub(r"[^\w\s]", " ", text)
-    words = text.split()
-    filtered = [w for w in words if w not in STOPWORDS]
-    return " ".join(filtered)
+    stop = _stopwords()
+    return " ".join([w for w in text.lower().translate(_PUNCTUATION).split() if w not in stop])
 
 def _compute_hash(text: str) -> str:
     """Computes a SHA256 hash of the text content."""
     return hashlib.sha256(text.encode("utf-8")).hexdigest()
 
 # --------------------------------------------------------------------------
-# --- TEXT CHUNKING LOGIC (No changes needed)
+# --- TEXT CHUNKING & BUDGET
 # --------------------------------------------------------------------------
-def _chunk_text(text: str, max_chunk_size: int = 300, overlap: int = 50) -> List[str]:
-    """Splits cleaned text into overlapping word-based chunks."""
-    if not text.strip():
-        return []
-    words = text.split()
-    chunks = []
+def _load_tokenizer(model_name: str) -> Tuple[Any, int]:
+    """
+    The tokenizer and max_seq_length of `model_name`. Taken from the model when this
+    process has already loaded it; otherwise only the tokenizer files are read, so
+    extraction workers do not load the encoder just to count tokens.
+    """
+    model = _models.get(model_name)
+    if model is not None:
+        return model.tokenizer, int(model.max_seq_length)
+    from transformers import AutoTokenizer
+    local = Path(model_name).is_dir()
+    source = model_name if local or "/" in model_name else f"sentence-transformers/{model_name}"
+    tokenizer = AutoTokenizer.from_pretrained(source, local_files_only=True)
+    try:
+        if local:
+            config_file = Path(source) / "sentence_bert_config.json"
+        else:
+            from huggingface_hub import hf_hub_download
+            config_file = hf_hub_download(source, "sentence_bert_config.json", local_files_only=True)
+        max_seq_length = int(json.loads(Path(config_file).read_text(encoding="utf-8"))["max_seq_length"])
+    except Exception:
+        max_seq_length = min(int(tokenizer.model_max_length), _MAX_SEQ_FALLBACK)
+    return tokenizer, max_seq_length
+
+def _token_window(model_name: Optional[str] = None,
+                  settings: Optional[Dict[str, Any]] = None) -> Optional[Tuple[Any, int, int]]:
+    """
+    (tokenizer, chunk size, overlap) in tokens for `model_name`: the chunk fills the
+    model's max_seq_length less its special tokens. None chunks by words instead.
+    `settings` are the chunking settings when the caller has already read them.
+    """
+    settings = settings or paths.get_chunking_settings()
+    if not settings["chunk_by_tokens"]:
+        return None
+    model_name = model_name or MODEL_NAME
+    with _tokenizer_lock:
+        if model_name not in _tokenizers:
+            try:
+                _tokenizers[model_name] = _load_tokenizer(model_name)
+            except Exception as e:
+                logger.info(f"[Processor] No local tokenizer for {model_name} ({repr(e)}); chunking by words.")
+                _tokenizers[model_name] = None
+        loaded = _tokenizers[model_name]
+    if loaded is None:
+        return None
+    tokenizer, max_seq_length = loaded
+    size = max(1, max_seq_length - tokenizer.num_special_tokens_to_add())
+    overlap = min(size - 1, int(size * float(settings["chunk_overlap_ratio"])))
+    return tokenizer, size, max(0, overlap)
+
+def _word_token_counts(words: List[str], tokenizer: Any) -> List[int]:
+    """Tokens each word costs, tokenizing every distinct word once (with the space that precedes it in a chunk)."""
+    distinct = list(dict.fromkeys(words))
+    ids = tokenizer([" " + w for w in distinct], add_special_tokens=False)["input_ids"]
+    cost = {w: len(i) for w, i in zip(distinct, ids)}
+    return [cost[w] for w in words]
+
+def _token_windows(counts: List[int], size: int, overlap: int) -> List[Tuple[int, int]]:
+    """
+    Word ranges of at most `size` tokens, each starting with whole words worth at
+    most `overlap` tokens from the end of the previous one. A single word longer
+    than `size` gets a window of its own.
+    """
+    windows: List[Tuple[int, int]] = []
     start = 0
-    while start < len(words):
-        end = min(start + max_chunk_size, len(words))
-        chunks.append(" ".join(words[start:end]))
-        start += max_chunk_size - overlap
-    return chunks
+    while start < len(counts):
+        end, used = start + 1, counts[start]
+        while end < len(counts) and used + counts[end] <= size:
+            used += counts[end]
+            end += 1
+        windows.append((start, end))
+        if end == len(counts):
+            break
+        back, kept = end, 0
+        while back - 1 > start and kept + counts[back - 1] <= overlap:
+            back -= 1
+            kept += counts[back]
+        start = back
+    return windows
+
+def _chunk_text(text: str, model_name: Optional[str] = None, settings: Optional[Dict[str, Any]] = None) -> List[str]:
+    """
+    Splits cleaned text into overlapping chunks that each fit the encoder's
+    max_seq_length, so no chunk is tokenized only to be truncated. Without a local
+    tokenizer, chunks are CHUNK_WORDS words with CHUNK_OVERLAP words of overlap.
+    """
+    words = text.split()
+    if not words:
+        return []
+    window = _token_window(model_name, settings)
+    if window is None:
+        step = CHUNK_WORDS - CHUNK_OVERLAP
+        return [" ".join(words[start:start + CHUNK_WORDS]) for start in range(0, len(words), step)]
+    tokenizer, size, overlap = window
+    return [" ".join(words[start:end])
+            for start, end in _token_windows(_word_token_counts(words, tokenizer), size, overlap)]
+
+def _budget_chunks(chunks: List[str], budget: Dict[str, Any]) -> Tuple[List[str], Dict[str, int]]:
+    """Keeps at most `file_max_chunks` chunks, sampled the same way as pages."""
+    keep = _sample_indices(len(chunks), int(budget["file_max_chunks"]), budget["file_sampling"])
+    if len(keep) == len(chunks):
+        return chunks, {}
+    return [chunks[i] for i in keep], {"chunks_total": len(chunks), "chunks_embedded": len(keep)}
 
 # --------------------------------------------------------------------------
-# --- EMBEDDING LOGIC (Now with lazy loading)
+# --- EMBEDDING & CACHE LOOKUPS
 # --------------------------------------------------------------------------
-def _load_model(local_only: bool = True):
-    """Lazily loads the SentenceTransformer model when first needed."""
-    global _model
-    if _model is None:
-        try:
-            logger.info(f"[Processor] Loading model for the first time: {MODEL_NAME}")
-            _model = SentenceTransformer(MODEL_NAME, local_files_only=local_only)
-            logger.info("[Processor] Model loaded successfully.")
-        except Exception as e:
-            logger.error(f"[Processor] Failed to load model: {e}")
-            # Raise the exception to prevent the application from continuing in a broken state.
-            raise e
-    return _model
-
-def _embed_texts(chunks: List[str]) -> List[List[float]]:
-    """Generates sentence embeddings for a list of text chunks."""
+def _load_model(local_only: bool = True, model_name: Optional[str] = None):
+    """Lazily loads a SentenceTransformer model (the active one by default) when first needed."""
+    model_name = model_name or MODEL_NAME
+    with _model_lock:
+        model = _models.get(model_name)
+        if model is None:
+            try:
+                from sentence_transformers import SentenceTransformer
+                logger.info(f"[Processor] Loading model for the first time: {model_name}")
+                model = SentenceTransformer(model_name, local_files_only=local_only)
+                _models[model_name] = model
+                logger.info("[Processor] Model loaded successfully.")
+            except Exception as e:
+                logger.error(f"[Processor] Failed to load model: {e}")
+                # Raise the exception to prevent the application from continuing in a broken state.
+                raise e
+        return model
+
+def _encode(chunks: List[str], model_name: Optional[str] = None) -> np.ndarray:
+    """Runs the model over `chunks` in this process."""
+    # This will trigger the one-time model load if it hasn't happened yet.
+    model = _load_model(model_name=model_name)
+    embeddings = model.encode(chunks, show_progress_bar=False)
+    return embeddings if isinstance(embeddings, np.ndarray) else np.zeros((0, get_model_dim(model_name or MODEL_NAME)))
+
+def _embed_texts(chunks: List[str], model_name: Optional[str] = None) -> List[List[float]]:
+    """Generates sentence embeddings for a list of text chunks (on the index server, when one is in use)."""
     if not chunks:
         return []
     try:
-        # This will trigger the one-time model load if it hasn't happened yet.
-        model = _load_model()
-        embeddings = model.encode(chunks, show_progress_bar=False)
-        if isinstance(embeddings, np.ndarray):
-            return embeddings.tolist()
-        return []
+        from src.core.utils.backend import get_backend
+        backend = get_backend()
+        if backend is not None and model_name in (None, MODEL_NAME):
+            return backend.embed(chunks).tolist()
+        return _encode(chunks, model_name).tolist()
     except Exception as e:
         logger.error(f"[Processor] Failed to generate embeddings: {repr(e)}")
         return []
 
-# --------------------------------------------------------------------------
-# --- PUBLIC MASTER FUNCTION (No changes needed)
-# --------------------------------------------------------------------------
-def process_file(file_path: Union[str, Path]) -> Dict:
-    """Processes a single file from path to embeddings."""
+def chunking_signature(model_name: Optional[str] = None, settings: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Identifies how content is cleaned, chunked (for `model_name`) and budgeted before
+    it is embedded; `settings` are get_processing_settings() when already read.
+    """
+    settings = settings or paths.get_processing_settings()
+    window = _token_window(model_name, settings)
+    split = f"tokens-{window[1]}-{window[2]}" if window else f"words-{CHUNK_WORDS}-{CHUNK_OVERLAP}"
+    return f"clean-v1/{split}/max-{settings['file_max_chunks']}-{settings['file_sampling']}"
+
+def _cached_embeddings(content_hash: str, model_name: str,
+                       signature: str) -> Optional[Tuple[List[List[float]], Optional[int]]]:
+    """The cached vectors of the content and its chunk count before the budget cut, if cached."""
+    from src.core.utils.embedcache import get_embed_cache
+    try:
+        cache = get_embed_cache()
+        entry = cache.get_entry(content_hash, model_name, signature) if cache else None
+    except sqlite3.Error as e:
+        logger.warning(f"[Processor] Embedding cache lookup failed: {repr(e)}")
+        return None
+    return (entry[0].tolist(), entry[1]) if entry is not None else None
+
+def _cache_embeddings(content_hash: str, model_name: str, signature: str, embeddings: List[List[float]],
+                      chunks_total: int) -> None:
+    from src.core.utils.embedcache import get_embed_cache
+    try:
+        cache = get_embed_cache()
+        if cache:
+            cache.put(content_hash, model_name, signature, embeddings, chunks_total)
+    except sqlite3.Error as e:
+        logger.warning(f"[Processor] Could not cache embeddings: {repr(e)}")
+
+def compute_content_hash(file_path: Union[str, Path]) -> str:
+    """Hashes a file's extracted text the same way `process_file` does, without embedding it."""
     path = Path(file_path)
-    if not path.is_file():
-        return {}
-    file_type = path.suffix.lower().lstrip('.')
-    raw_content = _extract_content(path, file_type)
-    cleaned_content = _clean_text(raw_content)
-    chunks = _chunk_text(cleaned_content)
-    embeddings = _embed_texts(chunks)
+    return _compute_hash(_extract_content(path, path.suffix.lower().lstrip('.')))
+
+def _describe(path: Path, file_type: str, content_hash: str) -> Dict[str, Any]:
     return {
         "file_path": str(path),
         "file_name": _clean_text(path.stem),
         "parent_folder": path.parent.name,
         "parent_folder_path": str(path.parent.resolve()),
         "file_type": file_type,
-        "content_hash": _compute_hash(raw_content),
-        "embeddings": embeddings,
+        "content_hash": content_hash,
     }
+
+# --------------------------------------------------------------------------
+# --- PUBLIC MASTER FUNCTION
+# --------------------------------------------------------------------------
+def process_file(file_path: Union[str, Path], model_name: Optional[str] = None) -> Dict:
+    """
+    Processes a single file from path to embeddings (with the active model unless
+    `model_name` is given). Content already embedded by the same model and chunking
+    is served from the embedding cache instead of being encoded again.
+
+    Long documents are cut to the per-file page and chunk budget; "truncation"
+    then records what was left out (None when the whole file was embedded).
+    """
+    path = Path(file_path)
+    if not path.is_file():
+        return {}
+    file_type = path.suffix.lower().lstrip('.')
+    settings = paths.get_processing_settings()
+    raw_content, truncation = _extract(path, file_type, settings)
+    content_hash = _compute_hash(raw_content)
+    model = model_name or MODEL_NAME
+    signature = chunking_signature(model, settings)
+    cached = _cached_embeddings(content_hash, model, signature) if raw_content.strip() else None
+    if cached is None:
+        cleaned_content = _clean_text(raw_content)
+        chunks, chunk_info = _budget_chunks(_chunk_text(cleaned_content, model, settings), settings)
+        embeddings = _embed_texts(chunks, model_name)
+        if embeddings:
+            _cache_embeddings(content_hash, model, signature, embeddings, chunk_info.get("chunks_total", len(chunks)))
+    else:
+        embeddings, chunks_total = cached
+        if chunks_total is None and len(embeddings) == int(settings["file_max_chunks"]):
+            # Cached before chunk counts were stored: count the chunks to report what was cut.
+            chunks_total = len(_chunk_text(_clean_text(raw_content), model, settings))
+        chunk_info = ({"chunks_total": chunks_total, "chunks_embedded": len(embeddings)}
+                      if chunks_total and chunks_total > len(embeddings) else {})
+    return {**_describe(path, file_type, content_hash), "embeddings": embeddings,
+            "truncation": {**truncation, **chunk_info} or None}
+
+# --------------------------------------------------------------------------
+# --- SPLIT PIPELINE (bulk builds)
+# --------------------------------------------------------------------------
+# `process_file` in two stages, so a build can run the CPU-bound first stage in a
+# process pool and still embed in one place, many files per forward pass.
+def prepare_file(file_path: Union[str, Path], model_name: Optional[str] = None) -> Dict:
+    """
+    Everything `process_file` does before embedding: extraction, hashing, cleaning,
+    chunking (sized for `model_name`, the active model by default) and budgeting.
+    """
+    path = Path(file_path)
+    if not path.is_file():
+        return {}
+    file_type = path.suffix.lower().lstrip('.')
+    settings = paths.get_processing_settings()
+    raw_content, truncation = _extract(path, file_type, settings)
+    chunks, chunk_info = _budget_chunks(_chunk_text(_clean_text(raw_content), model_name, settings), settings)
+    return {**_describe(path, file_type, _compute_hash(raw_content)), "chunks": chunks,
+            "truncation": {**truncation, **chunk_info} or None}
+
+def embed_prepared(prepared: List[Dict], model_name: Optional[str] = None) -> List[Dict]:
+    """
+    Embeds files from `prepare_file` (chunked for the same model) with one forward
+    pass for all their chunks not already in the embedding cache. Returns them in
+    `process_file`'s shape.
+    """
+    model = model_name or MODEL_NAME
+    signature = chunking_signature(model)
+    results, to_embed = [], []
+    for item in prepared:
+        processed = {k: v for k, v in item.items() if k != "chunks"}
+        cached = _cached_embeddings(item["content_hash"], model, signature) if item["chunks"] else ([], None)
+        processed["embeddings"] = cached[0] if cached is not None else None
+        if cached is None:
+            to_embed.append((processed, item["chunks"]))
+        results.append(processed)
+
+    flat = [chunk for _, chunks in to_embed for chunk in chunks]
+    vectors = _embed_texts(flat, model_name)
+    offset = 0
+    for processed, chunks in to_embed:
+        # A failed forward pass returns no vectors; every file in it then has none.
+        processed["embeddings"] = vectors[offset:offset + len(chunks)] if len(vectors) == len(flat) else []
+        offset += len(chunks)
+        if processed["embeddings"]:
+            chunks_total = (processed["truncation"] or {}).get("chunks_total", len(chunks))
+            _cache_embeddings(processed["content_hash"], model, signature, processed["embeddings"], chunks_total)
+    return results
@@ -0,0 +1,110 @@
+# [projection.py] — Learned PCA projections for a reduced-dimension index
+
+import hashlib
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Optional
+
+import numpy as np
+
+from src.core.utils.paths import get_index_settings, get_projections_dir
+
+# --- Logger Setup ---
+logger = logging.getLogger(__name__)
+
+# --- Constants ---
+PROJECTION_DIMS = (64, 96, 128)  # sizes offered by the migrator and benchmarked by default
+MIN_FIT_FACTOR = 4  # a fit needs at least this many sample vectors per output dimension
+
+
+class Projection:
+    """
+    A fixed linear map from embedding space to `dim` dimensions:
+    `normalize((x - mean) @ components.T)`. Re-normalizing keeps inner product
+    equal to cosine similarity in the reduced space.
+
+    The tag names the exact fit (`pca<dim>-<digest>`); every index records the tag
+    of the space its vectors live in, so a refit never mixes spaces.
+    """
+
+    def __init__(self, mean: np.ndarray, components: np.ndarray, tag: Optional[str] = None):
+        self.mean = np.ascontiguousarray(mean, dtype=np.float32)
+        self.components = np.ascontiguousarray(components, dtype=np.float32)
+        self.tag = tag or f"pca{self.dim}-{_digest(self.mean, self.components)}"
+
+    @property
+    def dim(self) -> int:
+        return self.components.shape[0]
+
+    @property
+    def input_dim(self) -> int:
+        return self.components.shape[1]
+
+    def apply(self, vectors: np.ndarray) -> np.ndarray:
+        projected = (np.asarray(vectors, dtype=np.float32) - self.mean) @ self.components.T
+        norms = np.linalg.norm(projected, axis=1, keepdims=True)
+        return np.ascontiguousarray(projected / np.maximum(norms, 1e-12), dtype=np.float32)
+
+    def save(self) -> Path:
+        """Writes the projection to `<projections>/<tag>.npz` (atomically, never overwritten)."""
+        path = projection_path(self.tag)
+        if path.exists():
+            return path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.stem + ".tmp.npz")
+        np.savez(tmp_path, mean=self.mean, components=self.components)
+        os.replace(tmp_path, path)
+        logger.info(f"[Projection] Saved {self.tag}")
+        return path
+
+
+def _digest(mean: np.ndarray, components: np.ndarray) -> str:
+    return hashlib.sha1(mean.tobytes() + components.tobytes()).hexdigest()[:10]
+
+
+def projection_path(tag: str) -> Path:
+    return get_projections_dir() / f"{tag}.npz"
+
+
+# --- Fitting ---
+def fit_projection(vectors: np.ndarray, dim: int, sample_size: int = 50_000, seed: int = 0) -> Projection:
+    """Fits a PCA projection on (a sample of) full-dimension, normalized vectors."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if dim >= vectors.shape[1]:
+        raise ValueError(f"[Projection] Target dim {dim} must be below the embedding dim {vectors.shape[1]}")
+    if len(vectors) < dim * MIN_FIT_FACTOR:
+        raise ValueError(f"[Projection] {len(vectors)} vector(s) are too few to fit {dim} dims "
+                         f"(need {dim * MIN_FIT_FACTOR})")
+    if len(vectors) > sample_size:
+        rng = np.random.default_rng(seed)
+        vectors = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+    mean = vectors.mean(axis=0)
+    # Rows of vt are the principal axes, strongest first.
+    _, _, vt = np.linalg.svd((vectors - mean).astype(np.float64), full_matrices=False)
+    return Projection(mean, vt[:dim])
+
+
+# --- Registry ---
+_cache: Dict[str, Projection] = {}
+_cache_lock = threading.Lock()
+
+
+def get_projection(tag: str) -> Projection:
+    """Loads (once per process) the projection an index was built with."""
+    with _cache_lock:
+        projection = _cache.get(tag)
+        if projection is None:
+            path = projection_path(tag)
+            if not path.exists():
+                raise FileNotFoundError(f"[Projection] Projection {tag} is missing: {path}")
+            with np.load(path) as data:
+                projection = Projection(data["mean"], data["components"], tag)
+            _cache[tag] = projection
+        return projection
+
+
+def active_projection_tag() -> Optional[str]:
+    """The projection new (empty) indexes start in, or None for full-dimension indexes."""
+    return get_index_settings()["index_projection"] or None
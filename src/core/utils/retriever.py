@@ -1,20 +1,43 @@
-import faiss
-import json
 import logging
 import numpy as np
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Sequence
 
-from src.core.utils.paths import get_faiss_index_path, get_faiss_metadata_path
-from src.core.utils.processor import embedding_dim
+from src.core.utils.backend import get_backend
+from src.core.utils.index_service import get_index_service
+from src.core.utils.processor import get_embedding_dim
+from src.core.utils.shards import ShardedIndex, get_sharded_index
 
 # --- Logger Setup ---
 logger = logging.getLogger(__name__)
 
 
+def _check_index_files(sharded: ShardedIndex) -> None:
+    service = get_index_service()  # the default shard always exists once initialized
+    if not sharded.loaded:
+        if not service.index_path.exists():
+            raise FileNotFoundError(f"[Retriever] FAISS index missing: {service.index_path}")
+        if not service.metadata_path.exists():
+            raise FileNotFoundError(f"[Retriever] Metadata file missing: {service.metadata_path}")
+
+
+def _to_query_array(query_embeddings: List[List[float]]) -> np.ndarray:
+    expected_dim = get_embedding_dim()
+
+    query_array = np.array(query_embeddings, dtype=np.float32)
+    if query_array.ndim == 1:
+        query_array = query_array.reshape(1, -1)
+
+    actual_dim = query_array.shape[1]
+    if actual_dim != expected_dim:
+        raise ValueError(f"[Retriever] Embedding dimension mismatch: expected {expected_dim}, got {actual_dim}")
+    return query_array
+
+
 def retrieve_similar(
     query_embeddings: List[List[float]],
-    top_k: int = 10
+    top_k: int = 10,
+    folders: Optional[Sequence[str]] = None
 ) -> List[Dict[str, Any]]:
     """
     Performs similarity search for given embeddings and returns top-k matches.
@@ -22,6 +45,7 @@ def retrieve_similar(
     Args:
         query_embeddings (List[List[float]]): Embedding vectors of query chunks.
         top_k (int): Number of matches to retrieve per chunk.
+        folders (Sequence[str], optional): Only search chunks of files in these folders.
 
     Returns:
         List[Dict]: Match metadata including distance and index info.
@@ -30,48 +54,19 @@ def retrieve_similar(
         logger.warning("[Retriever] No embeddings provided for retrieval.")
         return []
 
-    index_path = get_faiss_index_path()
-    metadata_path = get_faiss_metadata_path()
-
-    if not index_path.exists():
-        raise FileNotFoundError(f"[Retriever] FAISS index missing: {index_path}")
-    if not metadata_path.exists():
-        raise FileNotFoundError(f"[Retriever] Metadata file missing: {metadata_path}")
+    backend = get_backend()
+    sharded = get_sharded_index()
+    if backend is None:
+        _check_index_files(sharded)
 
     try:
-        # Load index
-        index = faiss.read_index(str(index_path))
-        expected_dim = embedding_dim
-
-        # Prepare query
-        query_array = np.array(query_embeddings, dtype=np.float32)
-        if query_array.ndim == 1:
-            query_array = query_array.reshape(1, -1)
-
-        actual_dim = query_array.shape[1]
-        if actual_dim != expected_dim:
-            raise ValueError(f"[Retriever] Embedding dimension mismatch: expected {expected_dim}, got {actual_dim}")
-
-        # Perform search
-        D, I = index.search(query_array, top_k)
-
-        # Load metadata
-        with metadata_path.open("r", encoding="utf-8") as f:
-            metadata = json.load(f)
-
-        # Collect results
-        results = []
-        for q_idx, (distances, indices) in enumerate(zip(D, I)):
-            for dist, idx in zip(distances, indices):
-                if idx == -1 or idx >= len(metadata):
-                    continue
-                match = metadata[idx].copy()
-                match.update({
-                    "distance": float(dist),
-                    "match_index": idx,
-                    "query_chunk": q_idx
-                })
-                results.append(match)
+        query_array = _to_query_array(query_embeddings)
+        if backend is not None:
+            # The index server holds the index; concurrent callers share its searches.
+            results = backend.search(query_array, top_k, folders=folders)
+        else:
+            # Search every shard's in-memory index (loaded once per process)
+            results = sharded.load().search(query_array, top_k, folders=folders)
 
         logger.info(f"[Retriever] Retrieved {len(results)} matches for {len(query_array)} query chunk(s).")
         return results
@@ -79,3 +74,42 @@ def retrieve_similar(
     except Exception as e:
         logger.error(f"[Retriever] Retrieval failed: {repr(e)}")
         return []
+
+
+def retrieve_similar_files(
+    query_embeddings: List[List[float]],
+    top_k: int = 20
+) -> List[Dict[str, Any]]:
+    """
+    File-level search: pools the query chunks into one vector and matches it against
+    one pooled vector per indexed file.
+
+    Args:
+        query_embeddings (List[List[float]]): Embedding vectors of query chunks.
+        top_k (int): Number of files to retrieve.
+
+    Returns:
+        List[Dict]: One match per file, including distance.
+    """
+    if not query_embeddings:
+        logger.warning("[Retriever] No embeddings provided for retrieval.")
+        return []
+
+    backend = get_backend()
+    sharded = get_sharded_index()
+    if backend is None:
+        _check_index_files(sharded)
+
+    try:
+        query_array = _to_query_array(query_embeddings)
+        if backend is not None:
+            results = backend.search_files(query_array, top_k)
+        else:
+            results = sharded.load().search_files(query_array, top_k)
+
+        logger.info(f"[Retriever] Retrieved {len(results)} file match(es) for {len(query_array)} pooled chunk(s).")
+        return results
+
+    except Exception as e:
+        logger.error(f"[Retriever] File retrieval failed: {repr(e)}")
+        return []
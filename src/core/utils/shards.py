@@ -0,0 +1,450 @@
+# [shards.py] — One versioned index shard per organized root, searched in parallel
+
+import hashlib
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.core.utils.index_service import IndexService, get_index_service, release_index_service, writer_lock_path
+from src.core.utils.lockfile import LockFile
+from src.core.utils.paths import (
+    configured_model,
+    get_active_model,
+    get_faiss_index_path,
+    get_faiss_metadata_path,
+    get_index_settings,
+    get_organized_paths,
+    get_paths_file,
+    get_shards_dir,
+    normalize_path,
+)
+from src.core.utils.processor import set_active_model
+
+# --- Logger Setup ---
+logger = logging.getLogger(__name__)
+
+# --- Constants ---
+# The pre-sharding index stays in place as the shard for files outside every
+# organized root (e.g. fallback moves into the unsorted folder).
+DEFAULT_SHARD = ""
+CURRENT_FILE = "CURRENT"  # names the live version directory of a root shard
+_VERSION_RE = re.compile(r"^v(\d+)$")
+# Searches and mutations re-read config.json, paths.json and the CURRENT files at
+# most this often; the watcher and index server also refresh on every poll.
+REFRESH_INTERVAL = 5.0
+
+
+# --- Shard Locations ---
+# A root shard is <shards>/<name>-<hash>/vNNNN/{index.faiss, index_meta.sqlite3, index.wal*}.
+# Rebuilds fill a fresh vNNNN and then atomically rewrite CURRENT to point at it.
+# `model` addresses another encoder's namespace (the active model's by default).
+def shard_dir_for(root: str, model: Optional[str] = None) -> Path:
+    root = normalize_path(root)
+    slug = re.sub(r"[^A-Za-z0-9_-]+", "_", Path(root).name)[:40] or "root"
+    digest = hashlib.sha1(root.encode("utf-8")).hexdigest()[:10]
+    return get_shards_dir(model) / f"{slug}-{digest}"
+
+
+def version_files(version_dir: Path) -> Tuple[Path, Path]:
+    """Returns (index path, metadata path) inside a version directory."""
+    return version_dir / "index.faiss", version_dir / "index_meta.sqlite3"
+
+
+def _versions(shard_dir: Path) -> List[Tuple[int, Path]]:
+    if not shard_dir.exists():
+        return []
+    found = [(int(m.group(1)), p) for p in shard_dir.iterdir() if p.is_dir() and (m := _VERSION_RE.match(p.name))]
+    return sorted(found)
+
+
+def current_version_dir(root: str, model: Optional[str] = None) -> Path:
+    shard_dir = shard_dir_for(root, model)
+    pointer = shard_dir / CURRENT_FILE
+    if pointer.exists():
+        return shard_dir / pointer.read_text(encoding="utf-8").strip()
+    if (shard_dir / "index.faiss").exists():
+        return shard_dir  # unversioned shard from before snapshots; superseded by its first rebuild
+    return shard_dir / "v0001"
+
+
+def new_version_dir(root: str) -> Path:
+    """Creates the next, empty version directory for a rebuild of `root`."""
+    shard_dir = shard_dir_for(root)
+    current = current_version_dir(root)
+    for number, path in _versions(shard_dir):
+        if number > _version_number(current):
+            shutil.rmtree(path, ignore_errors=True)  # left behind by an interrupted rebuild
+    version_dir = shard_dir / f"v{_version_number(current) + 1:04d}"
+    version_dir.mkdir(parents=True, exist_ok=True)
+    return version_dir
+
+
+def publish_version(root: str, version_dir: Path) -> None:
+    """Atomically points CURRENT at `version_dir` and prunes versions older than the one it replaces."""
+    shard_dir = shard_dir_for(root)
+    previous = current_version_dir(root)
+    tmp_pointer = shard_dir / (CURRENT_FILE + ".tmp")
+    with tmp_pointer.open("w", encoding="utf-8") as f:
+        f.write(version_dir.name)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_pointer, shard_dir / CURRENT_FILE)
+    # The replaced version stays until the next publish so other processes can swap off it.
+    for number, path in _versions(shard_dir):
+        if number < _version_number(previous):
+            shutil.rmtree(path, ignore_errors=True)
+    if _version_number(previous) > 0:
+        for legacy_file in shard_dir.glob("index*"):  # unversioned layout
+            legacy_file.unlink(missing_ok=True)
+    logger.info(f"[Shards] Published {version_dir.name} for {root}")
+
+
+def _version_number(version_dir: Path) -> int:
+    m = _VERSION_RE.match(version_dir.name)
+    return int(m.group(1)) if m else 0
+
+
+def _delete_shard_dir(shard_dir: Path) -> bool:
+    """
+    Deletes a shard directory unless another process still serves one of its
+    versions (holds its writer lock). Returns False, deleting nothing, in that case.
+    """
+    locks: List[LockFile] = []
+    try:
+        for version_dir in [shard_dir, *(path for _, path in _versions(shard_dir))]:
+            lock = LockFile(writer_lock_path(version_files(version_dir)[0]))
+            if not lock.try_acquire():
+                return False
+            locks.append(lock)
+    finally:
+        for lock in locks:
+            lock.release()
+    shutil.rmtree(shard_dir, ignore_errors=True)
+    return True
+
+
+class ShardedIndex:
+    """
+    Routes every file to the shard of the organized root it lives under and fans
+    searches out over all shards on a thread pool, merging the per-chunk top-k.
+
+    Each shard is an independent IndexService (snapshot, WAL, metadata store), so a
+    root can be rebuilt, added or dropped without touching the others. When a
+    rebuild publishes a new version, the next refresh swaps to it, drops the files
+    this process deleted or moved away since the rebuild started and copies over
+    any file it indexed since.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._roots: List[str] = []  # longest first, so nested roots win
+        self._roots_known = False  # whether the last refresh actually read paths.json
+        self._versions: Dict[str, Path] = {}  # version directory each root shard is served from
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._loaded = False
+        self._refreshed_at = float("-inf")  # time.monotonic() of the last refresh
+
+    # --- Shard Set ---
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def refresh(self) -> List[str]:
+        """
+        Re-reads the organized roots. Shards of removed roots are released unwritten
+        and deleted once no other process serves them any more.
+        After a model switch-over every shard is released and reopened from the new
+        model's namespace.
+        """
+        self._refreshed_at = time.monotonic()
+        if configured_model() != get_active_model():
+            self._switch_model(configured_model())
+        try:
+            roots = sorted({normalize_path(p) for p in get_organized_paths()}, key=len, reverse=True)
+        except (OSError, ValueError) as e:
+            # paths.json may be corrupt or mid-rewrite by an older writer; keep the current shard set.
+            logger.warning(f"[Shards] Could not read organized paths: {repr(e)}")
+            self._roots_known = False
+            return self._roots
+        with self._lock:
+            self._roots_known = get_paths_file().exists()
+            for gone in set(self._roots) - set(roots):
+                release_index_service(*self.shard_paths(gone), checkpoint=False)
+                self._versions.pop(gone, None)
+                if _delete_shard_dir(shard_dir_for(gone)):
+                    logger.info(f"[Shards] Dropped shard for {gone}")
+            added = set(roots) - set(self._roots)
+            self._roots = roots
+            for root, version_dir in list(self._versions.items()):
+                if current_version_dir(root) != version_dir:
+                    self._swap(root, current_version_dir(root))
+            if added and self._loaded:
+                self._adopt_default_files()
+        return roots
+
+    def _refresh_if_due(self) -> None:
+        """Refreshes unless the last refresh is under REFRESH_INTERVAL old, keeping disk reads off the query path."""
+        if time.monotonic() - self._refreshed_at >= REFRESH_INTERVAL:
+            self.refresh()
+
+    def _switch_model(self, model_name: str) -> None:
+        with self._lock:
+            previous = get_active_model()
+            for root in [DEFAULT_SHARD, *self._roots]:
+                release_index_service(*self.shard_paths(root))
+            self._versions.clear()
+            set_active_model(model_name)
+        # Shards reopen lazily, now from the new namespace.
+        logger.info(f"[Shards] Switched from {previous} to {model_name}")
+
+    def shard_paths(self, root: str) -> Tuple[Path, Path]:
+        """Returns (index path, metadata path) of the version this process serves for `root`."""
+        if root == DEFAULT_SHARD:
+            return get_faiss_index_path(), get_faiss_metadata_path()
+        with self._lock:
+            if root not in self._versions:
+                self._versions[root] = current_version_dir(root)
+            return version_files(self._versions[root])
+
+    def _swap(self, root: str, version_dir: Path) -> None:
+        old_paths = self.shard_paths(root)
+        old_service = get_index_service(*old_paths)
+        new_service = get_index_service(*version_files(version_dir)).load()
+        replayed = dropped = 0
+        if old_service.loaded:
+            started = float(new_service.get_value("rebuild_started_at", 0.0))
+            # The rebuild's scan may have captured files deleted or moved since it started.
+            for file_path in old_service.removed_since(started):
+                dropped += new_service.delete(file_path)
+            for meta in old_service.iter_files():
+                if float(meta.get("indexed_at", 0.0)) >= started:
+                    replayed += self._copy(old_service, new_service, meta["file_path"])
+        release_index_service(*old_paths, checkpoint=False)
+        self._versions[root] = version_dir
+        logger.info(f"[Shards] Switched {root} to {version_dir.name} "
+                    f"({replayed} file(s) replayed, {dropped} removed)")
+
+    def shard_for(self, file_path: str) -> str:
+        path = normalize_path(file_path)
+        for root in self._roots:
+            if path == root or path.startswith(root.rstrip(os.sep) + os.sep):
+                return root
+        return DEFAULT_SHARD
+
+    def service(self, root: str) -> IndexService:
+        return get_index_service(*self.shard_paths(root))
+
+    def shards(self) -> List[Tuple[str, IndexService]]:
+        with self._lock:
+            return [(root, self.service(root)) for root in [DEFAULT_SHARD, *self._roots]]
+
+    def load(self) -> "ShardedIndex":
+        """Opens every shard and moves files that now belong to a root out of the default shard."""
+        with self._lock:
+            if self._loaded:
+                return self
+            self.refresh()
+            for _, service in self.shards():
+                service.load()
+            self._adopt_default_files()
+            if self._roots_known:
+                self._remove_orphan_shards()
+            else:
+                # Without the real root list every shard would look orphaned.
+                logger.warning("[Shards] Organized paths unknown; no shard is removed as orphaned.")
+            self._loaded = True
+        return self
+
+    def close(self) -> None:
+        with self._lock:
+            for root in [DEFAULT_SHARD, *self._roots]:
+                release_index_service(*self.shard_paths(root))
+            self._versions.clear()
+            if self._pool is not None:
+                self._pool.shutdown(wait=True)
+                self._pool = None
+            self._loaded = False
+
+    def drop_shard(self, root: str) -> bool:
+        """
+        Deletes a removed root's shard outright; nothing is written back. While another
+        process (the watcher) still serves it, the shard is left to that process, which
+        drops it on its next refresh. Returns whether the shard was deleted here.
+        """
+        root = normalize_path(root)
+        with self._lock:
+            release_index_service(*self.shard_paths(root), checkpoint=False)
+            self._roots = [r for r in self._roots if r != root]
+            self._versions.pop(root, None)
+        if not _delete_shard_dir(shard_dir_for(root)):
+            logger.info(f"[Shards] Shard for {root} is served by another process; it drops the shard itself")
+            return False
+        logger.info(f"[Shards] Dropped shard for {root}")
+        return True
+
+    def flush(self) -> None:
+        for _, service in self.shards():
+            if service.loaded:
+                service.flush()
+
+    def _adopt_default_files(self) -> None:
+        default = self.service(DEFAULT_SHARD)
+        moved = 0
+        for meta in default.iter_files():
+            root = self.shard_for(meta["file_path"])
+            if root != DEFAULT_SHARD and self._move(default, self.service(root), meta["file_path"]):
+                moved += 1
+        if moved:
+            logger.info(f"[Shards] Moved {moved} file(s) from the default index into their root shards")
+
+    def _remove_orphan_shards(self) -> None:
+        shards_dir = get_shards_dir()
+        if not shards_dir.exists():
+            return
+        expected = {shard_dir_for(root).name for root in self._roots}
+        for shard_dir in shards_dir.iterdir():
+            if shard_dir.is_dir() and shard_dir.name not in expected and _delete_shard_dir(shard_dir):
+                logger.info(f"[Shards] Removed orphaned shard {shard_dir.name}")
+
+    @staticmethod
+    def _copy(source: IndexService, target: IndexService, file_path: str,
+              overrides: Optional[Dict[str, Any]] = None) -> bool:
+        if source.projection_tag not in (None, target.projection_tag):
+            # Reduced vectors cannot be mapped into another space; the file needs re-embedding.
+            logger.warning(f"[Shards] Cannot carry {Path(file_path).name} from {source.projection_tag} "
+                           f"into {target.projection_tag or 'full-dimension'} index")
+            return False
+        found = source.file_vectors(file_path)
+        if found is None:
+            return False
+        meta, vectors = found
+        meta = {**meta, **{k: v for k, v in (overrides or {}).items() if v is not None}}
+        meta.pop("num_chunks", None)
+        if len(vectors):
+            target.upsert(vectors, meta)
+        return True
+
+    def _move(self, source: IndexService, target: IndexService, file_path: str,
+              overrides: Optional[Dict[str, Any]] = None) -> bool:
+        # Copy before delete: a crash in between leaves a duplicate, never a loss.
+        if not self._copy(source, target, file_path, overrides):
+            return False
+        source.delete(file_path)
+        return True
+
+    def copy_shard(self, root: str, target: IndexService) -> int:
+        """Copies every file of `root`'s shard into `target`, e.g. a new version. Returns the count copied."""
+        source = self.service(root)
+        return sum(self._copy(source, target, meta["file_path"]) for meta in source.iter_files())
+
+    def rehome(self, root: str, file_path: str) -> bool:
+        """Moves a file indexed under shard `root` into the shard that owns its path."""
+        owner = self.shard_for(file_path)
+        if owner == root:
+            return False
+        return self._move(self.service(root), self.service(owner), file_path)
+
+    # --- Mutations ---
+    def upsert(self, embedding_array: np.ndarray, file_metadata: Dict[str, Any]) -> int:
+        self._refresh_if_due()
+        root = self.shard_for(file_metadata["file_path"])
+        if root != DEFAULT_SHARD:
+            # Drop a copy indexed before this root was added.
+            self.service(DEFAULT_SHARD).delete(file_metadata["file_path"])
+        return self.service(root).upsert(embedding_array, file_metadata)
+
+    def delete(self, file_path: str) -> bool:
+        self._refresh_if_due()
+        root = self.shard_for(file_path)
+        removed = self.service(root).delete(file_path)
+        if not removed and root != DEFAULT_SHARD:
+            removed = self.service(DEFAULT_SHARD).delete(file_path)
+        return removed
+
+    def relocate(self, old_path: str, file_metadata: Dict[str, Any]) -> bool:
+        """Relocates within a shard, or carries the file's vectors over to the new root's shard."""
+        self._refresh_if_due()
+        source_root = self.shard_for(old_path)
+        target_root = self.shard_for(file_metadata["file_path"])
+        if source_root == target_root:
+            return self.service(source_root).relocate(old_path, file_metadata)
+        return self._move(self.service(source_root), self.service(target_root), old_path,
+                          {**file_metadata, "file_path": normalize_path(file_metadata["file_path"])})
+
+    # --- Queries ---
+    def _executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                workers = int(get_index_settings()["index_search_workers"]) or (os.cpu_count() or 1)
+                self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="shard-search")
+            return self._pool
+
+    def search(self, query_array: np.ndarray, top_k: int, top_folders: Optional[int] = None,
+               folders: Optional[Sequence[str]] = None) -> List[Dict[str, Any]]:
+        """Searches every shard concurrently (FAISS releases the GIL) and keeps the best `top_k` per chunk."""
+        return self.search_many([query_array], top_k, top_folders, folders)[0]
+
+    def search_many(self, query_arrays: Sequence[np.ndarray], top_k: int, top_folders: Optional[int] = None,
+                    folders: Optional[Sequence[str]] = None) -> List[List[Dict[str, Any]]]:
+        """`search` for several independent queries, with one batched call per shard."""
+        self._refresh_if_due()
+        shards = self.shards()
+
+        def search_shard(shard: Tuple[str, IndexService]) -> List[List[Dict[str, Any]]]:
+            root, service = shard
+            return [[{**m, "shard": root} for m in found]
+                    for found in service.search_many(query_arrays, top_k, top_folders, folders)]
+
+        if len(shards) == 1:
+            return search_shard(shards[0])
+
+        per_shard = list(self._executor().map(search_shard, shards))
+        merged = []
+        for i in range(len(query_arrays)):
+            by_chunk: Dict[int, List[Dict[str, Any]]] = {}
+            for found in per_shard:
+                for match in found[i]:
+                    by_chunk.setdefault(match["query_chunk"], []).append(match)
+            results = []
+            for q_idx in sorted(by_chunk):
+                results.extend(sorted(by_chunk[q_idx], key=lambda m: m["distance"])[:top_k])
+            merged.append(results)
+        return merged
+
+    def search_files(self, query_array: np.ndarray, top_k: int) -> List[Dict[str, Any]]:
+        """File-level search over every shard's pooled vectors; returns the best `top_k` files overall."""
+        return self.search_files_many([query_array], top_k)[0]
+
+    def search_files_many(self, query_arrays: Sequence[np.ndarray], top_k: int) -> List[List[Dict[str, Any]]]:
+        """`search_files` for several independent queries, with one batched call per shard."""
+        self._refresh_if_due()
+        shards = self.shards()
+
+        def search_shard(shard: Tuple[str, IndexService]) -> List[List[Dict[str, Any]]]:
+            root, service = shard
+            return [[{**m, "shard": root} for m in found] for found in service.search_files_many(query_arrays, top_k)]
+
+        per_shard = list(self._executor().map(search_shard, shards))
+        return [sorted((m for found in per_shard for m in found[i]), key=lambda m: m["distance"])[:top_k]
+                for i in range(len(query_arrays))]
+
+
+# --- Process-wide Instance ---
+_sharded_index: Optional[ShardedIndex] = None
+_sharded_lock = threading.Lock()
+
+
+def get_sharded_index() -> ShardedIndex:
+    global _sharded_index
+    with _sharded_lock:
+        if _sharded_index is None:
+            _sharded_index = ShardedIndex()
+        return _sharded_index
@@ -0,0 +1,136 @@
+# [wal.py] — Append-only write-ahead log of index mutations
+
+import json
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+# --- Logger Setup ---
+logger = logging.getLogger(__name__)
+
+# --- Record Layout ---
+# <header_len:u32><payload_len:u32><crc32:u32><header json><payload bytes>
+# The payload holds float32 vectors (shape in the header). The CRC covers header
+# and payload, so a torn write at the tail is detected and dropped on replay.
+_PREFIX = struct.Struct("<III")
+
+
+class WriteAheadLog:
+    """
+    Segmented, fsync'd mutation log living next to the index.
+
+    The active segment is `<name>.wal`. A checkpoint rotates it to
+    `<name>.wal.<last_seq>` and, once the snapshot is durable, deletes every
+    rotated segment it covers.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self.last_seq = 0
+        self._oldest_unsaved: Optional[float] = None
+
+        for _ in self._scan(self.path, truncate_torn_tail=True):
+            pass
+        for segment in self._rotated_segments():
+            self.last_seq = max(self.last_seq, self._segment_seq(segment))
+        self._file = self.path.open("ab")
+        if self.size_bytes():
+            self._oldest_unsaved = time.time()
+
+    # --- Segment Helpers ---
+    def _rotated_segments(self) -> List[Path]:
+        segments = [p for p in self.path.parent.glob(self.path.name + ".*") if p.suffix.lstrip(".").isdigit()]
+        return sorted(segments, key=self._segment_seq)
+
+    @staticmethod
+    def _segment_seq(segment: Path) -> int:
+        return int(segment.suffix.lstrip("."))
+
+    def _scan(self, path: Path, truncate_torn_tail: bool = False) -> Iterator[Tuple[Dict[str, Any], Optional[np.ndarray]]]:
+        if not path.exists():
+            return
+        good_offset = 0
+        with path.open("rb") as f:
+            while True:
+                prefix = f.read(_PREFIX.size)
+                if len(prefix) < _PREFIX.size:
+                    break
+                header_len, payload_len, crc = _PREFIX.unpack(prefix)
+                body = f.read(header_len + payload_len)
+                if len(body) < header_len + payload_len or zlib.crc32(body) != crc:
+                    break
+                header = json.loads(body[:header_len].decode("utf-8"))
+                vectors = None
+                if payload_len:
+                    vectors = np.frombuffer(body[header_len:], dtype=np.float32).reshape(header["shape"])
+                good_offset = f.tell()
+                self.last_seq = max(self.last_seq, int(header["seq"]))
+                yield header, vectors
+
+        if truncate_torn_tail and path.stat().st_size > good_offset:
+            logger.warning(f"[WAL] Dropping torn tail of {path.name} at byte {good_offset}")
+            with path.open("r+b") as f:
+                f.truncate(good_offset)
+
+    # --- Public API ---
+    def append(self, header: Dict[str, Any], vectors: Optional[np.ndarray] = None) -> int:
+        """Assigns the next sequence number, writes the record and fsyncs it."""
+        with self._lock:
+            self.last_seq += 1
+            header = {**header, "seq": self.last_seq}
+            payload = b""
+            if vectors is not None:
+                vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+                header["shape"] = list(vectors.shape)
+                payload = vectors.tobytes()
+            header_bytes = json.dumps(header).encode("utf-8")
+            body = header_bytes + payload
+            self._file.write(_PREFIX.pack(len(header_bytes), len(payload), zlib.crc32(body)) + body)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            if self._oldest_unsaved is None:
+                self._oldest_unsaved = time.time()
+            return self.last_seq
+
+    def replay(self, after_seq: int) -> Iterator[Tuple[Dict[str, Any], Optional[np.ndarray]]]:
+        """Yields every record with seq > after_seq, oldest first."""
+        for segment in [*self._rotated_segments(), self.path]:
+            for header, vectors in self._scan(segment):
+                if int(header["seq"]) > after_seq:
+                    yield header, vectors
+
+    def rotate(self) -> int:
+        """Seals the active segment and starts a new one. Returns the last sealed seq."""
+        with self._lock:
+            self._file.close()
+            if self.path.exists() and self.path.stat().st_size:
+                os.replace(self.path, self.path.with_name(f"{self.path.name}.{self.last_seq}"))
+            self._file = self.path.open("ab")
+            self._oldest_unsaved = None
+            return self.last_seq
+
+    def discard_through(self, seq: int) -> None:
+        """Deletes rotated segments whose records are all covered by a checkpoint."""
+        for segment in self._rotated_segments():
+            if self._segment_seq(segment) <= seq:
+                segment.unlink(missing_ok=True)
+
+    def size_bytes(self) -> int:
+        total = self.path.stat().st_size if self.path.exists() else 0
+        return total + sum(p.stat().st_size for p in self._rotated_segments())
+
+    def age_seconds(self) -> float:
+        return time.time() - self._oldest_unsaved if self._oldest_unsaved else 0.0
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
@@ -17,16 +17,21 @@ from colorama import Fore, Style
 
 # --- Application Imports ---
 from src.core.pipelines.initializer import run_initializer
-from src.core.pipelines.builder import build_from_paths
-from src.core.pipelines.actor import handle_correction
+from src.core.pipelines.builder import build_from_paths, build_shard
+from src.core.pipelines.actor import handle_correction, request_correction
 from src.core.pipelines.reinforcer import reinforce
+from src.core.pipelines.compactor import vacuum, request_vacuum, print_report
+from src.core.pipelines.verifier import verify_index, print_report as print_integrity_report
 from src.core.utils.paths import (
-    get_watch_paths, get_organized_paths, get_paths_file,
+    get_watch_paths, get_organized_paths, save_paths,
     get_config_file, get_logs_path, get_xml, ROOT_DIR,
     get_faiss_index_path, get_data_dir
 )
-from src.core.pipelines.watcher import get_pid_file, is_pid_alive
+from src.core.pipelines.watcher import get_pid_file, is_watcher_online
 from src.core.utils.notifier import notify_system_event
+from src.core.utils.backend import get_backend
+from src.core.utils.lockfile import LockHeld
+from src.core.utils.shards import get_sharded_index
 
 # --- Basic Setup ---
 logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)s | %(message)s")
@@ -131,13 +136,6 @@ def do_stop_watcher():
 
 # ─── Status Checkers ────────────────────────────────────────────────────────
 
-def is_watcher_online() -> bool:
-    pid_file = get_pid_file()
-    if not pid_file.exists(): return False
-    try:
-        return is_pid_alive(int(pid_file.read_text()))
-    except (ValueError, FileNotFoundError): return False
-
 def is_task_registered() -> bool:
     try:
         subprocess.check_output([str(SCHTASKS_EXE), '/Query', '/TN', TASK_NAME], stderr=subprocess.DEVNULL)
@@ -174,16 +172,25 @@ def startup_check():
     run_initializer()
     print("1. File structure initialized.")
 
-    # 2. Check for organized paths and build FAISS if needed
+    # 2. Verify the index and repair only what is damaged (an online watcher or index server does this itself)
     organized_paths = get_organized_paths()
     faiss_index_path = get_faiss_index_path()
+    if faiss_index_path.exists() and not is_watcher_online() and get_backend() is None:
+        rows = verify_index(repair=True)
+        get_sharded_index().close()  # hand the shards over to the watcher
+        if any(row["missing"] or row["stray_vectors"] or row["recovered"] != "-" for row in rows):
+            print(Fore.YELLOW + "Index problems were found and repaired:")
+            print_integrity_report(rows)
+        print("2. Index integrity verified.")
+
+    # 3. Check for organized paths and build FAISS if needed
 
     if organized_paths and not all(Path(p).exists() for p in organized_paths):
         print(Fore.YELLOW + "Some organized paths no longer exist.")
         if safe_input("Re-build FAISS index from available paths? (y/n): ").lower() == 'y':
             build_from_paths(get_organized_paths())
 
-    # 3. Handle missing FAISS or watch paths
+    # 4. Handle missing FAISS or watch paths
     if not faiss_index_path.exists():
         print(Fore.YELLOW + "FAISS index not found. The system needs an initial set of sorted folders to learn from.")
         if organized_paths:
@@ -197,7 +204,7 @@ def startup_check():
         print(Fore.YELLOW + "No folders are being watched.")
         manage_watcher_menu()
 
-    # 4. Check watcher status and prompt user
+    # 5. Check watcher status and prompt user
     if not is_watcher_online():
         print(Fore.YELLOW + "\nWatcher is currently offline.")
         if not is_task_registered():
@@ -242,8 +249,11 @@ def manage_organized_paths_menu():
             new_path = safe_input("Enter the full path to add: ")
             if Path(new_path).is_dir():
                 paths.append(new_path)
-                with get_paths_file().open("w") as f: json.dump({"watch_paths": get_watch_paths(), "organized_paths": paths}, f, indent=2)
-                print(Fore.GREEN + "Path added. Remember to re-build the index.")
+                save_paths(get_watch_paths(), paths)
+                print(Fore.GREEN + "Path added.")
+                if safe_input("Index it now? Other paths are left as they are. (y/n): ").lower() == 'y':
+                    build_shard(new_path)
+                    print(Fore.GREEN + "Path indexed.")
             else:
                 print(Fore.RED + "Invalid path.")
             time.sleep(1)
@@ -253,8 +263,12 @@ def manage_organized_paths_menu():
                 idx = int(safe_input("Enter number of path to remove: ")) - 1
                 if 0 <= idx < len(paths):
                     removed = paths.pop(idx)
-                    with get_paths_file().open("w") as f: json.dump({"watch_paths": get_watch_paths(), "organized_paths": paths}, f, indent=2)
-                    print(Fore.GREEN + f"Removed {removed}. Remember to re-build the index.")
+                    save_paths(get_watch_paths(), paths)
+                    # Each organized path has its own index shard, so removal needs no rebuild.
+                    if get_sharded_index().drop_shard(removed):
+                        print(Fore.GREEN + f"Removed {removed} and its index shard.")
+                    else:
+                        print(Fore.GREEN + f"Removed {removed}. The watcher drops its index shard on its next poll.")
                 else:
                     print(Fore.RED + "Invalid number.")
             except ValueError:
@@ -300,7 +314,7 @@ def manage_watcher_menu():
             new_path = safe_input("Enter path to watch: ")
             if Path(new_path).is_dir():
                 paths.append(new_path)
-                with get_paths_file().open("w") as f: json.dump({"watch_paths": paths, "organized_paths": get_organized_paths()}, f, indent=2)
+                save_paths(paths, get_organized_paths())
                 print(Fore.GREEN + "Path added. Restart watcher to apply changes.")
             else:
                 print(Fore.RED + "Invalid path.")
@@ -310,7 +324,7 @@ def manage_watcher_menu():
                 idx = int(safe_input("Enter number of path to remove: ")) - 1
                 if 0 <= idx < len(paths):
                     paths.pop(idx)
-                    with get_paths_file().open("w") as f: json.dump({"watch_paths": paths, "organized_paths": get_organized_paths()}, f, indent=2)
+                    save_paths(paths, get_organized_paths())
                     print(Fore.GREEN + "Path removed. Restart watcher to apply changes.")
                 else:
                     print(Fore.RED + "Invalid number.")
@@ -362,15 +376,21 @@ def view_moves_menu():
                 move_to_correct = list(reversed(moves[:20]))[idx]
                 print(f"Correcting: {Path(move_to_correct['file_path']).name}")
                 new_dest = safe_input("Enter the full, correct destination folder path: ")
-                if Path(new_dest).is_dir():
+                if not Path(new_dest).is_dir():
+                    print(Fore.RED + "Invalid destination path.")
+                elif is_watcher_online() and get_backend() is None:
+                    # The watcher owns the index shards; it applies the correction on its next poll.
+                    request_correction(move_to_correct['file_path'], new_dest)
+                    print(Fore.GREEN + "Correction queued. The watcher will move the file and update the index shortly.")
+                else:
                     handle_correction(move_to_correct['file_path'], new_dest)
                     print(Fore.GREEN + "Correction logged and file moved.")
-                else:
-                    print(Fore.RED + "Invalid destination path.")
             else:
                 print(Fore.RED + "Invalid number.")
         except (ValueError, IndexError):
             print(Fore.RED + "Invalid input.")
+        except LockHeld as e:
+            print(Fore.RED + f"The index is in use by another process; the correction was not indexed. {e}")
         time.sleep(2)
     elif choice == 'x':
         return
@@ -407,6 +427,26 @@ def reset_all_menu():
     time.sleep(2)
 
 
+def vacuum_menu():
+    """Drops dead index rows and compacts the index, or hands the job to a running watcher or index server."""
+    print_header("Vacuum & Compact Index")
+    print("Removes entries for deleted or duplicated files, re-embeds changed ones, moves misplaced ones "
+          "and rewrites each shard compactly.")
+    if safe_input("Proceed? (y/n): ").lower() != 'y':
+        print(Fore.YELLOW + "Operation cancelled.")
+        time.sleep(2)
+        return
+    if is_watcher_online() or get_backend() is not None:
+        # The watcher (or index server) holds the shards open; it runs the job on its next poll.
+        request_vacuum()
+        print(Fore.GREEN + "Vacuum requested. The watcher will run it shortly; see its log for the report.")
+    else:
+        verify = safe_input("Also re-hash files indexed before size/mtime were recorded? (slow) (y/n): ").lower() == 'y'
+        print_report(vacuum(verify_hashes=verify))
+        print(Fore.GREEN + "\nVacuum complete.")
+    safe_input("\nPress Enter to continue...")
+
+
 # ─── Main Application Loop ──────────────────────────────────────────────────
 
 def main_menu():
@@ -418,7 +458,8 @@ def main_menu():
         print("  2. Manage Watcher")
         print("  3. View & Correct Moves")
         print("  4. Learn from Corrections")
-        print("  5. Reset System")
+        print("  5. Vacuum & Compact Index")
+        print("  6. Reset System")
         print("  x. Exit")
         print("-" * 40)
         choice = safe_input("Select: ").lower()
@@ -427,7 +468,8 @@ def main_menu():
         elif choice == '2': manage_watcher_menu()
         elif choice == '3': view_moves_menu()
         elif choice == '4': learn_menu()
-        elif choice == '5': reset_all_menu()
+        elif choice == '5': vacuum_menu()
+        elif choice == '6': reset_all_menu()
         elif choice == 'x':
             if is_watcher_online():
                 print("Stopping watcher...")
@@ -1,6 +1,6 @@
 import os
-import pypdf
 import docx
+from src.core.utils.extractor import extract
 
 def extract_text(file_path):
     """
@@ -20,14 +20,8 @@ def extract_text(file_path):
                     text = f.read()
         
         elif ext == '.pdf':
-            with open(file_path, 'rb') as f:
-                reader = pypdf.PdfReader(f)
-                pages = []
-                for page in reader.pages:
-                    content = page.extract_text()
-                    if content:
-                        pages.append(content)
-                text = "\n".join(pages)
+            # Fastest installed PDF extractor first (PyMuPDF), falling back to pdfplumber / pypdf
+            text = extract(file_path, "pdf").text
             
         elif ext == '.docx':
             doc = docx.Document(file_path)